@@ -0,0 +1,159 @@
+import re
+from collections.abc import Sequence
+from functools import lru_cache
+
+from .calculator import add, multiply
+
+# Максимальное число скомпилированных выражений в LRU-кэше
+CACHE_SIZE = 256
+
+_TOKEN_RE = re.compile(r"\s*(?:(\d+\.\d*|\.\d+|\d+)|([A-Za-z_]\w*)|(.))")
+
+
+class ExpressionError(ValueError):
+    """Ошибка разбора или вычисления выражения"""
+
+
+def _is_column(value):
+    """Массив значений переменной (строки и байты считаются скалярами)"""
+    return isinstance(value, Sequence) and not isinstance(value, (str, bytes))
+
+
+def _tokenize(source):
+    """Разбиение текста формулы на токены"""
+    tokens = []
+    for number, name, op in _TOKEN_RE.findall(source):
+        if number:
+            tokens.append(("num", float(number) if "." in number else int(number)))
+        elif name:
+            tokens.append(("name", name))
+        elif op.strip():
+            if op not in "+-*()":
+                raise ExpressionError(f"Недопустимый символ: {op!r}")
+            tokens.append(("op", op))
+    return tokens
+
+
+class _Parser:
+    """
+    Рекурсивный спуск по грамматике:
+        expr   := term (('+' | '-') term)*
+        term   := factor ('*' factor)*
+        factor := '-' factor | number | name | '(' expr ')'
+    Результат - Python-код из вызовов add/multiply.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.names = []
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expr(self):
+        code = self.term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            _, op = self.take()
+            right = self.term()
+            if op == "-":
+                right = f"multiply(-1, {right})"
+            code = f"add({code}, {right})"
+        return code
+
+    def term(self):
+        code = self.factor()
+        while self.peek() == ("op", "*"):
+            self.take()
+            code = f"multiply({code}, {self.factor()})"
+        return code
+
+    def factor(self):
+        kind, value = self.take()
+        if kind == "num":
+            return repr(value)
+        if kind == "name":
+            if value not in self.names:
+                self.names.append(value)
+            return f"_v_{value}"
+        if (kind, value) == ("op", "-"):
+            return f"multiply(-1, {self.factor()})"
+        if (kind, value) == ("op", "("):
+            code = self.expr()
+            if self.take() != ("op", ")"):
+                raise ExpressionError("Ожидалась закрывающая скобка")
+            return code
+        raise ExpressionError(f"Неожиданный токен: {value!r}")
+
+
+class Expression:
+    """Скомпилированное выражение, готовое к многократному вычислению"""
+
+    def __init__(self, source, variables, func):
+        self.source = source
+        self.variables = tuple(variables)
+        self._func = func
+
+    def __call__(self, **values):
+        """Вычисление для скалярных значений переменных"""
+        try:
+            return self._func(*[values[name] for name in self.variables])
+        except KeyError as e:
+            raise ExpressionError(f"Не задано значение переменной {e.args[0]!r}") from None
+
+    def evaluate_many(self, **columns):
+        """
+        Вычисление сразу для массивов значений переменных.
+
+        Каждая переменная передается последовательностью одинаковой длины
+        (list, tuple, range и т.п.); скаляры подставляются во все строки.
+        """
+        try:
+            args = [columns[name] for name in self.variables]
+        except KeyError as e:
+            raise ExpressionError(f"Не задано значение переменной {e.args[0]!r}") from None
+
+        lengths = {len(a) for a in args if _is_column(a)}
+        if len(lengths) > 1:
+            raise ExpressionError("Массивы переменных имеют разную длину")
+        if not lengths:
+            return [self._func(*args)]
+
+        size = lengths.pop()
+        args = [a if _is_column(a) else [a] * size for a in args]
+        return list(map(self._func, *args))
+
+    def __repr__(self):
+        return f"Expression({self.source!r})"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_expression(source):
+    """
+    Разбор формулы и компиляция в функцию (с кэшированием по тексту формулы)
+
+    Args:
+        source (str): Формула, например "x * (y + 2)"
+
+    Returns:
+        Expression: Скомпилированное выражение
+    """
+    parser = _Parser(_tokenize(source))
+    body = parser.expr()
+    if parser.pos != len(parser.tokens):
+        raise ExpressionError(f"Лишние символы в выражении: {source!r}")
+
+    params = ", ".join(f"_v_{name}" for name in parser.names)
+    namespace = {"add": add, "multiply": multiply}
+    exec(f"def _compiled({params}):\n    return {body}\n", namespace)
+    return Expression(source, parser.names, namespace["_compiled"])
+
+
+def evaluate(source, **values):
+    """Вычисление формулы; повторные вызовы берут выражение из кэша"""
+    return compile_expression(source)(**values)
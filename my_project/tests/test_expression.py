@@ -0,0 +1,23 @@
+import pytest
+
+from src.expression import ExpressionError, compile_expression, evaluate
+
+def test_evaluate():
+    assert evaluate("2 + 3 * 4") == 14
+    assert evaluate("(x + 1) * y - 2", x=2, y=5) == 13
+
+def test_compile_is_cached():
+    assert compile_expression("a * b") is compile_expression("a * b")
+
+def test_evaluate_many():
+    expr = compile_expression("x * y + 1")
+    assert expr.evaluate_many(x=[1, 2, 3], y=10) == [11, 21, 31]
+    assert expr.evaluate_many(x=range(1, 4), y=(10, 20, 30)) == [11, 41, 91]
+    with pytest.raises(ExpressionError):
+        expr.evaluate_many(x=range(3), y=[1, 2])
+
+def test_invalid_expression():
+    with pytest.raises(ExpressionError):
+        compile_expression("2 +")
+    with pytest.raises(ExpressionError):
+        evaluate("x + 1")
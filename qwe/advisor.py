@@ -0,0 +1,260 @@
+"""
+Советник по индексам
+
+Анализирует планы медленных запросов из slow_query_log (их сохраняет
+Database, см. _execute) и статистику pg_stat_user_tables: находит
+последовательные сканирования больших таблиц и предлагает индексы.
+Предложения выводятся готовой записью для get_migrations().
+"""
+import argparse
+import re
+
+# Таблицы меньше этого размера (строк) сканируются целиком дешевле индекса
+DEFAULT_MIN_ROWS = 10_000
+
+SCAN_NODES = ('Seq Scan', 'Parallel Seq Scan')
+SORT_NODES = ('Sort', 'Incremental Sort')
+
+_IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# Строковые литералы ('...', кавычка внутри удваивается)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_NOT_NULL_RE = re.compile(r'^\(*(?:\w+\.)?(\w+) IS NOT NULL\)*$')
+
+class IndexSuggestion:
+    """Предлагаемый индекс"""
+
+    def __init__(self, table, columns, where=None, reason=None, query=None):
+        self.table = table
+        self.columns = tuple(columns)
+        self.where = where
+        self.reason = reason
+        self.query = query
+
+    @property
+    def key(self):
+        return (self.table, self.columns, self.where)
+
+    @property
+    def name(self):
+        suffix = '_not_null' if self.where else ''
+        return f"idx_{self.table}_{'_'.join(self.columns)}{suffix}"
+
+    def to_sql(self):
+        sql = f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table}({', '.join(self.columns)})"
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql
+
+def _columns_in(expression, table_columns):
+    """Столбцы таблицы, упомянутые в выражении фильтра или ключе сортировки"""
+    found = []
+    # Значение в литерале (email = 'age') - не столбец
+    expression = _LITERAL_RE.sub("''", expression or '')
+    for token in _IDENTIFIER_RE.findall(expression):
+        if token in table_columns and token not in found:
+            found.append(token)
+    return found
+
+def analyze_plan(plan, table_rows, table_columns, min_rows=DEFAULT_MIN_ROWS, query=None):
+    """
+    Поиск последовательных сканирований больших таблиц в плане запроса
+
+    Args:
+        plan (dict): Узел плана EXPLAIN (FORMAT JSON) - значение ключа "Plan"
+        table_rows (dict): {таблица: количество строк}
+        table_columns (dict): {таблица: множество столбцов}
+        min_rows (int): Минимальный размер таблицы для предложения индекса
+        query (str, optional): Текст запроса для отчета
+
+    Returns:
+        list: Объекты IndexSuggestion
+    """
+    suggestions = []
+
+    def walk(node, sort_keys):
+        node_type = node.get('Node Type')
+        if node_type in SORT_NODES:
+            sort_keys = node.get('Sort Key', [])
+
+        relation = node.get('Relation Name')
+        if node_type in SCAN_NODES and table_rows.get(relation, 0) >= min_rows:
+            columns = table_columns.get(relation, set())
+            scan_filter = node.get('Filter')
+            rows = table_rows[relation]
+
+            if scan_filter:
+                not_null = _NOT_NULL_RE.match(scan_filter)
+                if not_null and not_null.group(1) in columns:
+                    column = not_null.group(1)
+                    suggestions.append(IndexSuggestion(
+                        relation, [column], where=f"{column} IS NOT NULL",
+                        reason=f"Seq Scan по {relation} (~{rows} строк) с фильтром {scan_filter}",
+                        query=query
+                    ))
+                else:
+                    filter_columns = _columns_in(scan_filter, columns)[:3]
+                    if filter_columns:
+                        suggestions.append(IndexSuggestion(
+                            relation, filter_columns,
+                            reason=f"Seq Scan по {relation} (~{rows} строк) с фильтром {scan_filter}",
+                            query=query
+                        ))
+
+            sort_columns = []
+            for key in sort_keys or []:
+                sort_columns.extend(c for c in _columns_in(key, columns) if c not in sort_columns)
+            if sort_columns:
+                suggestions.append(IndexSuggestion(
+                    relation, sort_columns[:3],
+                    reason=f"Seq Scan + сортировка по {', '.join(sort_keys)} в {relation} (~{rows} строк)",
+                    query=query
+                ))
+
+        for child in node.get('Plans', []):
+            walk(child, sort_keys if node_type not in SCAN_NODES else None)
+
+    walk(plan, None)
+    return suggestions
+
+def _is_covered(suggestion, existing_indexes):
+    """Есть ли уже индекс с теми же ведущими столбцами"""
+    for table, columns in existing_indexes:
+        if table == suggestion.table and columns[:len(suggestion.columns)] == list(suggestion.columns):
+            return True
+    return False
+
+def _load_catalog(db):
+    """Размеры таблиц, их столбцы и существующие индексы"""
+    table_rows = {}
+    for relname, live_tuples in db.fetch_all(
+        "SELECT relname, n_live_tup FROM pg_stat_user_tables"
+    ):
+        table_rows[relname] = live_tuples
+
+    table_columns = {}
+    for table, column in db.fetch_all(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema()"
+    ):
+        table_columns.setdefault(table, set()).add(column)
+
+    existing = []
+    for table, indexdef in db.fetch_all(
+        "SELECT tablename, indexdef FROM pg_indexes WHERE schemaname = current_schema()"
+    ):
+        match = re.search(r'\((.*?)\)', indexdef)
+        if match:
+            columns = [part.strip().split()[0].strip('"') for part in match.group(1).split(',')]
+            existing.append((table, columns))
+
+    return table_rows, table_columns, existing
+
+def advise(min_rows=DEFAULT_MIN_ROWS, days=7):
+    """
+    Анализ сохраненных планов медленных запросов
+
+    Args:
+        min_rows (int): Минимальный размер таблицы для предложения индекса
+        days (int): Глубина анализа slow_query_log в днях
+
+    Returns:
+        tuple: (список IndexSuggestion, список (таблица, строк, seq_scan, idx_scan))
+            или None при ошибке подключения
+    """
+    from database import Database
+
+    db = Database()
+    if not db.connect():
+        return None
+
+    try:
+        table_rows, table_columns, existing = _load_catalog(db)
+        plans = db.fetch_all(
+            """
+            SELECT query, plan FROM slow_query_log
+            WHERE captured_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            ORDER BY duration_ms DESC
+            """,
+            (days,)
+        )
+
+        # Таблицы, которые чаще читаются полным сканированием, чем по индексу
+        hot_tables = [
+            row for row in db.fetch_all(
+                """
+                SELECT relname, n_live_tup, seq_scan, COALESCE(idx_scan, 0)
+                FROM pg_stat_user_tables
+                WHERE n_live_tup >= %s AND seq_scan > COALESCE(idx_scan, 0)
+                ORDER BY seq_tup_read DESC
+                """,
+                (min_rows,)
+            )
+        ]
+    finally:
+        db.disconnect()
+
+    suggestions = {}
+    for query, plan in plans:
+        for entry in plan or []:
+            for suggestion in analyze_plan(entry['Plan'], table_rows, table_columns, min_rows, query):
+                if suggestion.key not in suggestions and not _is_covered(suggestion, existing):
+                    suggestions[suggestion.key] = suggestion
+
+    return list(suggestions.values()), hot_tables
+
+def migration_entry(suggestions):
+    """
+    Запись для get_migrations() с предложенными индексами
+
+    Returns:
+        str: Фрагмент кода для вставки в словарь migrations
+    """
+    from migrations import get_migrations
+
+    numbers = [int(name.split('_', 1)[0]) for name in get_migrations() if name[:3].isdigit()]
+    name = f"{max(numbers, default=0) + 1:03d}_add_advisor_indexes"
+    lines = [f"        '{name}': ["]
+    statements = [f'            "{s.to_sql()}"' for s in suggestions]
+    lines.append(",\n".join(statements))
+    lines.append("        ]")
+    return "\n".join(lines)
+
+def print_report(min_rows=DEFAULT_MIN_ROWS, days=7):
+    """Вывод отчета советника по индексам"""
+    result = advise(min_rows, days)
+    if result is None:
+        return
+
+    suggestions, hot_tables = result
+
+    print("📊 Таблицы с преобладанием последовательных сканирований:")
+    print("-" * 50)
+    if not hot_tables:
+        print("   Нет")
+    for table, rows, seq_scan, idx_scan in hot_tables:
+        print(f"   {table}: ~{rows} строк, seq_scan={seq_scan}, idx_scan={idx_scan}")
+
+    print("\n💡 Предлагаемые индексы:")
+    print("-" * 50)
+    if not suggestions:
+        print("   Нет предложений")
+        return
+    for i, suggestion in enumerate(suggestions, 1):
+        print(f"{i}. {suggestion.to_sql()}")
+        print(f"   Причина: {suggestion.reason}")
+        if suggestion.query:
+            print(f"   Запрос: {' '.join(suggestion.query.split())[:120]}")
+
+    print("\n📝 Миграция для get_migrations() в migrations.py:")
+    print(migration_entry(suggestions))
+
+def main():
+    parser = argparse.ArgumentParser(description="Советник по индексам на основе планов медленных запросов")
+    parser.add_argument('--min-rows', type=int, default=DEFAULT_MIN_ROWS,
+                        help=f"минимальный размер таблицы (по умолчанию {DEFAULT_MIN_ROWS})")
+    parser.add_argument('--days', type=int, default=7, help="глубина анализа в днях")
+    args = parser.parse_args()
+    print_report(args.min_rows, args.days)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+"""
+HTTP JSON сервис для работы с пользователями (asyncio, без зависимостей)
+
+    GET    /users?status=active&age__gte=18&after=0&limit=100
+    GET    /users/{id}
+    POST   /users            {"name": ..., "email": ..., "age": ...}
+    PATCH  /users/{id}       {"name": ..., "email": ..., "age": ...}
+    DELETE /users/{id}
+    GET    /metrics
+    GET    /health
+
+Список выдается постранично по ключу id (after - последний полученный ID,
+в ответе next_after) и передается потоком (chunked): страницы читаются из
+базы по PAGE_SIZE строк и отправляются клиенту по мере чтения. Параметры
+кроме after/limit - условия User.filter (поле или поле__оператор).
+
+Модели синхронные, поэтому запросы к базе выполняются в пуле потоков
+поверх пула подключений (Database.enable_pool). Количество одновременно
+обрабатываемых запросов ограничено; запрос, не дождавшийся очереди за
+queue_timeout секунд, получает 503.
+
+Недоступная база - 503, превышение бюджета запроса - 504, прочие ошибки
+базы и сервиса - 500. Первая страница списка читается до отправки
+заголовков, поэтому такие ошибки получают обычный ответ; ошибка на
+следующих страницах обрывает соединение без завершающего блока chunked,
+и клиент видит неполный ответ, а не короткий список.
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+import psycopg2
+
+from database import Database, QueryTimeoutError, get_timeout_stats
+from loadtest import percentile
+from models import User
+
+# Строк в одной странице чтения списка
+PAGE_SIZE = 500
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 10_000
+
+MAX_BODY_SIZE = 64 * 1024
+
+# Размеры столбцов users (VARCHAR(100))
+MAX_NAME_LENGTH = 100
+MAX_EMAIL_LENGTH = 100
+
+# Количество последних замеров задержки для перцентилей по каждому маршруту
+LATENCY_WINDOW = 10_000
+
+STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+    500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+
+# Поля условий, значения которых приводятся к целым числам
+INTEGER_FIELDS = ('id', 'age')
+
+class HttpError(Exception):
+    """Ошибка запроса с HTTP-статусом"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class StreamAborted(ConnectionError):
+    """Потоковый ответ прерван после отправки заголовков (соединение закрыто)"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def user_to_dict(user):
+    return {
+        'id': user.id,
+        'name': user.name,
+        'email': user.email,
+        'age': user.age,
+        'created_at': user.created_at.isoformat() if user.created_at else None,
+    }
+
+def _validate_fields(data, required):
+    """Проверка полей пользователя из тела запроса по правилам консольного интерфейса"""
+    if not isinstance(data, dict):
+        raise HttpError(400, "Ожидается JSON-объект")
+    fields = {}
+    for name in ('name', 'email'):
+        if name in data:
+            value = str(data[name] or '').strip()
+            if not value:
+                raise HttpError(400, "Имя и email обязательны для заполнения")
+            fields[name] = value
+        elif required:
+            raise HttpError(400, "Имя и email обязательны для заполнения")
+    if len(fields.get('name', '')) > MAX_NAME_LENGTH:
+        raise HttpError(400, f"Имя не должно быть длиннее {MAX_NAME_LENGTH} символов")
+    if len(fields.get('email', '')) > MAX_EMAIL_LENGTH:
+        raise HttpError(400, f"Email не должен быть длиннее {MAX_EMAIL_LENGTH} символов")
+    if data.get('age') is not None:
+        try:
+            age = int(data['age'])
+        except (TypeError, ValueError):
+            raise HttpError(400, "Возраст должен быть числом")
+        if age < 1 or age > 150:
+            raise HttpError(400, "Возраст должен быть от 1 до 150 лет")
+        fields['age'] = age
+    elif 'age' in data:
+        fields['age'] = None
+    return fields
+
+def parse_conditions(params):
+    """
+    Условия User.filter из параметров строки запроса
+
+    Returns:
+        dict: {поле__оператор: значение}
+    """
+    conditions = {}
+    for key, value in params.items():
+        field, _, lookup = key.partition('__')
+        if lookup == 'in':
+            values = [v for v in value.split(',') if v]
+            conditions[key] = [int(v) for v in values] if field in INTEGER_FIELDS else values
+        elif lookup == 'isnull':
+            conditions[key] = value.lower() in ('1', 'true', 'yes')
+        elif field in INTEGER_FIELDS:
+            conditions[key] = int(value)
+        else:
+            conditions[key] = value
+    return conditions
+
+class RouteMetrics:
+    """Количество запросов, ошибок и задержки одного маршрута"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.statuses = Counter()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, status, latency):
+        self.count += 1
+        self.statuses[status] += 1
+        if status >= 500:
+            self.errors += 1
+        self.latencies.append(latency)
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+
+class UserService:
+    """HTTP сервис поверх моделей User"""
+
+    def __init__(self, pool_size=10, max_concurrency=64, queue_timeout=1.0):
+        """
+        Args:
+            pool_size (int): Подключений к базе (и потоков для запросов к ней)
+            max_concurrency (int): Запросов, обрабатываемых одновременно
+            queue_timeout (float): Максимальное ожидание очереди в секундах
+        """
+        Database.enable_pool(pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='db')
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self.started = time.time()
+        self.metrics = {}
+        self.routes = [
+            ('GET', re.compile(r'^/users$'), 'list', self.list_users),
+            ('POST', re.compile(r'^/users$'), 'create', self.create_user),
+            ('GET', re.compile(r'^/users/(\d+)$'), 'get', self.get_user),
+            ('PATCH', re.compile(r'^/users/(\d+)$'), 'update', self.update_user),
+            ('DELETE', re.compile(r'^/users/(\d+)$'), 'delete', self.delete_user),
+            ('GET', re.compile(r'^/metrics$'), 'metrics', self.get_metrics),
+            ('GET', re.compile(r'^/health$'), 'health', self.get_health),
+        ]
+
+    async def db(self, func, *args):
+        """
+        Выполнение синхронного вызова моделей в пуле потоков
+
+        Raises:
+            HttpError: 503 - база недоступна, 500 - ошибка запроса
+            QueryTimeoutError: Превышен бюджет задержки (504)
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        except (ConnectionError, psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            raise HttpError(503, "База данных недоступна") from e
+        except psycopg2.Error as e:
+            raise HttpError(500, "Ошибка базы данных") from e
+
+    async def find_user(self, user_id):
+        """Пользователь по ID; ошибка базы не выдается за отсутствие пользователя"""
+        users, _ = await self.db(User.get_many, [int(user_id)])
+        if not users:
+            raise HttpError(404, f"Пользователь с ID {user_id} не найден")
+        return users[0]
+
+    async def check_email(self, email, user_id=None):
+        """409, если email занят другим пользователем"""
+        users, _ = await self.db(User.get_many_by_email, [email])
+        if users and users[0].id != user_id:
+            raise HttpError(409, f"Пользователь с email '{email}' уже существует")
+
+    async def save(self, user, message):
+        """Сохранение: занятый email - 409, иначе 500"""
+        if not await self.db(user.save):
+            # Email мог занять параллельный запрос после проверки
+            await self.check_email(user.email, user.id)
+            raise HttpError(500, message)
+
+    # --- Обработчики: возвращают (статус, тело) или None, если ответ уже записан ---
+
+    async def list_users(self, request, writer):
+        params = dict(request['params'])
+        try:
+            after = int(params.pop('after', 0))
+            limit = int(params.pop('limit', DEFAULT_LIMIT))
+            query = User.filter(**parse_conditions(params)).order_by('id')
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        if not 1 <= limit <= MAX_LIMIT:
+            raise HttpError(400, f"limit должен быть от 1 до {MAX_LIMIT}")
+
+        def fetch_page(last_id, size):
+            return query.filter(id__gt=last_id).limit(size).all(raise_errors=True)
+
+        # Первая страница - до заголовков: ошибка базы получает обычный ответ
+        size = min(PAGE_SIZE, limit)
+        page = await self.db(fetch_page, after, size)
+        await self.start_stream(writer, 200)
+        await self.write_chunk(writer, b'{"users": [')
+        sent, last_id, exhausted = 0, after, False
+        while True:
+            if page:
+                prefix = ', ' if sent else ''
+                data = prefix + ', '.join(json.dumps(user_to_dict(u), ensure_ascii=False) for u in page)
+                await self.write_chunk(writer, data.encode('utf-8'))
+                sent += len(page)
+                last_id = page[-1].id
+            if len(page) < size:
+                exhausted = True
+                break
+            if sent >= limit:
+                break
+            size = min(PAGE_SIZE, limit - sent)
+            try:
+                page = await self.db(fetch_page, last_id, size)
+            except (HttpError, QueryTimeoutError) as e:
+                # Заголовки уже отправлены: обрыв соединения без завершающего
+                # блока сообщает клиенту, что ответ неполный
+                writer.close()
+                status = e.status if isinstance(e, HttpError) else 504
+                raise StreamAborted(status, f"Поток прерван: {e}") from e
+        tail = {'next_after': None if exhausted else last_id, 'count': sent}
+        await self.write_chunk(writer, ('], ' + json.dumps(tail)[1:]).encode('utf-8'))
+        await self.end_stream(writer)
+        return None
+
+    async def get_user(self, request, writer, user_id):
+        user = await self.find_user(user_id)
+        return 200, user_to_dict(user)
+
+    async def create_user(self, request, writer):
+        fields = _validate_fields(request['json'], required=True)
+        await self.check_email(fields['email'])
+        user = User(name=fields['name'], email=fields['email'], age=fields.get('age'))
+        await self.save(user, "Не удалось создать пользователя")
+        return 201, user_to_dict(user)
+
+    async def update_user(self, request, writer, user_id):
+        fields = _validate_fields(request['json'], required=False)
+        user = await self.find_user(user_id)
+        if fields.get('email', user.email) != user.email:
+            await self.check_email(fields['email'], user.id)
+        for name, value in fields.items():
+            setattr(user, name, value)
+        await self.save(user, "Не удалось сохранить пользователя")
+        return 200, user_to_dict(user)
+
+    async def delete_user(self, request, writer, user_id):
+        user = await self.find_user(user_id)
+        if not await self.db(user.delete):
+            raise HttpError(500, "Ошибка удаления пользователя")
+        return 204, None
+
+    async def get_metrics(self, request, writer):
+        return 200, {
+            'uptime_s': round(time.time() - self.started, 1),
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+            'routes': {name: metrics.to_dict() for name, metrics in sorted(self.metrics.items())},
+            'db_timeouts': get_timeout_stats(),
+        }
+
+    async def get_health(self, request, writer):
+        return 200, {'status': 'ok'}
+
+    # --- HTTP ---
+
+    async def send(self, writer, status, payload=None):
+        body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        if status != 204:
+            headers += ["Content-Type: application/json; charset=utf-8", f"Content-Length: {len(body)}"]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def start_stream(self, writer, status):
+        writer.write((f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                      "Content-Type: application/json; charset=utf-8\r\n"
+                      "Transfer-Encoding: chunked\r\n\r\n").encode('latin-1'))
+
+    async def write_chunk(self, writer, data):
+        writer.write(f"{len(data):x}\r\n".encode('latin-1') + data + b"\r\n")
+        # Ожидание отправки: медленный клиент не накапливает страницы в памяти
+        await writer.drain()
+
+    async def end_stream(self, writer):
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def read_request(self, reader):
+        """
+        Чтение одного HTTP-запроса
+
+        Returns:
+            dict: method, path, params, headers, json или None при закрытии соединения
+        """
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, version = line.decode('latin-1').split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, "Слишком большое тело запроса")
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            raise HttpError(400, "Некорректный JSON")
+        return {
+            'method': method.upper(),
+            'path': url.path,
+            'params': parse_qsl(url.query),
+            'headers': headers,
+            'json': data,
+            'keep_alive': version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close',
+        }
+
+    async def dispatch(self, request, writer):
+        """Выбор обработчика, ограничение параллелизма и учет метрик"""
+        started = time.perf_counter()
+        route_name, handler, args = None, None, ()
+        allowed = False
+        for method, pattern, name, func in self.routes:
+            match = pattern.match(request['path'])
+            if match:
+                allowed = True
+                if method == request['method']:
+                    route_name, handler, args = name, func, match.groups()
+                    break
+
+        status = 500
+        try:
+            if handler is None:
+                raise HttpError(405 if allowed else 404, "Метод не поддерживается" if allowed else "Не найдено")
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise HttpError(503, "Сервис перегружен, повторите запрос позже")
+            self.in_flight += 1
+            try:
+                result = await handler(request, writer, *args)
+            finally:
+                self.in_flight -= 1
+                self.slots.release()
+            if result is None:
+                status = 200
+            else:
+                status, payload = result
+                await self.send(writer, status, payload)
+        except HttpError as e:
+            status = e.status
+            await self.send(writer, status, {'error': str(e)})
+        except QueryTimeoutError as e:
+            status = 504
+            await self.send(writer, status, {'error': str(e)})
+        except StreamAborted as e:
+            status = e.status
+            raise
+        except ConnectionError:
+            # Клиент закрыл соединение - отвечать некому
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка обработки {request['method']} {request['path']}: {e!r}")
+            status = 500
+            await self.send(writer, status, {'error': "Внутренняя ошибка сервера"})
+        finally:
+            self.metrics.setdefault(route_name or 'unknown', RouteMetrics()).record(
+                status, time.perf_counter() - started
+            )
+
+    async def handle_connection(self, reader, writer):
+        """Обработка соединения (keep-alive: несколько запросов подряд)"""
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as e:
+                    await self.send(writer, e.status, {'error': str(e)})
+                    break
+                if request is None:
+                    break
+                await self.dispatch(request, writer)
+                if not request['keep_alive']:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host='127.0.0.1', port=8080, pool_size=10, max_concurrency=64, queue_timeout=1.0):
+    """Запуск сервиса до остановки процесса"""
+    service = UserService(pool_size, max_concurrency, queue_timeout)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"🚀 Сервис пользователей: http://{host}:{port}/users "
+          f"(подключений: {pool_size}, параллельных запросов: {max_concurrency})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.executor.shutdown(wait=False)
+        Database.disable_pool()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP JSON сервис пользователей")
+    parser.add_argument('--host', default='127.0.0.1', help="адрес (по умолчанию 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8080, help="порт (по умолчанию 8080)")
+    parser.add_argument('--pool-size', type=int, default=10, help="подключений к базе")
+    parser.add_argument('--max-concurrency', type=int, default=64, help="одновременных запросов")
+    parser.add_argument('--queue-timeout', type=float, default=1.0,
+                        help="ожидание очереди, с (дольше - ответ 503)")
+    args = parser.parse_args()
+    Database.verbose = False
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.pool_size, args.max_concurrency, args.queue_timeout))
+    except KeyboardInterrupt:
+        print("\n👋 Сервис остановлен")
+
+if __name__ == "__main__":
+    main()
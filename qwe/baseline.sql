@@ -0,0 +1,240 @@
+-- Базовая схема: таблица users и миграции, объединенные командой
+-- python migrations.py squash. Не редактируйте вручную.
+-- migration: 001_add_phone_column befc6f7898dc
+-- migration: 002_add_status_column 786ac7f46826
+-- migration: 003_create_user_profiles_table 7749b9d4ae08
+-- migration: 004_add_user_profile_data 60945c68aa8d
+-- migration: 005_create_audit_log_table a1f629e7ef11
+-- migration: 006_create_change_notify_triggers c4da83f36ada
+-- migration: 007_add_updated_at_and_tombstones a6a6f2e410bc
+-- migration: 008_create_slow_query_log_table a889045b9848
+-- migration: 009_create_shard_directory 6c5c5c2f6bb5
+-- migration: 010_create_jobs_table 6d823b7bcbc7
+-- migration: 011_skip_noop_change_notify 77c740a5bc96
+
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    age INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS migrations (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL UNIQUE,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+-- 001_add_phone_column
+ALTER TABLE users ADD COLUMN IF NOT EXISTS phone VARCHAR(20);
+COMMENT ON COLUMN users.phone IS 'Номер телефона пользователя';
+-- 002_add_status_column
+ALTER TABLE users ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'active';
+COMMENT ON COLUMN users.status IS 'Статус пользователя: active/inactive';
+ALTER TABLE users ADD CONSTRAINT check_status CHECK (status IN ('active', 'inactive'));
+-- 003_create_user_profiles_table
+CREATE TABLE IF NOT EXISTS user_profiles (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    address TEXT,
+    city VARCHAR(100),
+    country VARCHAR(100),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_user_profiles_user_id ON user_profiles(user_id);
+-- 004_add_user_profile_data
+-- 005_create_audit_log_table
+CREATE TABLE IF NOT EXISTS audit_log (
+    id SERIAL PRIMARY KEY,
+    table_name VARCHAR(100) NOT NULL,
+    record_id INTEGER NOT NULL,
+    action VARCHAR(10) NOT NULL,
+    old_data JSONB,
+    new_data JSONB,
+    changed_by VARCHAR(100),
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_audit_log_table_record ON audit_log(table_name, record_id);
+CREATE INDEX IF NOT EXISTS idx_audit_log_changed_at ON audit_log(changed_at);
+-- 006_create_change_notify_triggers
+CREATE OR REPLACE FUNCTION notify_user_change() RETURNS trigger AS $$
+DECLARE
+    payload JSONB;
+    changed TEXT[];
+    row_data JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+
+    IF TG_OP = 'UPDATE' THEN
+        -- Только реально изменившиеся поля; пустое обновление не публикуется
+        SELECT array_agg(n.key ORDER BY n.key) INTO changed
+        FROM jsonb_each(row_data) n
+        WHERE n.value IS DISTINCT FROM to_jsonb(OLD) -> n.key;
+        IF changed IS NULL THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+
+    payload := jsonb_build_object(
+        'table', TG_TABLE_NAME,
+        'op', lower(TG_OP),
+        'id', row_data -> 'id'
+    );
+    IF changed IS NOT NULL THEN
+        payload := payload || jsonb_build_object('changed', to_jsonb(changed));
+    END IF;
+    IF row_data ? 'user_id' THEN
+        payload := payload || jsonb_build_object('user_id', row_data -> 'user_id');
+    END IF;
+
+    PERFORM pg_notify('user_changes', payload::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS users_notify_change ON users;
+CREATE TRIGGER users_notify_change
+AFTER INSERT OR UPDATE OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION notify_user_change();
+DROP TRIGGER IF EXISTS user_profiles_notify_change ON user_profiles;
+CREATE TRIGGER user_profiles_notify_change
+AFTER INSERT OR UPDATE OR DELETE ON user_profiles
+FOR EACH ROW EXECUTE FUNCTION notify_user_change();
+-- 007_add_updated_at_and_tombstones
+ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+COMMENT ON COLUMN users.updated_at IS 'Время последнего изменения (поддерживается триггером)';
+CREATE OR REPLACE FUNCTION set_users_updated_at() RETURNS trigger AS $$
+BEGIN
+    -- now() - время начала транзакции: инкрементальный экспорт
+    -- опирается на то, что незакоммиченные строки не старше
+    -- начала самой старой пишущей транзакции
+    IF NEW IS DISTINCT FROM OLD THEN
+        NEW.updated_at := now();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS users_set_updated_at ON users;
+CREATE TRIGGER users_set_updated_at
+BEFORE UPDATE ON users
+FOR EACH ROW EXECUTE FUNCTION set_users_updated_at();
+CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users(updated_at, id);
+CREATE TABLE IF NOT EXISTS users_tombstones (
+    user_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_users_tombstones_deleted_at ON users_tombstones(deleted_at, user_id);
+CREATE OR REPLACE FUNCTION record_user_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO users_tombstones (user_id, deleted_at) VALUES (OLD.id, now())
+    ON CONFLICT (user_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS users_record_tombstone ON users;
+CREATE TRIGGER users_record_tombstone
+AFTER DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION record_user_tombstone();
+CREATE TABLE IF NOT EXISTS export_watermarks (
+    consumer VARCHAR(100) PRIMARY KEY,
+    updated_at TIMESTAMP,
+    last_id INTEGER,
+    deleted_at TIMESTAMP,
+    deleted_id INTEGER,
+    saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+-- 008_create_slow_query_log_table
+CREATE TABLE IF NOT EXISTS slow_query_log (
+    id SERIAL PRIMARY KEY,
+    query TEXT NOT NULL,
+    duration_ms NUMERIC(12, 2),
+    operation VARCHAR(100),
+    plan JSONB,
+    captured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_slow_query_log_captured_at ON slow_query_log(captured_at);
+-- 009_create_shard_directory
+DO $$
+BEGIN
+    CREATE SEQUENCE IF NOT EXISTS global_user_id_seq;
+    -- Глобальные ID начинаются после уже существующих локальных
+    -- (в отдельной базе справочника таблицы users нет)
+    IF to_regclass('users') IS NOT NULL THEN
+        PERFORM setval('global_user_id_seq',
+                       (SELECT COALESCE(MAX(id), 0) + 1 FROM users), false);
+    END IF;
+END;
+$$;
+CREATE TABLE IF NOT EXISTS user_email_index (
+    email VARCHAR(100) PRIMARY KEY,
+    user_id INTEGER NOT NULL UNIQUE
+);
+-- 010_create_jobs_table
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMP NOT NULL DEFAULT now(),
+    locked_by VARCHAR(100),
+    locked_until TIMESTAMP,
+    progress JSONB,
+    result JSONB,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+COMMENT ON TABLE jobs IS 'Очередь фоновых задач (см. jobs.py)';
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs(run_after, id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs(locked_until) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at) WHERE finished_at IS NOT NULL;
+-- 011_skip_noop_change_notify
+CREATE OR REPLACE FUNCTION notify_user_change() RETURNS trigger AS $$
+DECLARE
+    payload JSONB;
+    changed TEXT[];
+    row_data JSONB;
+    old_data JSONB;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_data := to_jsonb(OLD);
+    ELSE
+        row_data := to_jsonb(NEW);
+    END IF;
+
+    IF TG_OP = 'UPDATE' THEN
+        -- Только реально изменившиеся поля без служебного updated_at;
+        -- пустое обновление не публикуется
+        old_data := to_jsonb(OLD);
+        SELECT array_agg(n.key ORDER BY n.key) INTO changed
+        FROM jsonb_each(row_data) n
+        WHERE n.key <> 'updated_at' AND n.value IS DISTINCT FROM old_data -> n.key;
+        IF changed IS NULL THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+
+    payload := jsonb_build_object(
+        'table', TG_TABLE_NAME,
+        'op', lower(TG_OP),
+        'id', row_data -> 'id'
+    );
+    IF changed IS NOT NULL THEN
+        payload := payload || jsonb_build_object('changed', to_jsonb(changed));
+    END IF;
+    IF row_data ? 'user_id' THEN
+        payload := payload || jsonb_build_object('user_id', row_data -> 'user_id');
+    END IF;
+
+    PERFORM pg_notify('user_changes', payload::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+INSERT INTO migrations (name) VALUES ('001_add_phone_column'), ('002_add_status_column'), ('003_create_user_profiles_table'), ('004_add_user_profile_data'), ('005_create_audit_log_table'), ('006_create_change_notify_triggers'), ('007_add_updated_at_and_tombstones'), ('008_create_slow_query_log_table'), ('009_create_shard_directory'), ('010_create_jobs_table'), ('011_skip_noop_change_notify') ON CONFLICT (name) DO NOTHING;
@@ -0,0 +1,317 @@
+"""
+Пакетный (неинтерактивный) режим работы с пользователями
+
+Операции читаются из файла или stdin в формате NDJSON - по одной на строку:
+    {"op": "add", "name": "Иван", "email": "ivan@example.com", "age": 25, "phone": "+7 900 000-00-00"}
+    {"op": "find", "id": 1}
+    {"op": "find", "email": "ivan@example.com"}
+    {"op": "update", "id": 1, "age": 26, "status": "inactive"}
+    {"op": "delete", "id": 1}
+    {"op": "stats"}
+
+Все операции выполняются через одно подключение. Подряд идущие однотипные
+операции add/find/delete объединяются в один SQL-запрос (один сетевой
+обмен на группу вместо одного на операцию). Результаты выводятся в stdout
+в формате NDJSON в порядке входных строк.
+"""
+import json
+import sys
+from contextlib import redirect_stdout
+
+from psycopg2.extras import execute_values
+
+from database import Database
+from sharding import unsupported_with_shards
+
+# Максимальный размер группы операций, объединяемых в один запрос
+MAX_GROUP_SIZE = 500
+
+# Поля, которые можно изменить операцией update
+UPDATABLE_FIELDS = ('name', 'email', 'age', 'phone', 'status')
+
+USER_COLUMNS = "id, name, email, age, created_at"
+
+# Размеры строковых столбцов users
+MAX_LENGTHS = {'name': 100, 'email': 100, 'phone': 20}
+
+class BatchError(Exception):
+    """Ошибка валидации отдельной операции"""
+
+def _user_dict(row):
+    """Преобразование строки users в словарь для вывода"""
+    return {
+        'id': row[0],
+        'name': row[1],
+        'email': row[2],
+        'age': row[3],
+        'created_at': row[4].isoformat() if row[4] else None,
+    }
+
+def _validate_age(age):
+    """Проверка возраста по тем же правилам, что и в интерактивном режиме"""
+    if age is None:
+        return None
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        raise BatchError("Возраст должен быть числом")
+    if age < 1 or age > 150:
+        raise BatchError("Возраст должен быть от 1 до 150 лет")
+    return age
+
+def _validate_lengths(fields):
+    """Проверка длины строковых полей по размерам столбцов"""
+    for name, limit in MAX_LENGTHS.items():
+        value = fields.get(name)
+        if value is not None and len(str(value)) > limit:
+            raise BatchError(f"Поле {name} не должно быть длиннее {limit} символов")
+
+def _validate_id(value):
+    try:
+        user_id = int(value)
+    except (TypeError, ValueError):
+        raise BatchError("ID должен быть числом")
+    if user_id <= 0:
+        raise BatchError("ID должен быть положительным числом")
+    return user_id
+
+def run_find(cursor, ops):
+    """Поиск группы пользователей по ID и email одним запросом"""
+    results = {}
+    ids, emails = [], []
+    for index, op in ops:
+        try:
+            if 'id' in op:
+                ids.append(_validate_id(op['id']))
+            elif op.get('email'):
+                emails.append(op['email'])
+            else:
+                raise BatchError("Нужно указать id или email")
+        except BatchError as e:
+            results[index] = {'ok': False, 'error': str(e)}
+
+    cursor.execute(
+        f"SELECT {USER_COLUMNS} FROM users WHERE id = ANY(%s) OR email = ANY(%s)",
+        (ids, emails)
+    )
+    by_id, by_email = {}, {}
+    for row in cursor.fetchall():
+        by_id[row[0]] = by_email[row[2]] = _user_dict(row)
+
+    for index, op in ops:
+        if index in results:
+            continue
+        user = by_id.get(int(op['id'])) if 'id' in op else by_email.get(op['email'])
+        if user:
+            results[index] = {'ok': True, 'user': user}
+        else:
+            results[index] = {'ok': False, 'error': "Пользователь не найден"}
+    return results
+
+def run_add(cursor, ops):
+    """Добавление группы пользователей одним многострочным INSERT"""
+    results = {}
+    rows = []
+    for index, op in ops:
+        try:
+            name = (op.get('name') or '').strip()
+            email = (op.get('email') or '').strip()
+            phone = str(op.get('phone') or '').strip() or None
+            if not name or not email:
+                raise BatchError("Имя и email обязательны для заполнения")
+            _validate_lengths({'name': name, 'email': email, 'phone': phone})
+            rows.append((index, name, email, _validate_age(op.get('age')), phone))
+        except BatchError as e:
+            results[index] = {'ok': False, 'error': str(e)}
+
+    def insert(group):
+        # Уникальность email проверяет сама база: конфликтующие строки не
+        # вставляются и не возвращаются в RETURNING
+        returned = execute_values(
+            cursor,
+            f"INSERT INTO users (name, email, age, phone) VALUES %s "
+            f"ON CONFLICT (email) DO NOTHING RETURNING {USER_COLUMNS}",
+            [row[1:] for row in group],
+            page_size=len(group),
+            fetch=True
+        )
+        return {row[2]: _user_dict(row) for row in returned}
+
+    created, failed = {}, {}
+    if rows:
+        cursor.execute("SAVEPOINT batch_add")
+        try:
+            created = insert(rows)
+            cursor.execute("RELEASE SAVEPOINT batch_add")
+        except Exception:
+            # Одна ошибочная строка не должна отменять остальные:
+            # повторяем группу построчно
+            cursor.execute("ROLLBACK TO SAVEPOINT batch_add")
+            for row in rows:
+                cursor.execute("SAVEPOINT batch_add")
+                try:
+                    created.update(insert([row]))
+                    cursor.execute("RELEASE SAVEPOINT batch_add")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT batch_add")
+                    failed[row[0]] = f"Ошибка базы данных: {str(e).strip()}"
+
+    for index, name, email, age, phone in rows:
+        if index in failed:
+            results[index] = {'ok': False, 'error': failed[index]}
+            continue
+        user = created.pop(email, None)
+        if user:
+            results[index] = {'ok': True, 'user': user}
+        else:
+            results[index] = {'ok': False, 'error': f"Пользователь с email '{email}' уже существует"}
+    return results
+
+def run_delete(cursor, ops):
+    """Удаление группы пользователей одним запросом"""
+    results = {}
+    ids = {}
+    for index, op in ops:
+        try:
+            ids[index] = _validate_id(op.get('id'))
+        except BatchError as e:
+            results[index] = {'ok': False, 'error': str(e)}
+
+    cursor.execute("DELETE FROM users WHERE id = ANY(%s) RETURNING id", (list(ids.values()),))
+    deleted = {row[0] for row in cursor.fetchall()}
+
+    for index, user_id in ids.items():
+        if user_id in deleted:
+            results[index] = {'ok': True, 'id': user_id}
+            deleted.discard(user_id)
+        else:
+            results[index] = {'ok': False, 'error': f"Пользователь с ID {user_id} не найден"}
+    return results
+
+def run_update(cursor, ops):
+    """Обновление пользователя (каждая операция - свой набор полей)"""
+    index, op = ops[0]
+    user_id = _validate_id(op.get('id'))
+    fields = {name: op[name] for name in UPDATABLE_FIELDS if name in op}
+    if not fields:
+        raise BatchError("Не указаны поля для обновления")
+    if 'age' in fields:
+        fields['age'] = _validate_age(fields['age'])
+    _validate_lengths(fields)
+    if 'status' in fields and fields['status'] not in ('active', 'inactive'):
+        raise BatchError("Неверный статус. Используйте 'active' или 'inactive'")
+
+    assignments = ", ".join(f"{name} = %s" for name in fields)
+    cursor.execute(
+        f"UPDATE users SET {assignments} WHERE id = %s RETURNING {USER_COLUMNS}",
+        (*fields.values(), user_id)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return {index: {'ok': False, 'error': f"Пользователь с ID {user_id} не найден"}}
+    return {index: {'ok': True, 'user': _user_dict(row)}}
+
+def run_stats(cursor, ops):
+    """Статистика по пользователям одним запросом"""
+    cursor.execute("SELECT COUNT(*), COUNT(age), AVG(age) FROM users")
+    total, with_age, avg_age = cursor.fetchone()
+    stats = {
+        'total_users': total,
+        'users_with_age': with_age,
+        'avg_age': float(avg_age) if avg_age is not None else None,
+    }
+    return {index: {'ok': True, 'stats': stats} for index, _ in ops}
+
+# Обработчики операций; True - операции можно объединять в группы
+HANDLERS = {
+    'find': (run_find, True),
+    'add': (run_add, True),
+    'delete': (run_delete, True),
+    'update': (run_update, False),
+    'stats': (run_stats, True),
+}
+
+def _groups(lines):
+    """
+    Разбиение входного потока на группы подряд идущих однотипных операций
+
+    Yields:
+        tuple: (название операции или None для ошибок разбора, [(номер строки, операция)])
+    """
+    group_op, group = None, []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            op = json.loads(line)
+            name = op.get('op') if isinstance(op, dict) else None
+            if name not in HANDLERS:
+                raise ValueError(f"Неизвестная операция: {name}")
+        except ValueError as e:
+            if group:
+                yield group_op, group
+                group_op, group = None, []
+            yield None, [(number, {'error': str(e)})]
+            continue
+
+        batchable = HANDLERS[name][1]
+        if group and (name != group_op or not batchable or len(group) >= MAX_GROUP_SIZE):
+            yield group_op, group
+            group = []
+        group_op = name
+        group.append((number, op))
+    if group:
+        yield group_op, group
+
+def run_batch(lines, out=sys.stdout):
+    """
+    Выполнение операций из потока строк NDJSON
+
+    Args:
+        lines: Итерируемый источник строк (файл, stdin)
+        out: Поток для вывода результатов
+
+    Returns:
+        bool: True если все операции выполнены успешно
+    """
+    Database.verbose = False
+    # Операции группируются в запросы к одной базе
+    error = unsupported_with_shards("Пакетный режим")
+    if error:
+        print(f"❌ {error}", file=sys.stderr)
+        return False
+    db = Database()
+    # Диагностика подключения не должна попадать в поток результатов
+    with redirect_stdout(sys.stderr):
+        if not db.connect():
+            return False
+
+    all_ok = True
+    try:
+        for name, ops in _groups(lines):
+            if name is None:
+                results = {ops[0][0]: {'ok': False, 'error': ops[0][1]['error']}}
+            else:
+                handler = HANDLERS[name][0]
+                try:
+                    results = handler(db.cursor, ops)
+                    db.connection.commit()
+                except BatchError as e:
+                    db.connection.rollback()
+                    results = {index: {'ok': False, 'error': str(e)} for index, _ in ops}
+                except Exception as e:
+                    db.connection.rollback()
+                    results = {index: {'ok': False, 'error': f"Ошибка базы данных: {e}"}
+                               for index, _ in ops}
+
+            for index, _ in ops:
+                result = results[index]
+                all_ok = all_ok and result['ok']
+                out.write(json.dumps({'line': index, 'op': name, **result}, ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        with redirect_stdout(sys.stderr):
+            db.disconnect()
+
+    return all_ok
@@ -0,0 +1,167 @@
+import hashlib
+import math
+
+class BloomFilter:
+    """
+    Фильтр Блума: компактное вероятностное множество строк
+
+    Ответ "нет" всегда точен, ответ "возможно есть" ошибочен с вероятностью
+    не выше error_rate, пока число элементов не превышает capacity.
+    Размер памяти фиксируется при создании и не растет.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        """
+        Args:
+            capacity (int): Ожидаемое количество элементов
+            error_rate (float): Допустимая доля ложноположительных ответов (0..1)
+        """
+        if capacity <= 0:
+            raise ValueError("Ёмкость фильтра должна быть положительной")
+        if not 0 < error_rate < 1:
+            raise ValueError("Доля ошибок должна быть в интервале (0, 1)")
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+        # Оптимальные размер битового массива и число хеш-функций
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Двойное хеширование: k позиций из двух независимых 64-битных хешей
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, item):
+        """Добавление строки в фильтр"""
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def memory_bytes(self):
+        """Объем памяти битового массива в байтах"""
+        return len(self.bits)
+
+    @property
+    def estimated_error_rate(self):
+        """Ожидаемая доля ложноположительных ответов при текущем заполнении"""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+class EmailFilter:
+    """
+    Предварительная проверка существования email перед вставкой
+
+    Фильтр строится один раз потоковым чтением столбца users.email,
+    затем пополняется при каждой вставке. Запрос к базе выполняется
+    только для email, которые фильтр считает "возможно существующими".
+    """
+
+    def __init__(self, bloom):
+        self.bloom = bloom
+        self.db_checks = 0
+        self.skipped_checks = 0
+
+    @classmethod
+    def build(cls, error_rate=0.01, headroom=2.0, fetch_size=10_000):
+        """
+        Построение фильтра по всем email из таблицы users
+
+        При шардировании email всех шардов читаются из справочника
+        user_email_index, который и отвечает за их уникальность.
+
+        Args:
+            error_rate (float): Допустимая доля ложноположительных ответов
+            headroom (float): Запас ёмкости на новые вставки (множитель к числу строк)
+            fetch_size (int): Количество строк, получаемых с сервера за раз
+
+        Returns:
+            EmailFilter: Фильтр или None при ошибке подключения
+        """
+        from database import Database
+        from sharding import get_shard_map
+
+        shard_map = get_shard_map()
+        if shard_map is None:
+            db, table = Database(), 'users'
+        else:
+            db, table = Database(config=shard_map.directory), 'user_email_index'
+        if not db.connect():
+            return None
+
+        try:
+            db.cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            total = db.cursor.fetchone()[0]
+            bloom = BloomFilter(max(1000, int(total * headroom)), error_rate)
+
+            # Именованный (серверный) курсор не загружает весь столбец в память
+            stream = db.connection.cursor(name='email_filter_stream')
+            stream.itersize = fetch_size
+            stream.execute(f"SELECT email FROM {table}")
+            for (email,) in stream:
+                bloom.add(email)
+            stream.close()
+            db.connection.commit()
+        except Exception as e:
+            print(f"❌ Ошибка построения фильтра email: {e}")
+            db.connection.rollback()
+            return None
+        finally:
+            db.disconnect()
+
+        return cls(bloom)
+
+    def exists(self, email):
+        """
+        Проверка существования пользователя с данным email
+
+        Returns:
+            bool: True если пользователь существует
+        """
+        if email not in self.bloom:
+            self.skipped_checks += 1
+            return False
+
+        from models import User
+
+        self.db_checks += 1
+        return User.get_by_email(email) is not None
+
+    def add(self, email):
+        """Учет email только что вставленного пользователя"""
+        self.bloom.add(email)
+
+def ingest_users(users, email_filter):
+    """
+    Массовое добавление пользователей с проверкой уникальности email через фильтр
+
+    Args:
+        users (iterable): Объекты User без ID
+        email_filter (EmailFilter): Фильтр существующих email
+
+    Returns:
+        tuple: (количество добавленных, количество пропущенных дубликатов)
+    """
+    added = skipped = 0
+    for user in users:
+        if email_filter.exists(user.email):
+            skipped += 1
+            continue
+        if user.save():
+            email_filter.add(user.email)
+            added += 1
+
+    if email_filter.bloom.count > email_filter.bloom.capacity:
+        print("⚠️ Фильтр email переполнен, доля ложных срабатываний растет - постройте его заново")
+
+    return added, skipped
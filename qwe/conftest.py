@@ -0,0 +1,313 @@
+"""
+Фикстуры pytest для интеграционных тестов с PostgreSQL
+
+Схема работы:
+1. Один раз за сессию создается шаблонная база python_db_template
+   (таблица users + все миграции). Шаблон пересоздается только при
+   изменении списка миграций.
+2. Каждый воркер pytest-xdist получает собственную копию шаблона через
+   CREATE DATABASE ... TEMPLATE - это копирование файлов, без повторного
+   выполнения миграций.
+3. Фикстура db оборачивает каждый тест в транзакцию, которая
+   откатывается после теста.
+
+Запуск параллельно на всех ядрах: pytest -n auto
+"""
+import hashlib
+import os
+import sys
+
+import pytest
+
+try:
+    import psycopg2
+
+    from database import Database
+    from migrations import get_migrations, run_all_migrations
+    from setup import create_tables
+except ImportError:
+    # Без драйвера PostgreSQL интеграционные тесты пропускаются
+    # (см. pytest.importorskip в тестовых модулях)
+    psycopg2 = None
+    Database = object
+
+TEMPLATE_DB = "python_db_template"
+
+def _base_config():
+    """Базовая конфигурация подключения из db_config.py"""
+    try:
+        from db_config import DB_CONFIG
+    except ImportError:
+        pytest.skip("Файл конфигурации db_config.py не найден")
+    # Тесты работают с одной базой, даже если в конфигурации заданы шарды
+    return {k: v for k, v in DB_CONFIG.items() if k not in ('shards', 'shard_directory')}
+
+def _admin_connect(config):
+    """Подключение к служебной базе postgres в режиме autocommit"""
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        user=config['user'],
+        password=config['password'],
+        database="postgres"
+    )
+    conn.autocommit = True
+    return conn
+
+def _schema_fingerprint():
+    """Отпечаток набора миграций: шаблон пересоздается при его изменении"""
+    migrations = get_migrations()
+    payload = repr(sorted(migrations.items())).encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()
+
+def _build_template(cursor, config, fingerprint):
+    """Создание шаблонной базы: таблица users и все миграции"""
+    cursor.execute(f"DROP DATABASE IF EXISTS {TEMPLATE_DB}")
+    cursor.execute(f"CREATE DATABASE {TEMPLATE_DB}")
+
+    template_config = dict(config, database=TEMPLATE_DB)
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        user=config['user'],
+        password=config['password'],
+        database=TEMPLATE_DB
+    )
+    try:
+        create_tables(conn.cursor())
+        conn.commit()
+    finally:
+        conn.close()
+
+    if not run_all_migrations(template_config):
+        pytest.fail("Не удалось применить миграции к шаблонной базе")
+
+    cursor.execute(f"COMMENT ON DATABASE {TEMPLATE_DB} IS %s", (fingerprint,))
+
+@pytest.fixture(scope="session")
+def test_database():
+    """
+    Изолированная база данных для текущего воркера (клон шаблона)
+
+    Yields:
+        dict: Конфигурация подключения к базе воркера
+    """
+    if psycopg2 is None:
+        pytest.skip("psycopg2 не установлен")
+    config = _base_config()
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+    worker_db = f"python_db_test_{worker}"
+
+    try:
+        admin = _admin_connect(config)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+
+    cursor = admin.cursor()
+    fingerprint = _schema_fingerprint()
+
+    # Рекомендательная блокировка сериализует сборку шаблона и клонирование
+    # между воркерами: шаблон собирается ровно один раз
+    cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (TEMPLATE_DB,))
+    try:
+        cursor.execute(
+            "SELECT shobj_description(oid, 'pg_database') FROM pg_database WHERE datname = %s",
+            (TEMPLATE_DB,)
+        )
+        row = cursor.fetchone()
+        if not row or row[0] != fingerprint:
+            _build_template(cursor, config, fingerprint)
+
+        cursor.execute(f"DROP DATABASE IF EXISTS {worker_db}")
+        cursor.execute(f"CREATE DATABASE {worker_db} TEMPLATE {TEMPLATE_DB}")
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (TEMPLATE_DB,))
+
+    worker_config = dict(config, database=worker_db)
+    with pytest.MonkeyPatch.context() as mp:
+        # Модели читают DB_CONFIG при каждом подключении
+        import db_config
+        mp.setattr(db_config, "DB_CONFIG", worker_config)
+        yield worker_config
+
+    cursor.execute(f"DROP DATABASE IF EXISTS {worker_db}")
+    cursor.close()
+    admin.close()
+
+class SharedConnection:
+    """
+    Обертка общего подключения теста: COMMIT не завершает транзакцию теста,
+    а ROLLBACK откатывает только до точки сохранения начала теста.
+    """
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        with self._connection.cursor() as cursor:
+            cursor.execute("ROLLBACK TO SAVEPOINT test_case")
+
+class TransactionalDatabase(Database):
+    """
+    Database, работающий внутри общей транзакции теста.
+
+    Вместо COMMIT каждый запрос выполняется в точке сохранения, поэтому
+    все изменения теста откатываются одним ROLLBACK в конце.
+    """
+
+    def __init__(self, connection, operation=None, timeout=None, config=None):
+        super().__init__(operation, timeout)
+        self.shared_connection = connection
+
+    def connect(self):
+        self.connection = SharedConnection(self.shared_connection)
+        self.cursor = self.shared_connection.cursor()
+        return True
+
+    def disconnect(self):
+        if self.cursor:
+            self.cursor.close()
+
+    def execute_query(self, query, params=None):
+        try:
+            self.cursor.execute("SAVEPOINT test_query")
+            self.cursor.execute(query, params or ())
+            self.cursor.execute("RELEASE SAVEPOINT test_query")
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка выполнения запроса: {e}")
+            self.cursor.execute("ROLLBACK TO SAVEPOINT test_query")
+            return False
+
+@pytest.fixture
+def db(test_database, monkeypatch):
+    """
+    Подключение к базе воркера с откатом всех изменений после теста
+
+    Yields:
+        TransactionalDatabase: Подключение, общее с моделями на время теста
+    """
+    conn = psycopg2.connect(
+        host=test_database['host'],
+        port=test_database['port'],
+        user=test_database['user'],
+        password=test_database['password'],
+        database=test_database['database']
+    )
+    with conn.cursor() as cursor:
+        cursor.execute("SAVEPOINT test_case")
+    # Все модули приложения, импортировавшие Database (models, query, jobs...),
+    # работают внутри транзакции теста
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, '__file__', None) or ''
+        if (module.__name__ != __name__ and module_file.startswith(app_dir)
+                and getattr(module, 'Database', None) is Database):
+            monkeypatch.setattr(
+                module, "Database",
+                lambda *args, **kwargs: TransactionalDatabase(conn, *args, **kwargs)
+            )
+
+    database = TransactionalDatabase(conn)
+    database.connect()
+    try:
+        yield database
+    finally:
+        database.disconnect()
+        conn.rollback()
+        conn.close()
+
+def _truncate_app_tables(config):
+    """Очистка всех таблиц приложения, кроме журнала миграций"""
+    conn = psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        user=config['user'],
+        password=config['password'],
+        database=config['database']
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT string_agg(quote_ident(tablename), ', ') FROM pg_tables "
+                "WHERE schemaname = current_schema() AND tablename <> 'migrations'"
+            )
+            cursor.execute(f"TRUNCATE {cursor.fetchone()[0]} RESTART IDENTITY CASCADE")
+        conn.commit()
+    finally:
+        conn.close()
+
+@pytest.fixture
+def committed_db(test_database):
+    """
+    Подключение к базе воркера без общей транзакции теста
+
+    Для тестов, которым нужны настоящие COMMIT: параллельные транзакции,
+    LISTEN/NOTIFY, воркеры в других потоках. Модели работают с той же
+    базой через свои подключения; после теста таблицы очищаются.
+
+    Yields:
+        Database: Обычное подключение к базе воркера
+    """
+    database = Database(config=test_database)
+    if not database.connect():
+        pytest.fail("Не удалось подключиться к базе воркера")
+    try:
+        yield database
+    finally:
+        database.disconnect()
+        _truncate_app_tables(test_database)
+
+
+@pytest.fixture(scope="session")
+def shard_databases(test_database):
+    """
+    Базы двух шардов и отдельного справочника для текущего воркера (клоны шаблона)
+
+    Yields:
+        dict: Конфигурация с ключами 'shards' и 'shard_directory'
+    """
+    prefix = test_database['database']
+    shards = [f"{prefix}_shard_{i}" for i in range(2)]
+    directory = f"{prefix}_directory"
+    admin = _admin_connect(test_database)
+    cursor = admin.cursor()
+    cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (TEMPLATE_DB,))
+    try:
+        for name in shards + [directory]:
+            cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+            cursor.execute(f"CREATE DATABASE {name} TEMPLATE {TEMPLATE_DB}")
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (TEMPLATE_DB,))
+
+    yield dict(test_database, shards=shards, shard_directory=directory)
+
+    for name in shards + [directory]:
+        cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+    cursor.close()
+    admin.close()
+
+@pytest.fixture
+def sharded_db(shard_databases, monkeypatch):
+    """
+    Шардированная конфигурация на время теста; после теста базы очищаются
+
+    Yields:
+        ShardMap: Карта шардов тестовой конфигурации
+    """
+    import db_config
+    from sharding import ShardMap
+
+    monkeypatch.setattr(db_config, "DB_CONFIG", shard_databases)
+    shard_map = ShardMap(shard_databases)
+    try:
+        yield shard_map
+    finally:
+        for config in shard_map.shards + [shard_map.directory]:
+            _truncate_app_tables(config)
@@ -1,11 +1,297 @@
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+
 import psycopg2
+import psycopg2.errors
+import psycopg2.pool
+
+# Таймаут установки соединения по умолчанию (секунды)
+DEFAULT_CONNECT_TIMEOUT = 5
+
+# Бюджеты задержки операций по умолчанию (секунды); переопределяются
+# ключом 'statement_timeouts' в DB_CONFIG. None - без ограничения.
+DEFAULT_STATEMENT_TIMEOUTS = {
+    'get_by_id': 1,
+    'get_by_email': 1,
+    'get_many': 5,
+    'save': 2,
+    'save_batch': 10,
+    'delete': 2,
+    'get_all': 10,
+    'stats': 10,
+}
+
+# Медленные запросы: порог (секунды), доля сохраняемых планов, минимальный
+# интервал между повторными захватами плана одного и того же запроса и
+# EXPLAIN ANALYZE вместо EXPLAIN (ANALYZE повторно выполняет медленный
+# запрос, поэтому включается явно). Переопределяются ключами
+# 'slow_query_threshold', 'slow_query_sample_rate', 'slow_query_cooldown'
+# и 'slow_query_analyze' в DB_CONFIG.
+DEFAULT_SLOW_QUERY_THRESHOLD = 0.5
+DEFAULT_SLOW_QUERY_SAMPLE_RATE = 1.0
+DEFAULT_SLOW_QUERY_COOLDOWN = 300
+DEFAULT_SLOW_QUERY_ANALYZE = False
+
+# Сколько разных запросов помнит ограничение частоты захвата (cooldown);
+# самые давние вытесняются, устаревшие удаляются при каждом захвате
+MAX_TRACKED_SLOW_QUERIES = 1000
+
+# Счетчики превышений бюджета по операциям
+_timeout_counts = Counter()
+_timeout_lock = threading.Lock()
+
+# Очередь захвата планов; EXPLAIN выполняется в фоновом потоке на отдельном
+# подключении, чтобы не увеличивать задержку исходной операции
+_plan_queue = queue.Queue(maxsize=100)
+_plan_thread = None
+_plan_lock = threading.Lock()
+# Текст запроса -> время последнего захвата, в порядке захвата
+_last_captured = OrderedDict()
+
+class QueryTimeoutError(Exception):
+    """Запрос отменен сервером: превышен бюджет задержки операции"""
+    
+    def __init__(self, operation, timeout):
+        self.operation = operation
+        self.timeout = timeout
+        super().__init__(
+            f"Операция '{operation or 'запрос'}' превысила бюджет задержки {timeout} с"
+        )
+
+def record_timeout(operation):
+    """Учет превышения бюджета задержки"""
+    with _timeout_lock:
+        _timeout_counts[operation or 'query'] += 1
+
+def get_timeout_stats():
+    """
+    Количество превышений бюджета задержки с момента запуска
+    
+    Returns:
+        dict: {операция: количество}
+    """
+    with _timeout_lock:
+        return dict(_timeout_counts)
+
+def _plan_worker():
+    """
+    Фоновый поток: EXPLAIN медленных запросов и запись в slow_query_log
+
+    В журнал записывается текст запроса с плейсхолдерами; параметры (email,
+    имена) нужны только для EXPLAIN и не сохраняются.
+    """
+    conn, conn_config = None, None
+    while True:
+        config, query, params, duration, operation = _plan_queue.get()
+        try:
+            # План снимается в той базе, где выполнялся запрос
+            if conn is not None and conn_config != config:
+                conn.close()
+            if conn is None or conn.closed:
+                conn_config = config
+                conn = psycopg2.connect(
+                    host=config['host'],
+                    port=config['port'],
+                    database=config.get('database', 'python_db'),
+                    user=config['user'],
+                    password=config['password'],
+                    connect_timeout=config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+                )
+            cursor = conn.cursor()
+            # ANALYZE реально выполняет запрос, поэтому только по явной
+            # настройке, только для SELECT и только в транзакции READ ONLY,
+            # которая затем откатывается
+            analyze = config.get('slow_query_analyze', DEFAULT_SLOW_QUERY_ANALYZE)
+            if analyze and query.lstrip().upper().startswith('SELECT'):
+                explain = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) "
+            else:
+                explain = "EXPLAIN (FORMAT JSON) "
+            cursor.execute("SET TRANSACTION READ ONLY")
+            cursor.execute(explain + query, params or ())
+            plan = cursor.fetchone()[0]
+            conn.rollback()
+            
+            cursor.execute(
+                """
+                INSERT INTO slow_query_log (query, duration_ms, operation, plan)
+                VALUES (%s, %s, %s, %s)
+                """,
+                (query, round(duration * 1000, 2), operation, json.dumps(plan))
+            )
+            conn.commit()
+            cursor.close()
+        except Exception as e:
+            if Database.verbose:
+                print(f"⚠️ Не удалось сохранить план медленного запроса: {e}")
+            if conn is not None and not conn.closed:
+                conn.rollback()
+        finally:
+            # Медленные запросы редки: подключение не держится между всплесками
+            if conn is not None and _plan_queue.empty():
+                conn.close()
+                conn = None
+            _plan_queue.task_done()
+
+def _submit_plan_capture(config, query, params, duration, operation):
+    """Постановка медленного запроса в очередь захвата плана"""
+    global _plan_thread
+    with _plan_lock:
+        if _plan_thread is None:
+            _plan_thread = threading.Thread(target=_plan_worker, name='plan-capture', daemon=True)
+            _plan_thread.start()
+    try:
+        _plan_queue.put_nowait((config, query, params, duration, operation))
+    except queue.Full:
+        # При всплеске медленных запросов лишние образцы отбрасываются
+        pass
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул подключений к одной базе
+    
+    В отличие от ThreadedConnectionPool, при исчерпании пула поток ждет
+    освобождения подключения, а не получает ошибку.
+    """
+    
+    def __init__(self, config, maxconn):
+        self.config = config
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            0, maxconn,
+            host=config['host'],
+            port=config['port'],
+            database=config.get('database', 'python_db'),
+            user=config['user'],
+            password=config['password'],
+            connect_timeout=config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # Текущий statement_timeout каждого подключения (чтобы не повторять SET)
+        self._timeouts = {}
+        
+    def getconn(self, timeout=None):
+        """Получение подключения с нужным statement_timeout"""
+        wait = self.config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+        if not self._slots.acquire(timeout=wait):
+            raise psycopg2.OperationalError("timeout expired: пул подключений исчерпан")
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._timeouts.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            timeout_ms = int(timeout * 1000) if timeout else 0
+            if self._timeouts.get(id(conn)) != timeout_ms:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET statement_timeout = %s", (timeout_ms,))
+                conn.commit()
+                self._timeouts[id(conn)] = timeout_ms
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+            
+    def putconn(self, conn):
+        """Возврат подключения в пул в исходном состоянии"""
+        close = bool(conn.closed)
+        try:
+            if not close:
+                if conn.autocommit:
+                    # Подключение использовалось для LISTEN и т.п. - сбрасываем сессию
+                    with conn.cursor() as cursor:
+                        cursor.execute("DISCARD ALL")
+                    conn.autocommit = False
+                    self._timeouts.pop(id(conn), None)
+                else:
+                    conn.rollback()
+        except Exception:
+            # Подключение в неизвестном состоянии (например, сервер его разорвал):
+            # закрываем его, место в пуле освобождается для нового
+            close = True
+        finally:
+            try:
+                if close or conn.closed:
+                    self._timeouts.pop(id(conn), None)
+                self._pool.putconn(conn, close=close or bool(conn.closed))
+            finally:
+                self._slots.release()
+            
+    def closeall(self):
+        self._pool.closeall()
+        self._timeouts.clear()
+
+# Пулы подключений по базам (включаются Database.enable_pool)
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _pool_for(config, maxconn):
+    key = (config['host'], str(config['port']), config.get('database', 'python_db'), config['user'])
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(config, maxconn)
+        return _pools[key]
 
 class Database:
-    def __init__(self):
-        """Инициализация подключения к базе данных"""
+    # Вывод сообщений об успешном подключении/отключении
+    # (отключается в утилитах, выполняющих тысячи операций)
+    verbose = True
+    
+    # Размер пула подключений; None - каждое подключение создается заново
+    pool_size = None
+    
+    @classmethod
+    def enable_pool(cls, size=10):
+        """
+        Потокобезопасный режим: подключения берутся из общего пула
+        
+        После включения модели можно вызывать из пула потоков: каждый
+        Database получает собственное подключение из пула и возвращает
+        его в disconnect(), без установки нового TCP/TLS-соединения.
+        
+        Args:
+            size (int): Максимальное число подключений к одной базе
+        """
+        cls.pool_size = size
+        
+    @classmethod
+    def disable_pool(cls):
+        """Отключение пула и закрытие всех подключений"""
+        cls.pool_size = None
+        with _pools_lock:
+            for pool in _pools.values():
+                pool.closeall()
+            _pools.clear()
+    
+    def __init__(self, operation=None, timeout=None, config=None):
+        """
+        Инициализация подключения к базе данных
+        
+        Args:
+            operation (str, optional): Название операции для выбора бюджета задержки
+            timeout (float, optional): Бюджет задержки в секундах (важнее настроек)
+            config (dict, optional): Конфигурация подключения (по умолчанию из db_config.py),
+                например конфигурация отдельного шарда
+        """
         self.connection = None
         self.cursor = None
-        self.config = self.load_config()
+        self.pool = None
+        # Ошибка последнего запроса, которую fetch_one/fetch_all/execute_query
+        # не пробросили, а заменили результатом None/[]/False
+        self.last_error = None
+        self.config = config if config is not None else self.load_config()
+        self.operation = operation
+        self.timeout = timeout if timeout is not None else self.statement_timeout_for(operation)
+        
+    def statement_timeout_for(self, operation):
+        """Бюджет задержки операции из конфигурации (секунды или None)"""
+        if not self.config or operation is None:
+            return None
+        timeouts = dict(DEFAULT_STATEMENT_TIMEOUTS)
+        timeouts.update(self.config.get('statement_timeouts', {}))
+        return timeouts.get(operation)
         
     def load_config(self):
         """Загрузка конфигурации из файла"""
@@ -21,68 +307,149 @@ class Database:
         if not self.config:
             return False
             
+        # statement_timeout передается в параметрах подключения: сервер сам
+        # отменяет запрос по превышении бюджета, без лишнего SET
+        options = None
+        if self.timeout:
+            options = f"-c statement_timeout={int(self.timeout * 1000)}"
+            
         try:
-            self.connection = psycopg2.connect(
-                host=self.config['host'],
-                port=self.config['port'],
-                database="python_db",
-                user=self.config['user'],
-                password=self.config['password']
-            )
+            if self.pool_size:
+                self.pool = _pool_for(self.config, self.pool_size)
+                self.connection = self.pool.getconn(self.timeout)
+            else:
+                self.connection = psycopg2.connect(
+                    host=self.config['host'],
+                    port=self.config['port'],
+                    database=self.config.get('database', 'python_db'),
+                    user=self.config['user'],
+                    password=self.config['password'],
+                    connect_timeout=self.config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+                    options=options
+                )
             self.cursor = self.connection.cursor()
-            print("✅ Успешное подключение к PostgreSQL")
+            if self.verbose:
+                print("✅ Успешное подключение к PostgreSQL")
             return True
+        except psycopg2.OperationalError as e:
+            if 'timeout expired' in str(e):
+                record_timeout('connect')
+            print(f"❌ Ошибка подключения: {e}")
+            return False
         except Exception as e:
             print(f"❌ Ошибка подключения: {e}")
             return False
             
+    def _execute(self, query, params):
+        """Выполнение запроса с замером времени и захватом плана медленных запросов"""
+        started = time.perf_counter()
+        try:
+            self.cursor.execute(query, params or ())
+        except psycopg2.errors.QueryCanceled as e:
+            # statement_timeout отменяет запрос не раньше бюджета; более ранняя
+            # отмена (pg_cancel_backend) - обычная ошибка запроса, а не превышение
+            if self.timeout and time.perf_counter() - started >= self.timeout:
+                raise self._timed_out() from e
+            raise
+        duration = time.perf_counter() - started
+        
+        threshold = self.config.get('slow_query_threshold', DEFAULT_SLOW_QUERY_THRESHOLD)
+        if threshold is None or duration < threshold:
+            return
+        if random.random() >= self.config.get('slow_query_sample_rate', DEFAULT_SLOW_QUERY_SAMPLE_RATE):
+            return
+            
+        # Один и тот же запрос не захватывается чаще, чем раз в cooldown секунд
+        cooldown = self.config.get('slow_query_cooldown', DEFAULT_SLOW_QUERY_COOLDOWN)
+        now = time.monotonic()
+        with _plan_lock:
+            if now - _last_captured.get(query, float('-inf')) < cooldown:
+                return
+            _last_captured[query] = now
+            _last_captured.move_to_end(query)
+            # Самые давние захваты - в начале: удаляем истекшие и лишние
+            while _last_captured:
+                oldest_query, captured_at = next(iter(_last_captured.items()))
+                if now - captured_at < cooldown and len(_last_captured) <= MAX_TRACKED_SLOW_QUERIES:
+                    break
+                del _last_captured[oldest_query]
+            
+        _submit_plan_capture(self.config, query, params, duration, self.operation)
+        
+    def _timed_out(self):
+        """Обработка отмены запроса по statement_timeout"""
+        record_timeout(self.operation)
+        if self.connection:
+            self.connection.rollback()
+        return QueryTimeoutError(self.operation, self.timeout)
+            
     def disconnect(self):
         """Закрытие соединения с базой данных"""
         if self.connection:
             self.cursor.close()
-            self.connection.close()
-            print("✅ Соединение с базой данных закрыто")
+            if self.pool is not None:
+                self.pool.putconn(self.connection)
+            else:
+                self.connection.close()
+            self.connection = None
+            if self.verbose:
+                print("✅ Соединение с базой данных закрыто")
             
     def execute_query(self, query, params=None):
         """Выполнение SQL запроса"""
+        self.last_error = None
         if not self.connection:
             print("❌ Нет подключения к базе данных")
+            self.last_error = ConnectionError("Нет подключения к базе данных")
             return False
             
         try:
-            self.cursor.execute(query, params or ())
+            self._execute(query, params)
             self.connection.commit()
             return True
+        except QueryTimeoutError:
+            raise
         except Exception as e:
             print(f"❌ Ошибка выполнения запроса: {e}")
-            if self.connection:
+            self.last_error = e
+            if self.connection and not self.connection.closed:
                 self.connection.rollback()
             return False
             
     def fetch_all(self, query, params=None):
         """Получение всех результатов запроса"""
+        self.last_error = None
         if not self.connection:
             print("❌ Нет подключения к базе данных")
+            self.last_error = ConnectionError("Нет подключения к базе данных")
             return []
             
         try:
-            self.cursor.execute(query, params or ())
+            self._execute(query, params)
             return self.cursor.fetchall()
+        except QueryTimeoutError:
+            raise
         except Exception as e:
             print(f"❌ Ошибка получения данных: {e}")
+            self.last_error = e
             return []
             
     def fetch_one(self, query, params=None):
         """Получение одной строки результата"""
+        self.last_error = None
         if not self.connection:
             print("❌ Нет подключения к базе данных")
+            self.last_error = ConnectionError("Нет подключения к базе данных")
             return None
             
         try:
-            self.cursor.execute(query, params or ())
+            self._execute(query, params)
             return self.cursor.fetchone()
+        except QueryTimeoutError:
+            raise
         except Exception as e:
             print(f"❌ Ошибка получения данных: {e}")
+            self.last_error = e
             return None
 
 def test_connection():
@@ -0,0 +1,430 @@
+"""
+Поиск почти-дубликатов пользователей
+
+Ограничение UNIQUE(email) ловит только точные совпадения, а записи вида
+"Ivan.Ivanov@gmail.com" / "ivanivanov+shop@gmail.com" или "Иван Иванов" /
+"Ivanov Ivan" накапливаются. Попарное сравнение всех пользователей - O(n²),
+поэтому поиск устроен так, чтобы время росло почти линейно:
+1. Пользователи читаются потоком через серверный курсор, email и имя
+   нормализуются (регистр, +метки, точки, транслитерация, порядок слов).
+2. Сравниваются только пары с общим ключом блокировки (канонический email,
+   локальная часть email, нормализованное имя). Слишком большие блоки
+   (частые имена) и весь список, отсортированный по локальной части email,
+   обрабатываются скользящим окном (sorted neighbourhood): каждая запись
+   сравнивается только с window соседями.
+3. Группы сравнений оцениваются в нескольких процессах; пары с оценкой не
+   ниже порога объединяются в группы кандидатов на слияние.
+"""
+import argparse
+import json
+import re
+import sys
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from itertools import combinations, islice
+from multiprocessing import Pool
+
+from database import Database
+from sharding import get_shard_map
+
+DEFAULT_THRESHOLD = 0.85
+DEFAULT_WINDOW = 10
+
+# Блоки больше этого размера сравниваются окном, а не всеми парами
+MAX_BLOCK_SIZE = 50
+
+# Записей в одном задании воркера и в одной порции серверного курсора
+TASK_SIZE = 5000
+STREAM_BATCH_SIZE = 10_000
+
+# Вклад похожести email и имени в оценку пары
+EMAIL_WEIGHT = 0.6
+NAME_WEIGHT = 0.4
+# Множитель похожести email с разными доменами
+OTHER_DOMAIN_FACTOR = 0.9
+# Похожесть локальных частей email, начиная с которой она указывается в причинах
+SIMILAR_EMAIL = 0.85
+
+# Домены, в которых точки в локальной части не значимы, и их синонимы
+DOTLESS_DOMAINS = {'gmail.com'}
+DOMAIN_ALIASES = {'googlemail.com': 'gmail.com', 'ya.ru': 'yandex.ru'}
+
+REASONS = {
+    'email': "один почтовый ящик",
+    'email_local': "одинаковое имя ящика",
+    'email_similar': "похожий email",
+    'name': "одинаковое имя",
+}
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu',
+    'я': 'ya',
+})
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_LOCAL_SEPARATORS_RE = re.compile(r"[._\-]")
+
+def normalize_email(email):
+    """
+    Канонический вид email и ключ имени ящика
+
+    Returns:
+        tuple: (канонический email, локальная часть без разделителей, домен);
+            канонический email совпадает только у адресов одного ящика
+    """
+    email = unicodedata.normalize('NFKC', (email or '').strip()).casefold()
+    local, _, domain = email.rpartition('@')
+    if not local:
+        return email, email, ''
+    domain = DOMAIN_ALIASES.get(domain, domain)
+    local = local.split('+', 1)[0]
+    if domain in DOTLESS_DOMAINS:
+        local = local.replace('.', '')
+    return f"{local}@{domain}", _LOCAL_SEPARATORS_RE.sub('', local), domain
+
+def normalize_name(name):
+    """
+    Имя без регистра, пунктуации и порядка слов, кириллица - латиницей
+
+    "Иванов  Иван" и "ivan IVANOV" дают одно и то же значение "ivan ivanov".
+    """
+    name = unicodedata.normalize('NFKC', name or '').casefold().translate(_TRANSLIT)
+    return ' '.join(sorted(_NON_WORD_RE.sub(' ', name).split()))
+
+def make_record(user_id, name, email):
+    """Запись для сравнения: (id, канонический email, имя ящика, домен, имя)"""
+    canonical, local, domain = normalize_email(email)
+    return user_id, canonical, local, domain, normalize_name(name)
+
+def blocking_keys(record):
+    """Ключи блоков, в которых участвует запись"""
+    _, canonical, local, _, name = record
+    keys = [('email', canonical)]
+    # Слишком короткое имя ящика (a@, info@) объединило бы посторонних
+    if len(local) >= 4:
+        keys.append(('local', local))
+    if name:
+        keys.append(('name', name))
+    return keys
+
+def _similarity(a, b, bound=0.0):
+    """Похожесть строк 0..1; 0, если она заведомо меньше bound"""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    # real_quick_ratio и quick_ratio - дешевые верхние оценки ratio
+    if matcher.real_quick_ratio() < bound or matcher.quick_ratio() < bound:
+        return 0.0
+    return matcher.ratio()
+
+def score_pair(a, b, threshold=0.0):
+    """
+    Оценка похожести двух записей
+
+    Args:
+        a, b (tuple): Записи make_record
+        threshold (float): Порог; если оценка заведомо ниже, полный расчет пропускается
+
+    Returns:
+        tuple: (оценка 0..1, список причин из REASONS)
+    """
+    _, email_a, local_a, domain_a, name_a = a
+    _, email_b, local_b, domain_b, name_b = b
+    if email_a == email_b:
+        # Один и тот же ящик - дубликат независимо от имени
+        return 1.0, ['email'] + (['name'] if name_a and name_a == name_b else [])
+
+    factor = EMAIL_WEIGHT * (1.0 if domain_a == domain_b else OTHER_DOMAIN_FACTOR)
+    # Минимальная похожесть email, при которой пара еще может набрать порог
+    email_score = _similarity(local_a, local_b, (threshold - NAME_WEIGHT) / factor)
+    name_score = _similarity(name_a, name_b, (threshold - factor * email_score) / NAME_WEIGHT)
+    score = factor * email_score + NAME_WEIGHT * name_score
+
+    reasons = []
+    if local_a == local_b:
+        reasons.append('email_local')
+    elif email_score >= SIMILAR_EMAIL:
+        reasons.append('email_similar')
+    if name_a and name_a == name_b:
+        reasons.append('name')
+    return round(score, 3), reasons
+
+def _group_pairs(mode, size, window):
+    """Пары индексов внутри группы: все ('block') или соседние ('window')"""
+    if mode == 'block':
+        return combinations(range(size), 2)
+    return ((i, j) for i in range(size) for j in range(i + 1, min(i + window, size)))
+
+def score_task(task):
+    """
+    Оценка пар в группах одного задания (выполняется в процессе-воркере)
+
+    Args:
+        task (tuple): (группы [(режим, записи)], окно, порог)
+
+    Returns:
+        tuple: (количество сравнений, [(id1, id2, оценка, причины)] с id1 < id2)
+    """
+    groups, window, threshold = task
+    compared = 0
+    found = []
+    for mode, records in groups:
+        for i, j in _group_pairs(mode, len(records), window):
+            a, b = records[i], records[j]
+            if a[0] == b[0]:
+                continue
+            compared += 1
+            score, reasons = score_pair(a, b, threshold)
+            if score >= threshold:
+                found.append((min(a[0], b[0]), max(a[0], b[0]), score, reasons))
+    return compared, found
+
+def _windows(order, window, chunk=TASK_SIZE):
+    """Перекрывающиеся части отсортированного списка для сравнения окном"""
+    for start in range(0, max(1, len(order) - window + 1), chunk):
+        yield order[start:start + chunk + window - 1]
+
+def candidate_groups(records, window=DEFAULT_WINDOW, max_block=MAX_BLOCK_SIZE):
+    """
+    Группы записей для сравнения (блокировка и скользящее окно)
+
+    Args:
+        records (list): Записи make_record
+        window (int): Размер окна
+        max_block (int): Максимальный размер блока для сравнения всех пар
+
+    Yields:
+        tuple: (режим 'block' или 'window', индексы записей)
+    """
+    def by_local(index):
+        return records[index][2], records[index][1]
+
+    blocks = {}
+    for index, record in enumerate(records):
+        for key in blocking_keys(record):
+            blocks.setdefault(key, []).append(index)
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if len(members) <= max_block:
+            yield 'block', members
+        else:
+            for part in _windows(sorted(members, key=by_local), window):
+                yield 'window', part
+    blocks.clear()
+
+    # Опечатки и различия в доменах: соседи по имени ящика
+    for part in _windows(sorted(range(len(records)), key=by_local), window):
+        yield 'window', part
+
+def _tasks(records, window, threshold, max_block):
+    """Объединение групп в задания примерно по TASK_SIZE записей"""
+    groups, size = [], 0
+    for mode, members in candidate_groups(records, window, max_block):
+        groups.append((mode, [records[index] for index in members]))
+        size += len(members)
+        if size >= TASK_SIZE:
+            yield groups, window, threshold
+            groups, size = [], 0
+    if groups:
+        yield groups, window, threshold
+
+def iter_users(config=None, batch_size=STREAM_BATCH_SIZE):
+    """
+    Потоковое чтение (id, name, email) всех пользователей одной базы
+
+    Строки читаются серверным курсором порциями по batch_size,
+    без загрузки всей таблицы в память клиента.
+    """
+    db = Database(config=config)
+    if not db.connect():
+        raise ConnectionError("База данных недоступна")
+    try:
+        with db.connection.cursor(name='dedup_users') as cursor:
+            cursor.itersize = batch_size
+            cursor.execute("SELECT id, name, email FROM users")
+            yield from cursor
+    finally:
+        db.disconnect()
+
+def load_records(batch_size=STREAM_BATCH_SIZE):
+    """Нормализованные записи всех пользователей (всех шардов)"""
+    shard_map = get_shard_map()
+    configs = shard_map.shards if shard_map is not None else [None]
+    return [make_record(*row) for config in configs for row in iter_users(config, batch_size)]
+
+def cluster_pairs(pairs):
+    """
+    Объединение пар в группы (система непересекающихся множеств)
+
+    Returns:
+        list: Отсортированные списки ID, по группе на список
+    """
+    parent = {}
+
+    def find(item):
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters = {}
+    for item in parent:
+        clusters.setdefault(find(item), []).append(item)
+    return sorted(sorted(members) for members in clusters.values())
+
+def find_duplicates(threshold=DEFAULT_THRESHOLD, window=DEFAULT_WINDOW, workers=4,
+                    max_block=MAX_BLOCK_SIZE, records=None, progress=None):
+    """
+    Поиск групп кандидатов на слияние
+
+    Args:
+        threshold (float): Минимальная оценка пары
+        window (int): Размер скользящего окна
+        workers (int): Количество процессов для оценки пар (1 - в текущем процессе)
+        max_block (int): Максимальный размер блока для сравнения всех пар
+        records (list, optional): Готовые записи make_record (по умолчанию - из базы)
+        progress (callable, optional): progress(записей сравнено, всего записей)
+
+    Returns:
+        dict: records, comparisons, pairs ({(id1, id2): (оценка, причины)}),
+            clusters (списки ID) или None при ошибке подключения
+    """
+    if records is None:
+        try:
+            records = load_records()
+        except ConnectionError as e:
+            print(f"❌ {e}")
+            return None
+
+    pairs = {}
+    comparisons = 0
+    tasks = _tasks(records, window, threshold, max_block)
+    pool = Pool(processes=workers) if workers > 1 else None
+    try:
+        while True:
+            # Задания формируются волнами, чтобы не держать в памяти копии
+            # записей для всех заданий сразу
+            wave = list(islice(tasks, workers * 4))
+            if not wave:
+                break
+            results = pool.imap_unordered(score_task, wave) if pool else map(score_task, wave)
+            for compared, found in results:
+                comparisons += compared
+                for a, b, score, reasons in found:
+                    # Пара может встретиться в нескольких блоках
+                    if (a, b) not in pairs or pairs[(a, b)][0] < score:
+                        pairs[(a, b)] = (score, reasons)
+            if progress:
+                progress(comparisons, None)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    return {
+        'records': len(records),
+        'comparisons': comparisons,
+        'pairs': pairs,
+        'clusters': cluster_pairs(pairs),
+    }
+
+def merge_report(result):
+    """
+    Отчет о кандидатах на слияние для вывода и сохранения в JSON
+
+    Returns:
+        list: Группы {'keep', 'ids', 'score', 'users', 'pairs'}, сначала самые
+            уверенные; keep - самый ранний (с наименьшим ID) пользователь
+    """
+    from models import User
+
+    users, _ = User.get_many([user_id for cluster in result['clusters'] for user_id in cluster])
+    by_id = {user.id: user for user in users}
+
+    pairs_by_cluster = {}
+    owner = {user_id: cluster[0] for cluster in result['clusters'] for user_id in cluster}
+    for (a, b), (score, reasons) in result['pairs'].items():
+        pairs_by_cluster.setdefault(owner[a], []).append(
+            {'a': a, 'b': b, 'score': score, 'reasons': reasons}
+        )
+
+    report = []
+    for cluster in result['clusters']:
+        pairs = sorted(pairs_by_cluster[cluster[0]], key=lambda pair: -pair['score'])
+        report.append({
+            'keep': cluster[0],
+            'ids': cluster,
+            'score': pairs[0]['score'],
+            'users': [
+                {'id': user_id, 'name': by_id[user_id].name, 'email': by_id[user_id].email}
+                for user_id in cluster if user_id in by_id
+            ],
+            'pairs': pairs,
+        })
+    report.sort(key=lambda group: (-group['score'], -len(group['ids']), group['keep']))
+    return report
+
+def print_report(report, top=20):
+    """Вывод первых групп кандидатов на слияние"""
+    print(f"📊 Групп кандидатов на слияние: {len(report)}")
+    print("-" * 50)
+    for group in report[:top]:
+        print(f"Оценка {group['score']:.2f}, пользователей: {len(group['ids'])}, "
+              f"оставить ID {group['keep']}")
+        for user in group['users']:
+            print(f"   {user['id']}: {user['name']} <{user['email']}>")
+        reasons = {reason for pair in group['pairs'] for reason in pair['reasons']}
+        if reasons:
+            print(f"   Причины: {', '.join(REASONS[reason] for reason in sorted(reasons))}")
+    if len(report) > top:
+        print(f"... и еще {len(report) - top}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск почти-дубликатов пользователей")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"минимальная оценка пары 0..1 (по умолчанию {DEFAULT_THRESHOLD})")
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help=f"размер скользящего окна (по умолчанию {DEFAULT_WINDOW})")
+    parser.add_argument('--workers', type=int, default=4, help="количество процессов (по умолчанию 4)")
+    parser.add_argument('--top', type=int, default=20, help="количество групп в выводе")
+    parser.add_argument('--output', help="файл для полного отчета в JSON")
+    args = parser.parse_args()
+
+    if not 0 < args.threshold <= 1 or args.window < 2 or args.workers <= 0:
+        print("❌ Порог должен быть в диапазоне (0, 1], окно - не меньше 2, процессов - не меньше 1")
+        return
+    Database.verbose = False
+
+    started = time.perf_counter()
+    print("🔄 Чтение пользователей...")
+    result = find_duplicates(
+        args.threshold, args.window, args.workers,
+        progress=lambda done, total: print(f"\r   Сравнений: {done}", end="", flush=True)
+    )
+    print()
+    if result is None:
+        sys.exit(1)
+    print(f"✅ Пользователей: {result['records']}, сравнений: {result['comparisons']}, "
+          f"пар: {len(result['pairs'])}, {time.perf_counter() - started:.1f} с")
+
+    report = merge_report(result)
+    print_report(report, args.top)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Отчет сохранен в {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+"""
+Экспорт пользователей
+
+Инкрементальный экспорт выдает только строки, изменившиеся после
+сохраненного водяного знака (watermark), и удаления из users_tombstones.
+Строки читаются в порядке ключа (updated_at, id) порциями по индексу
+idx_users_updated_at, без сканирования всей таблицы. Требует миграцию 007.
+
+Параллельный экспорт делит диапазон ID на части и выгружает их через
+COPY в нескольких процессах. Все процессы читают один снимок базы,
+экспортированный pg_export_snapshot(), поэтому части согласованы между
+собой. Результат - файлы частей в CSV и manifest.json.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+from database import Database
+from sharding import unsupported_with_shards
+
+# Начальный водяной знак: экспортировать все строки
+INITIAL_WATERMARK = {
+    'updated_at': datetime.min,
+    'last_id': 0,
+    'deleted_at': datetime.min,
+    'deleted_id': 0,
+}
+
+def _json_default(value):
+    """Сериализация дат и прочих типов PostgreSQL в JSON"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+class IncrementalExporter:
+    """
+    Инкрементальный экспорт изменений таблицы users для одного потребителя
+
+    Водяной знак хранится в таблице export_watermarks и сохраняется только
+    после того, как потребитель успешно обработал все изменения.
+    """
+
+    def __init__(self, consumer, batch_size=1000):
+        """
+        Args:
+            consumer (str): Имя потребителя (у каждого свой водяной знак)
+            batch_size (int): Количество строк, читаемых за один запрос
+        """
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.db = Database()
+        self.watermark = None
+
+    def connect(self):
+        return self.db.connect()
+
+    def disconnect(self):
+        self.db.disconnect()
+
+    def load_watermark(self):
+        """
+        Чтение сохраненного водяного знака потребителя
+
+        Returns:
+            dict: Водяной знак (начальный, если потребитель новый)
+        """
+        row = self.db.fetch_one(
+            "SELECT updated_at, last_id, deleted_at, deleted_id "
+            "FROM export_watermarks WHERE consumer = %s",
+            (self.consumer,)
+        )
+        if not row:
+            return dict(INITIAL_WATERMARK)
+        return {
+            'updated_at': row[0] or datetime.min,
+            'last_id': row[1] or 0,
+            'deleted_at': row[2] or datetime.min,
+            'deleted_id': row[3] or 0,
+        }
+
+    def save_watermark(self, watermark):
+        """Сохранение водяного знака после успешной обработки изменений"""
+        return self.db.execute_query(
+            """
+            INSERT INTO export_watermarks (consumer, updated_at, last_id, deleted_at, deleted_id)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (consumer) DO UPDATE SET
+                updated_at = EXCLUDED.updated_at,
+                last_id = EXCLUDED.last_id,
+                deleted_at = EXCLUDED.deleted_at,
+                deleted_id = EXCLUDED.deleted_id,
+                saved_at = CURRENT_TIMESTAMP
+            """,
+            (self.consumer, watermark['updated_at'], watermark['last_id'],
+             watermark['deleted_at'], watermark['deleted_id'])
+        )
+
+    def _safe_point(self, cursor):
+        """
+        Верхняя граница экспорта по времени
+
+        Открытые транзакции, которые еще не закоммичены, могут создать строки
+        с updated_at не раньше момента своего начала. Экспортируем строки
+        строго раньше начала самой старой такой транзакции, чтобы они не
+        оказались позади сохраненного водяного знака. Учитываются и
+        транзакции, которые пока ничего не записали (у них еще нет xid):
+        их будущие строки получат updated_at = время начала транзакции.
+        """
+        cursor.execute("""
+            SELECT LEAST(now(), COALESCE(MIN(xact_start), now()))
+            FROM pg_stat_activity
+            WHERE xact_start IS NOT NULL AND state <> 'idle'
+              AND datname = current_database() AND pid <> pg_backend_pid()
+        """)
+        return cursor.fetchone()[0]
+
+    def changes(self, watermark=None):
+        """
+        Поток изменений после водяного знака
+
+        Все порции читаются в одном снимке (REPEATABLE READ). После полного
+        прохода новый водяной знак доступен в self.watermark.
+
+        Args:
+            watermark (dict, optional): Водяной знак (по умолчанию - сохраненный)
+
+        Yields:
+            dict: {'op': 'upsert', 'user': {...}} или {'op': 'delete', 'id': ...}
+        """
+        if watermark is None:
+            watermark = self.load_watermark()
+        watermark = dict(watermark)
+        conn = self.db.connection
+        conn.rollback()
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+
+        try:
+            cursor = conn.cursor()
+            safe_point = self._safe_point(cursor)
+
+            while True:
+                cursor.execute(
+                    """
+                    SELECT * FROM users
+                    WHERE (updated_at, id) > (%s, %s) AND updated_at < %s
+                    ORDER BY updated_at, id
+                    LIMIT %s
+                    """,
+                    (watermark['updated_at'], watermark['last_id'], safe_point, self.batch_size)
+                )
+                columns = [column[0] for column in cursor.description]
+                rows = cursor.fetchall()
+                for row in rows:
+                    user = dict(zip(columns, row))
+                    yield {'op': 'upsert', 'user': user}
+                    watermark['updated_at'], watermark['last_id'] = user['updated_at'], user['id']
+                if len(rows) < self.batch_size:
+                    break
+
+            while True:
+                cursor.execute(
+                    """
+                    SELECT user_id, deleted_at FROM users_tombstones
+                    WHERE (deleted_at, user_id) > (%s, %s) AND deleted_at < %s
+                    ORDER BY deleted_at, user_id
+                    LIMIT %s
+                    """,
+                    (watermark['deleted_at'], watermark['deleted_id'], safe_point, self.batch_size)
+                )
+                rows = cursor.fetchall()
+                for user_id, deleted_at in rows:
+                    yield {'op': 'delete', 'id': user_id, 'deleted_at': deleted_at}
+                    watermark['deleted_at'], watermark['deleted_id'] = deleted_at, user_id
+                if len(rows) < self.batch_size:
+                    break
+
+            cursor.close()
+            self.watermark = watermark
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level='DEFAULT', readonly=False)
+
+def export_incremental(consumer, out=sys.stdout, batch_size=1000):
+    """
+    Выгрузка изменений в NDJSON и сдвиг водяного знака потребителя
+
+    Args:
+        consumer (str): Имя потребителя
+        out: Поток вывода
+        batch_size (int): Размер порции чтения
+
+    Returns:
+        int: Количество выгруженных изменений или -1 при ошибке
+    """
+    # Водяной знак и надгробия ведутся в каждой базе отдельно
+    error = unsupported_with_shards("Инкрементальный экспорт")
+    if error:
+        print(f"❌ {error}", file=sys.stderr)
+        return -1
+
+    exporter = IncrementalExporter(consumer, batch_size)
+    if not exporter.connect():
+        return -1
+
+    count = 0
+    try:
+        for change in exporter.changes():
+            out.write(json.dumps(change, ensure_ascii=False, default=_json_default) + "\n")
+            count += 1
+        out.flush()
+        # Водяной знак сохраняется только после успешной записи всех изменений
+        if not exporter.save_watermark(exporter.watermark):
+            return -1
+    except Exception as e:
+        print(f"❌ Ошибка экспорта: {e}", file=sys.stderr)
+        return -1
+    finally:
+        exporter.disconnect()
+
+    return count
+
+def id_ranges(min_id, max_id, parts):
+    """
+    Разбиение диапазона ID на непересекающиеся полуинтервалы [от, до)
+
+    Args:
+        min_id (int): Минимальный ID
+        max_id (int): Максимальный ID
+        parts (int): Желаемое количество частей
+
+    Returns:
+        list: Пары (от, до); пустой список, если таблица пуста
+    """
+    if min_id is None or max_id is None:
+        return []
+    span = max_id - min_id + 1
+    step = -(-span // max(1, min(parts, span)))
+    return [(start, min(start + step, max_id + 1)) for start in range(min_id, max_id + 1, step)]
+
+# Подключение процесса-воркера экспорта (одно на процесс)
+_export_db = None
+
+def _init_export_worker(config):
+    """Инициализация процесса-воркера: открытие собственного подключения"""
+    global _export_db
+    Database.verbose = False
+    _export_db = Database(config=config)
+    if not _export_db.connect():
+        _export_db = None
+
+def export_part(args):
+    """
+    Выгрузка одной части в процессе-воркере
+
+    Args:
+        args (tuple): (снимок, номер части, от, до, путь к файлу)
+
+    Returns:
+        dict: Описание части для манифеста
+    """
+    snapshot, number, start, end, path = args
+    if _export_db is None:
+        raise ConnectionError("Воркер экспорта не подключен к базе данных")
+
+    conn = _export_db.connection
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    try:
+        with conn.cursor() as cursor:
+            # Первая команда транзакции: переход на снимок координатора
+            cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+            with open(path, 'wb') as f:
+                cursor.copy_expert(
+                    cursor.mogrify(
+                        "COPY (SELECT * FROM users WHERE id >= %s AND id < %s ORDER BY id) "
+                        "TO STDOUT WITH (FORMAT csv, HEADER)",
+                        (start, end)
+                    ).decode(),
+                    f
+                )
+            rows = cursor.rowcount
+    finally:
+        conn.rollback()
+        conn.set_session(isolation_level='DEFAULT', readonly=False)
+
+    return {
+        'part': number,
+        'file': os.path.basename(path),
+        'id_from': start,
+        'id_to': end,
+        'rows': rows,
+        'bytes': os.path.getsize(path),
+    }
+
+def export_parallel(directory, workers=4, parts=None):
+    """
+    Полная выгрузка users частями в нескольких процессах из одного снимка
+
+    Координатор держит открытой транзакцию REPEATABLE READ, снимок которой
+    экспортирован через pg_export_snapshot(); воркеры подключаются к этому
+    снимку, поэтому изменения во время выгрузки не попадают ни в одну часть.
+    Манифест записывается последним: его наличие означает полную выгрузку.
+
+    Args:
+        directory (str): Каталог для файлов частей и manifest.json
+        workers (int): Количество процессов
+        parts (int, optional): Количество частей (по умолчанию workers * 4,
+            чтобы неравномерные части не простаивали воркеры)
+
+    Returns:
+        dict: Манифест или None при ошибке
+    """
+    # Общий снимок возможен только в пределах одной базы
+    error = unsupported_with_shards("Параллельный экспорт")
+    if error:
+        print(f"❌ {error}", file=sys.stderr)
+        return None
+
+    db = Database()
+    if not db.connect():
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    conn = db.connection
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    started = time.perf_counter()
+
+    try:
+        cursor = db.cursor
+        cursor.execute("SELECT pg_export_snapshot(), now()")
+        snapshot, snapshot_time = cursor.fetchone()
+        cursor.execute("SELECT MIN(id), MAX(id) FROM users")
+        min_id, max_id = cursor.fetchone()
+        cursor.execute("SELECT * FROM users LIMIT 0")
+        columns = [column[0] for column in cursor.description]
+
+        tasks = [
+            (snapshot, number, start, end,
+             os.path.join(directory, f"users.part-{number:04d}.csv"))
+            for number, (start, end) in enumerate(id_ranges(min_id, max_id, parts or workers * 4), 1)
+        ]
+
+        print(f"🔄 Выгрузка {len(tasks)} частей в {workers} процессах...", file=sys.stderr)
+        results = []
+        with Pool(processes=workers, initializer=_init_export_worker, initargs=(db.config,)) as pool:
+            for part in pool.imap_unordered(export_part, tasks):
+                results.append(part)
+                print(f"\r   Частей: {len(results)}/{len(tasks)}", end="", file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+    except Exception as e:
+        print(f"\n❌ Ошибка параллельного экспорта: {e}", file=sys.stderr)
+        return None
+    finally:
+        conn.rollback()
+        conn.set_session(isolation_level='DEFAULT', readonly=False)
+        db.disconnect()
+
+    results.sort(key=lambda part: part['part'])
+    manifest = {
+        'table': 'users',
+        'snapshot_time': snapshot_time.isoformat(),
+        'format': 'csv',
+        'header': True,
+        'columns': columns,
+        'rows': sum(part['rows'] for part in results),
+        'bytes': sum(part['bytes'] for part in results),
+        'parts': results,
+    }
+    manifest_path = os.path.join(directory, 'manifest.json')
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Выгружено строк: {manifest['rows']} ({manifest['bytes'] / 1024 / 1024:.1f} МБ) "
+          f"за {elapsed:.1f} с", file=sys.stderr)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт пользователей")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    incremental = commands.add_parser('incremental', help="изменения после сохраненного водяного знака")
+    incremental.add_argument('--consumer', required=True, help="имя потребителя")
+    incremental.add_argument('--output', help="файл NDJSON (по умолчанию stdout)")
+    incremental.add_argument('--batch-size', type=int, default=1000, help="строк в одной порции")
+
+    parallel = commands.add_parser('parallel', help="полная выгрузка частями в нескольких процессах")
+    parallel.add_argument('--output-dir', required=True, help="каталог для частей и manifest.json")
+    parallel.add_argument('--workers', type=int, default=4, help="количество процессов (по умолчанию 4)")
+    parallel.add_argument('--parts', type=int, help="количество частей (по умолчанию workers * 4)")
+
+    args = parser.parse_args()
+    Database.verbose = False
+
+    if args.command == 'parallel':
+        if args.workers <= 0 or (args.parts is not None and args.parts <= 0):
+            print("❌ Параметры должны быть положительными числами")
+            sys.exit(1)
+        if export_parallel(args.output_dir, args.workers, args.parts) is None:
+            sys.exit(1)
+    elif args.command == 'incremental':
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                count = export_incremental(args.consumer, f, args.batch_size)
+        else:
+            count = export_incremental(args.consumer, sys.stdout, args.batch_size)
+        if count < 0:
+            sys.exit(1)
+        print(f"✅ Выгружено изменений: {count}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,605 @@
+"""
+Очередь фоновых задач в PostgreSQL
+
+Длительные операции (массовое удаление, импорт, генерация данных,
+экспорт, миграции и заполнение справочника шардов, обслуживание таблиц) ставятся в таблицу jobs (миграция 010) и
+выполняются воркерами - процессами на любом количестве машин:
+
+    python jobs.py enqueue purge '{"status": "inactive"}'
+    python jobs.py worker --processes 4
+    python jobs.py status
+
+Воркер забирает задачу запросом с FOR UPDATE SKIP LOCKED, поэтому
+воркеры не мешают друг другу и не получают одну задачу дважды. Взятая
+задача "невидима" для других воркеров до locked_until; пока обработчик
+работает, фоновый поток продлевает этот срок. Если воркер или машина
+упали, по истечении срока задачу заберет другой воркер. Ошибка приводит
+к повтору с экспоненциальной задержкой, после max_attempts попыток
+задача получает статус failed.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import psycopg2
+
+from database import Database
+
+# Срок невидимости взятой задачи (секунды) и период его продления
+DEFAULT_VISIBILITY_TIMEOUT = 300
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Задержка перед повтором: RETRY_BASE_DELAY * 2^(попытка - 1) секунд
+RETRY_BASE_DELAY = 10
+
+# Минимальный интервал записи прогресса в базу (секунды)
+PROGRESS_INTERVAL = 1.0
+
+# Пауза перед повторным подключением воркера: удваивается до максимума
+RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 30.0
+
+# Обработчики задач: вид -> функция(payload, job)
+HANDLERS = {}
+
+def job_handler(kind):
+    """Регистрация обработчика задач вида kind"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def retry_delay(attempt):
+    """Задержка перед повторной попыткой в секундах"""
+    return RETRY_BASE_DELAY * 2 ** max(0, attempt - 1)
+
+def enqueue(kind, payload=None, max_attempts=3, delay=0):
+    """
+    Постановка задачи в очередь
+
+    Args:
+        kind (str): Вид задачи (ключ HANDLERS)
+        payload (dict, optional): Параметры задачи
+        max_attempts (int): Максимальное количество попыток
+        delay (float): Отложить выполнение на delay секунд
+
+    Returns:
+        int: ID задачи или None при ошибке
+    """
+    if kind not in HANDLERS:
+        print(f"❌ Неизвестный вид задачи: {kind}")
+        return None
+
+    db = Database('jobs')
+    if not db.connect():
+        return None
+    try:
+        row = db.fetch_one(
+            """
+            INSERT INTO jobs (kind, payload, max_attempts, run_after)
+            VALUES (%s, %s, %s, now() + %s * INTERVAL '1 second')
+            RETURNING id
+            """,
+            (kind, json.dumps(payload or {}), max_attempts, delay)
+        )
+        db.connection.commit()
+        return row[0] if row else None
+    finally:
+        db.disconnect()
+
+class Job:
+    """Задача, взятая воркером"""
+
+    def __init__(self, worker, id, kind, payload, attempts, max_attempts):
+        self.worker = worker
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self._last_progress = 0.0
+
+    def report(self, done, total=None, message=None):
+        """
+        Сохранение прогресса задачи (не чаще PROGRESS_INTERVAL)
+
+        Args:
+            done (int): Выполнено единиц работы
+            total (int, optional): Всего единиц работы
+            message (str, optional): Комментарий
+        """
+        now = time.monotonic()
+        if now - self._last_progress < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self._last_progress = now
+        progress = {'done': done, 'total': total, 'message': message, 'at': time.time()}
+        self.worker.execute(
+            "UPDATE jobs SET progress = %s WHERE id = %s AND locked_by = %s",
+            (json.dumps(progress), self.id, self.worker.name)
+        )
+
+class Worker:
+    """Воркер: цикл взятия и выполнения задач"""
+
+    def __init__(self, name=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                 poll_interval=DEFAULT_POLL_INTERVAL, kinds=None):
+        """
+        Args:
+            name (str, optional): Имя воркера (по умолчанию хост:pid)
+            visibility_timeout (float): Срок невидимости взятой задачи в секундах
+            poll_interval (float): Пауза при пустой очереди в секундах
+            kinds (list, optional): Виды задач, которые берет воркер (по умолчанию все)
+        """
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.kinds = list(kinds or HANDLERS)
+        self.stop_event = threading.Event()
+        self.db = Database('jobs')
+        self._lock = threading.Lock()
+
+    def execute(self, query, params=None, fetch=False):
+        """
+        Запрос через подключение воркера (общее для основного потока и продления)
+
+        Raises:
+            psycopg2.Error: Ошибка запроса или потеря подключения
+        """
+        with self._lock:
+            if self.db.connection is None:
+                raise psycopg2.InterfaceError("Нет подключения к базе данных")
+            try:
+                self.db.cursor.execute(query, params)
+                row = self.db.cursor.fetchone() if fetch else None
+                self.db.connection.commit()
+            except psycopg2.Error:
+                if not self.db.connection.closed:
+                    self.db.connection.rollback()
+                raise
+            return row if fetch else True
+
+    def reconnect(self):
+        """Закрытие текущего подключения (если есть) и новое подключение"""
+        with self._lock:
+            try:
+                self.db.disconnect()
+            except psycopg2.Error:
+                pass
+            self.db.connection = None
+            return self.db.connect()
+
+    def claim(self):
+        """
+        Взятие следующей готовой задачи
+
+        Returns:
+            Job: Задача или None, если очередь пуста
+        """
+        row = self.execute(
+            """
+            UPDATE jobs SET
+                status = 'running',
+                attempts = attempts + 1,
+                locked_by = %s,
+                locked_until = now() + %s * INTERVAL '1 second',
+                started_at = COALESCE(started_at, now())
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE kind = ANY(%s)
+                  AND ((status = 'queued' AND run_after <= now())
+                       OR (status = 'running' AND locked_until < now()))
+                ORDER BY run_after, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, kind, payload, attempts, max_attempts
+            """,
+            (self.name, self.visibility_timeout, self.kinds),
+            fetch=True
+        )
+        return Job(self, *row) if row else None
+
+    def _extend_lock(self, job, done):
+        """Продление невидимости задачи, пока обработчик работает"""
+        while not done.wait(self.visibility_timeout / 3):
+            try:
+                self.execute(
+                    "UPDATE jobs SET locked_until = now() + %s * INTERVAL '1 second' "
+                    "WHERE id = %s AND locked_by = %s",
+                    (self.visibility_timeout, job.id, self.name)
+                )
+            except psycopg2.Error as e:
+                # Подключение восстановит основной цикл после завершения обработчика
+                print(f"⚠️ [{self.name}] Не удалось продлить задачу {job.id}: {e}")
+                return
+
+    def complete(self, job, result):
+        self.execute(
+            """
+            UPDATE jobs SET status = 'done', result = %s, finished_at = now(),
+                locked_by = NULL, locked_until = NULL, last_error = NULL
+            WHERE id = %s AND locked_by = %s
+            """,
+            (json.dumps(result, default=str), job.id, self.name)
+        )
+
+    def fail(self, job, error):
+        """Повтор с задержкой или окончательная ошибка после max_attempts попыток"""
+        if job.attempts < job.max_attempts:
+            self.execute(
+                """
+                UPDATE jobs SET status = 'queued', last_error = %s,
+                    run_after = now() + %s * INTERVAL '1 second',
+                    locked_by = NULL, locked_until = NULL
+                WHERE id = %s AND locked_by = %s
+                """,
+                (error, retry_delay(job.attempts), job.id, self.name)
+            )
+        else:
+            self.execute(
+                """
+                UPDATE jobs SET status = 'failed', last_error = %s, finished_at = now(),
+                    locked_by = NULL, locked_until = NULL
+                WHERE id = %s AND locked_by = %s
+                """,
+                (error, job.id, self.name)
+            )
+
+    def run_job(self, job):
+        """Выполнение одной задачи"""
+        if job.attempts > job.max_attempts:
+            # Задача досталась после истечения срока невидимости (воркер упал)
+            self.fail(job, "Превышено количество попыток (воркер не завершил задачу)")
+            return False
+
+        print(f"🔄 [{self.name}] Задача {job.id} ({job.kind}), попытка {job.attempts}/{job.max_attempts}")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._extend_lock, args=(job, done), daemon=True)
+        heartbeat.start()
+        started = time.perf_counter()
+        try:
+            result = HANDLERS[job.kind](job.payload, job)
+        except Exception as e:
+            done.set()
+            heartbeat.join()
+            print(f"❌ [{self.name}] Задача {job.id} завершилась с ошибкой: {e}")
+            self.fail(job, f"{type(e).__name__}: {e}")
+            return False
+        done.set()
+        heartbeat.join()
+        self.complete(job, result)
+        print(f"✅ [{self.name}] Задача {job.id} выполнена за {time.perf_counter() - started:.1f} с")
+        return True
+
+    def run(self, max_jobs=None):
+        """
+        Цикл воркера до stop() (или до выполнения max_jobs задач)
+
+        Потеря подключения (перезапуск сервера, pg_terminate_backend) не
+        завершает воркер: он переподключается с нарастающей паузой. Задача,
+        результат которой не удалось записать, остается взятой и после
+        истечения срока невидимости выполняется повторно.
+
+        Returns:
+            int: Количество выполненных задач
+        """
+        processed = 0
+        delay = RECONNECT_DELAY
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    if self.db.connection is None or self.db.connection.closed:
+                        if not self.reconnect():
+                            raise psycopg2.OperationalError("База данных недоступна")
+                    job = self.claim()
+                    if job is None:
+                        self.stop_event.wait(self.poll_interval)
+                        continue
+                    self.run_job(job)
+                except psycopg2.Error as e:
+                    print(f"⚠️ [{self.name}] Ошибка подключения к базе: {str(e).strip()}; "
+                          f"повтор через {delay:.0f} с")
+                    self.stop_event.wait(delay)
+                    delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                    continue
+                delay = RECONNECT_DELAY
+                processed += 1
+                if max_jobs is not None and processed >= max_jobs:
+                    break
+        finally:
+            try:
+                self.db.disconnect()
+            except psycopg2.Error:
+                pass
+        return processed
+
+    def stop(self):
+        """Остановка после текущей задачи"""
+        self.stop_event.set()
+
+def _worker_process(visibility_timeout, poll_interval, kinds):
+    """Точка входа процесса-воркера"""
+    Database.verbose = False
+    worker = Worker(visibility_timeout=visibility_timeout, poll_interval=poll_interval, kinds=kinds)
+    # SIGTERM - завершить текущую задачу и выйти; Ctrl+C обрабатывает родитель
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker.run()
+
+def run_workers(processes=4, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT,
+                poll_interval=DEFAULT_POLL_INTERVAL, kinds=None):
+    """
+    Запуск процессов-воркеров на этой машине до Ctrl+C
+
+    Процессы не демонические: обработчики (например, seed и export)
+    могут сами запускать пулы процессов.
+    """
+    def start(index):
+        process = multiprocessing.Process(target=_worker_process, name=f"job-worker-{index}",
+                                          args=(visibility_timeout, poll_interval, kinds))
+        process.start()
+        return process
+
+    workers = [start(i) for i in range(processes)]
+    print(f"🚀 Запущено воркеров: {processes} (Ctrl+C - остановить после текущих задач)")
+    try:
+        while True:
+            for index, process in enumerate(workers):
+                # Упавший воркер заменяется новым; завершенный по SIGTERM - нет
+                if process.exitcode not in (None, 0, -signal.SIGTERM):
+                    print(f"⚠️ Воркер {process.name} завершился с кодом {process.exitcode}, перезапуск")
+                    workers[index] = start(index)
+            if not any(process.is_alive() for process in workers):
+                break
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🔄 Остановка воркеров...")
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+
+# --- Встроенные обработчики ---
+
+@job_handler('purge')
+def _purge(payload, job):
+    from datetime import datetime
+    from models import User
+
+    created_before = payload.get('created_before')
+    deleted = User.purge(
+        status=payload.get('status'),
+        created_before=datetime.fromisoformat(created_before) if created_before else None,
+        batch_size=payload.get('batch_size', 1000),
+        pause=payload.get('pause', 0.05),
+        max_replication_lag=payload.get('max_replication_lag'),
+        progress=job.report
+    )
+    return {'deleted': deleted}
+
+@job_handler('delete_many')
+def _delete_many(payload, job):
+    from models import User
+
+    deleted = User.delete_many(
+        payload['ids'],
+        batch_size=payload.get('batch_size', 1000),
+        pause=payload.get('pause', 0.05),
+        progress=job.report
+    )
+    return {'deleted': deleted}
+
+@job_handler('import')
+def _import(payload, job):
+    """Импорт операций NDJSON (см. batch.py); результаты пишутся в output"""
+    from batch import run_batch
+
+    with open(payload['input'], encoding='utf-8') as lines, \
+            open(payload.get('output', os.devnull), 'w', encoding='utf-8') as out:
+        ok = run_batch(lines, out)
+    if not ok and payload.get('fail_on_errors'):
+        raise RuntimeError("Часть операций импорта завершилась с ошибкой")
+    return {'ok': ok}
+
+@job_handler('seed')
+def _seed(payload, job):
+    from seed import seed_users
+
+    if not seed_users(payload['count'], payload.get('workers', 4),
+                      payload.get('chunk_size', 50_000), payload.get('seed', 42)):
+        raise RuntimeError("Ошибка генерации данных")
+    return {'count': payload['count']}
+
+@job_handler('export')
+def _export(payload, job):
+    from export import export_parallel
+
+    manifest = export_parallel(payload['output_dir'], payload.get('workers', 4), payload.get('parts'))
+    if manifest is None:
+        raise RuntimeError("Ошибка параллельного экспорта")
+    return {'rows': manifest['rows'], 'parts': len(manifest['parts'])}
+
+@job_handler('dedup')
+def _dedup(payload, job):
+    """Поиск почти-дубликатов; отчет о кандидатах на слияние пишется в output"""
+    from dedup import DEFAULT_THRESHOLD, DEFAULT_WINDOW, find_duplicates, merge_report
+
+    result = find_duplicates(payload.get('threshold', DEFAULT_THRESHOLD),
+                             payload.get('window', DEFAULT_WINDOW),
+                             payload.get('workers', 4), progress=job.report)
+    if result is None:
+        raise RuntimeError("Ошибка поиска дубликатов")
+    report = merge_report(result)
+    with open(payload['output'], 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return {'users': result['records'], 'comparisons': result['comparisons'], 'groups': len(report)}
+
+@job_handler('maintenance')
+def _maintenance(payload, job):
+    from maintenance import run_maintenance
+
+    if not run_maintenance():
+        raise RuntimeError("Ошибка обслуживания таблиц")
+    return {}
+
+@job_handler('migrate')
+def _migrate(payload, job):
+    """Применение миграций (на всех шардах), включая заполнение данных в них"""
+    from migrations import run_all_migrations
+
+    if not run_all_migrations():
+        raise RuntimeError("Ошибка применения миграций")
+    return {}
+
+@job_handler('reindex')
+def _reindex(payload, job):
+    """Заполнение справочника email существующими пользователями шардов"""
+    from sharding import get_shard_map, rebuild_email_index
+
+    shard_map = get_shard_map()
+    if shard_map is None:
+        raise RuntimeError("Шардирование не настроено (ключ 'shards' в db_config.py)")
+    return dict(rebuild_email_index(shard_map, payload.get('batch_size', 10000)))
+
+# --- Состояние очереди ---
+
+def queue_status():
+    """
+    Глубина очереди, пропускная способность и выполняемые задачи
+
+    Returns:
+        dict: counts, oldest_queued, throughput, running, failures или None
+    """
+    db = Database('jobs')
+    if not db.connect():
+        return None
+
+    def fetch(method, query):
+        # Пустой результат при ошибке не должен выглядеть как пустая очередь;
+        # все запросы состояния возвращают хотя бы одну строку или список
+        result = method(query)
+        if db.last_error is not None or result is None:
+            raise db.last_error or ConnectionError("База данных недоступна")
+        return result
+
+    try:
+        counts = fetch(db.fetch_all, "SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status ORDER BY kind, status")
+        oldest = fetch(
+            db.fetch_one,
+            "SELECT EXTRACT(EPOCH FROM now() - MIN(run_after)) FROM jobs "
+            "WHERE status = 'queued' AND run_after <= now()"
+        )[0]
+        throughput = fetch(db.fetch_all, """
+            SELECT m.minutes, COUNT(j.id),
+                   AVG(EXTRACT(EPOCH FROM j.finished_at - j.started_at))
+            FROM (VALUES (1), (5), (15), (60)) AS m(minutes)
+            LEFT JOIN jobs j ON j.status = 'done'
+                AND j.finished_at > now() - m.minutes * INTERVAL '1 minute'
+            GROUP BY m.minutes ORDER BY m.minutes
+        """)
+        running = fetch(db.fetch_all, """
+            SELECT id, kind, locked_by, attempts, progress,
+                   EXTRACT(EPOCH FROM now() - started_at), locked_until < now()
+            FROM jobs WHERE status = 'running' ORDER BY id
+        """)
+        failures = fetch(db.fetch_all, """
+            SELECT id, kind, attempts, last_error FROM jobs
+            WHERE last_error IS NOT NULL AND status IN ('queued', 'failed')
+            ORDER BY id DESC LIMIT 5
+        """)
+    except (ConnectionError, psycopg2.Error) as e:
+        print(f"❌ Ошибка чтения очереди задач: {e}")
+        return None
+    finally:
+        db.disconnect()
+    return {
+        'counts': counts,
+        'oldest_queued': oldest,
+        'throughput': throughput,
+        'running': running,
+        'failures': failures,
+    }
+
+def print_status():
+    """Вывод состояния очереди"""
+    status = queue_status()
+    if status is None:
+        return
+
+    print("📊 Очередь задач:")
+    print("-" * 50)
+    if not status['counts']:
+        print("   Очередь пуста")
+    for kind, state, count in status['counts']:
+        print(f"   {kind:<12} {state:<8} {count}")
+    if status['oldest_queued'] is not None:
+        print(f"   Самая старая ожидающая задача: {float(status['oldest_queued']):.0f} с")
+
+    print("\n⚡ Пропускная способность:")
+    for minutes, done, avg_duration in status['throughput']:
+        duration = f", в среднем {float(avg_duration):.1f} с" if avg_duration is not None else ""
+        print(f"   {minutes:>2} мин: {done} задач ({done / minutes:.2f}/мин){duration}")
+
+    if status['running']:
+        print("\n🔄 Выполняются:")
+        for job_id, kind, worker, attempts, progress, elapsed, expired in status['running']:
+            done = ""
+            if progress:
+                total = f"/{progress['total']}" if progress.get('total') else ""
+                done = f", прогресс {progress['done']}{total}"
+            stale = " ⚠️ срок истек" if expired else ""
+            print(f"   #{job_id} {kind} на {worker}, попытка {attempts}, "
+                  f"{float(elapsed or 0):.0f} с{done}{stale}")
+
+    if status['failures']:
+        print("\n❌ Последние ошибки:")
+        for job_id, kind, attempts, error in status['failures']:
+            print(f"   #{job_id} {kind} (попыток: {attempts}): {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Очередь фоновых задач")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    worker = commands.add_parser('worker', help="запустить воркеры на этой машине")
+    worker.add_argument('--processes', type=int, default=4, help="количество процессов (по умолчанию 4)")
+    worker.add_argument('--visibility-timeout', type=float, default=DEFAULT_VISIBILITY_TIMEOUT,
+                        help="срок невидимости взятой задачи, с")
+    worker.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="пауза при пустой очереди, с")
+    worker.add_argument('--kinds', help="виды задач через запятую (по умолчанию все)")
+
+    submit = commands.add_parser('enqueue', help="поставить задачу в очередь")
+    submit.add_argument('kind', choices=sorted(HANDLERS), help="вид задачи")
+    submit.add_argument('payload', nargs='?', default='{}', help="параметры задачи в JSON")
+    submit.add_argument('--max-attempts', type=int, default=3, help="максимум попыток")
+    submit.add_argument('--delay', type=float, default=0, help="отложить на N секунд")
+
+    commands.add_parser('status', help="глубина очереди и пропускная способность")
+
+    args = parser.parse_args()
+    Database.verbose = False
+
+    if args.command == 'worker':
+        kinds = args.kinds.split(',') if args.kinds else None
+        run_workers(args.processes, args.visibility_timeout, args.poll_interval, kinds)
+    elif args.command == 'enqueue':
+        try:
+            payload = json.loads(args.payload)
+        except ValueError as e:
+            print(f"❌ Некорректный JSON: {e}")
+            sys.exit(1)
+        job_id = enqueue(args.kind, payload, args.max_attempts, args.delay)
+        if job_id is None:
+            sys.exit(1)
+        print(f"✅ Задача #{job_id} поставлена в очередь")
+    else:
+        print_status()
+
+if __name__ == "__main__":
+    main()
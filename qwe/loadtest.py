@@ -0,0 +1,343 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+
+from database import Database
+from models import User
+
+# Смесь операций по умолчанию: название -> вес
+DEFAULT_MIX = "get=80,update=15,insert=4,delete=1"
+
+class LoadContext:
+    """
+    Общее состояние воркеров одного процесса
+
+    Удаляются только пользователи, созданные самим тестом,
+    поэтому существующие данные не затрагиваются.
+    """
+
+    def __init__(self, id_range, seed, url=None):
+        self.id_range = id_range
+        # Адрес HTTP сервиса (api.py); None - вызовы моделей напрямую
+        self.url = url.rstrip('/') if url else None
+        self.rng = random.Random(seed)
+        self.created_ids = deque()
+        self.lock = threading.Lock()
+
+    def randint(self, low, high):
+        # Общий генератор с зерном: прогон воспроизводим
+        with self.lock:
+            return self.rng.randint(low, high)
+
+    def random_id(self):
+        return self.randint(*self.id_range)
+
+def op_get(ctx):
+    """
+    Чтение случайного пользователя через User.get_by_id
+
+    get_by_id возвращает None и при ошибке базы, поэтому отсутствие
+    пользователя считается ошибкой: диапазон ID должен содержать только
+    существующих пользователей (например, загруженных seed.py).
+    """
+    return User.get_by_id(ctx.random_id()) is not None
+
+def op_update(ctx):
+    """Чтение и сохранение случайного пользователя (None - ошибка, см. op_get)"""
+    user = User.get_by_id(ctx.random_id())
+    if user is None:
+        return False
+    user.age = ctx.randint(16, 85)
+    return user.save()
+
+def op_insert(ctx):
+    """Создание нового пользователя"""
+    user = User(name="Нагрузочный тест", email=f"load-{uuid.uuid4().hex}@example.com", age=30)
+    if not user.save():
+        return False
+    with ctx.lock:
+        ctx.created_ids.append(user.id)
+    return True
+
+def op_delete(ctx):
+    """Удаление пользователя, созданного нагрузочным тестом"""
+    with ctx.lock:
+        user_id = ctx.created_ids.popleft() if ctx.created_ids else None
+    if user_id is None:
+        return op_insert(ctx)
+    return User(name=None, email=None, age=None, id=user_id).delete()
+
+OPERATIONS = {
+    'get': op_get,
+    'update': op_update,
+    'insert': op_insert,
+    'delete': op_delete,
+}
+
+def _http(ctx, method, path, payload=None):
+    """
+    Запрос к HTTP сервису
+
+    Returns:
+        tuple: (HTTP-статус, тело ответа JSON или None)
+    """
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(ctx.url + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            body = response.read()
+            return response.status, json.loads(body) if body else None
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def http_get(ctx):
+    status, _ = _http(ctx, 'GET', f"/users/{ctx.random_id()}")
+    return status in (200, 404)
+
+def http_update(ctx):
+    status, _ = _http(ctx, 'PATCH', f"/users/{ctx.random_id()}", {'age': ctx.randint(16, 85)})
+    return status in (200, 404)
+
+def http_insert(ctx):
+    status, user = _http(ctx, 'POST', "/users", {
+        'name': "Нагрузочный тест", 'email': f"load-{uuid.uuid4().hex}@example.com", 'age': 30
+    })
+    if status != 201:
+        return False
+    with ctx.lock:
+        ctx.created_ids.append(user['id'])
+    return True
+
+def http_delete(ctx):
+    with ctx.lock:
+        user_id = ctx.created_ids.popleft() if ctx.created_ids else None
+    if user_id is None:
+        return http_insert(ctx)
+    status, _ = _http(ctx, 'DELETE', f"/users/{user_id}")
+    return status == 204
+
+# Те же операции через HTTP сервис (--url)
+HTTP_OPERATIONS = {
+    'get': http_get,
+    'update': http_update,
+    'insert': http_insert,
+    'delete': http_delete,
+}
+
+def parse_mix(text):
+    """
+    Разбор смеси операций вида "get=80,update=20"
+
+    Returns:
+        tuple: (список названий, список весов)
+    """
+    names, weights = [], []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Неизвестная операция: {name}")
+        weight = float(weight or 1)
+        if weight < 0:
+            raise ValueError(f"Отрицательный вес операции: {name}")
+        names.append(name)
+        weights.append(weight)
+    if not any(weights):
+        raise ValueError("Сумма весов операций должна быть больше нуля")
+    return names, weights
+
+def _timed(ctx, name, scheduled, started_at, samples):
+    """Выполнение операции с записью задержки от запланированного момента"""
+    operations = HTTP_OPERATIONS if ctx.url else OPERATIONS
+    try:
+        ok = bool(operations[name](ctx))
+    except Exception:
+        ok = False
+    finished = time.perf_counter()
+    # Задержка считается от запланированного времени, а не от фактического
+    # старта - так очередь перед пулом видна в хвостовых задержках
+    samples.append((scheduled - started_at, name, finished - scheduled, ok))
+
+def run_worker(args):
+    """
+    Генерация нагрузки в одном процессе
+
+    Args:
+        args (tuple): (mix, threads, duration, rate, id_range, seed, url)
+            rate=None - закрытая модель (потоки работают без пауз),
+            иначе открытая модель с пуассоновским потоком заявок;
+            url - адрес HTTP сервиса или None для вызова моделей
+
+    Returns:
+        list: Замеры (время от старта, операция, задержка, успех)
+    """
+    mix, threads, duration, rate, id_range, seed, url = args
+    names, weights = parse_mix(mix)
+    Database.verbose = False
+    ctx = LoadContext(id_range, seed, url)
+    samples = []
+    started_at = time.perf_counter()
+    deadline = started_at + duration
+
+    if rate is None:
+        def loop(thread_seed):
+            rng = random.Random(thread_seed)
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                _timed(ctx, name, time.perf_counter(), started_at, samples)
+
+        workers = [threading.Thread(target=loop, args=(seed + i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return samples
+
+    rng = random.Random(seed)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        scheduled = started_at
+        while True:
+            scheduled += rng.expovariate(rate)
+            if scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            name = rng.choices(names, weights)[0]
+            executor.submit(_timed, ctx, name, scheduled, started_at, samples)
+
+    return samples
+
+def percentile(sorted_values, p):
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def summarize(samples, interval):
+    """
+    Агрегация замеров по интервалам времени
+
+    Returns:
+        list: Словари со статистикой для каждого интервала
+    """
+    buckets = {}
+    for offset, name, latency, ok in samples:
+        buckets.setdefault(int(offset // interval), []).append((latency, ok))
+
+    rows = []
+    for bucket in sorted(buckets):
+        entries = buckets[bucket]
+        latencies = sorted(latency for latency, _ in entries)
+        errors = sum(1 for _, ok in entries if not ok)
+        rows.append({
+            'time': bucket * interval,
+            'ops': len(entries) / interval,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'errors': errors / len(entries),
+        })
+    return rows
+
+def print_report(samples, interval, duration):
+    """Вывод отчета: динамика по интервалам, итог и разбивка по операциям"""
+    print(f"\n{'t, с':>6} {'оп/с':>9} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'ошибки':>8}")
+    for row in summarize(samples, interval):
+        print(f"{row['time']:>6.0f} {row['ops']:>9.1f} {row['p50'] * 1000:>9.2f} "
+              f"{row['p95'] * 1000:>9.2f} {row['p99'] * 1000:>9.2f} {row['errors']:>8.1%}")
+
+    print("\n📊 Итог по операциям:")
+    by_name = {}
+    for _, name, latency, ok in samples:
+        by_name.setdefault(name, []).append((latency, ok))
+    for name, entries in sorted(by_name.items()):
+        latencies = sorted(latency for latency, _ in entries)
+        errors = sum(1 for _, ok in entries if not ok)
+        print(f"   {name:<7} {len(entries) / duration:>9.1f} оп/с  "
+              f"p50={percentile(latencies, 50) * 1000:.2f} мс  "
+              f"p95={percentile(latencies, 95) * 1000:.2f} мс  "
+              f"p99={percentile(latencies, 99) * 1000:.2f} мс  "
+              f"ошибки={errors / len(entries):.1%}")
+
+    total_errors = sum(1 for *_, ok in samples if not ok)
+    print(f"\n✅ Всего операций: {len(samples)}, {len(samples) / duration:.1f} оп/с, "
+          f"ошибок: {total_errors}")
+
+def run_load(mix=DEFAULT_MIX, processes=1, threads=8, duration=30, rate=None,
+             id_range=(1, 1000), seed=42, interval=1.0, url=None):
+    """
+    Запуск нагрузочного теста
+
+    Args:
+        mix (str): Смесь операций, например "get=80,update=20"
+        processes (int): Количество процессов
+        threads (int): Количество потоков в каждом процессе
+        duration (float): Длительность теста в секундах
+        rate (float, optional): Целевая частота заявок (оп/с) для открытой модели
+        id_range (tuple): Диапазон ID для чтения и обновления
+        seed (int): Зерно генератора
+        interval (float): Интервал агрегации отчета в секундах
+        url (str, optional): Адрес HTTP сервиса (api.py) вместо прямых вызовов моделей
+
+    Returns:
+        list: Все замеры
+    """
+    parse_mix(mix)
+    if duration <= 0:
+        raise ValueError("Длительность должна быть больше нуля")
+    if rate is not None and rate <= 0:
+        raise ValueError("Частота заявок должна быть больше нуля")
+    if processes < 1 or threads < 1:
+        raise ValueError("Количество процессов и потоков должно быть не меньше 1")
+    per_process_rate = rate / processes if rate else None
+    tasks = [
+        (mix, threads, duration, per_process_rate, id_range, seed + i * 1000, url)
+        for i in range(processes)
+    ]
+
+    mode = f"открытая модель, {rate} оп/с" if rate else "закрытая модель"
+    target = f"; сервис {url}" if url else ""
+    print(f"🚀 Нагрузка: {mix}; {processes} проц. x {threads} потоков; {duration} с; {mode}{target}")
+
+    if processes == 1:
+        samples = run_worker(tasks[0])
+    else:
+        with Pool(processes=processes) as pool:
+            samples = [s for chunk in pool.map(run_worker, tasks) for s in chunk]
+
+    print_report(samples, interval, duration)
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование моделей User")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f"смесь операций (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument('--processes', type=int, default=1, help="количество процессов")
+    parser.add_argument('--threads', type=int, default=8, help="потоков в каждом процессе")
+    parser.add_argument('--duration', type=float, default=30, help="длительность в секундах")
+    parser.add_argument('--rate', type=float, help="частота заявок, оп/с (открытая модель)")
+    parser.add_argument('--min-id', type=int, default=1, help="минимальный ID для чтения (все ID диапазона должны существовать)")
+    parser.add_argument('--max-id', type=int, default=1000, help="максимальный ID для чтения")
+    parser.add_argument('--seed', type=int, default=42, help="зерно генератора")
+    parser.add_argument('--interval', type=float, default=1.0, help="интервал отчета в секундах")
+    parser.add_argument('--url', help="адрес HTTP сервиса api.py, например http://127.0.0.1:8080")
+    args = parser.parse_args()
+
+    try:
+        run_load(args.mix, args.processes, args.threads, args.duration, args.rate,
+                 (args.min_id, args.max_id), args.seed, args.interval, args.url)
+    except ValueError as e:
+        print(f"❌ {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
+import argparse
+import sys
+
 from models import User
-from database import test_connection
+from database import QueryTimeoutError, get_timeout_stats, test_connection
 
 def main():
     """
@@ -37,27 +40,30 @@ def show_main_menu():
         
         choice = input("Выберите действие (1-9): ").strip()
         
-        if choice == '1':
-            show_all_users()
-        elif choice == '2':
-            add_new_user()
-        elif choice == '3':
-            find_user_by_id()
-        elif choice == '4':
-            find_user_by_email()
-        elif choice == '5':
-            update_user()
-        elif choice == '6':
-            delete_user()
-        elif choice == '7':
-            show_extended_info()
-        elif choice == '8':
-            run_migrations_menu()
-        elif choice == '9':
-            print("\n👋 До свидания! Спасибо за использование приложения!")
-            break
-        else:
-            print("❌ Неверный выбор. Пожалуйста, выберите действие от 1 до 9.")
+        try:
+            if choice == '1':
+                show_all_users()
+            elif choice == '2':
+                add_new_user()
+            elif choice == '3':
+                find_user_by_id()
+            elif choice == '4':
+                find_user_by_email()
+            elif choice == '5':
+                update_user()
+            elif choice == '6':
+                delete_user()
+            elif choice == '7':
+                show_extended_info()
+            elif choice == '8':
+                run_migrations_menu()
+            elif choice == '9':
+                print("\n👋 До свидания! Спасибо за использование приложения!")
+                break
+            else:
+                print("❌ Неверный выбор. Пожалуйста, выберите действие от 1 до 9.")
+        except QueryTimeoutError as e:
+            print(f"⏱️ {e}. Попробуйте позже или увеличьте бюджет в db_config.py")
 
 def show_all_users():
     """Показать всех пользователей из базы данных"""
@@ -306,65 +312,43 @@ def delete_user():
 
 def show_extended_info():
     """Показать расширенную информацию о пользователях"""
-    from database import Database
+    from sharding import gather_stats, get_shard_map
     
     print("\n📊 Расширенная информация:")
     print("-" * 30)
     
-    db = Database()
-    if not db.connect():
-        return
-    
     try:
-        # Статистика по пользователям
-        db.cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = db.cursor.fetchone()[0]
-        
-        db.cursor.execute("SELECT COUNT(*) FROM users WHERE age IS NOT NULL")
-        users_with_age = db.cursor.fetchone()[0]
-        
-        db.cursor.execute("SELECT AVG(age) FROM users WHERE age IS NOT NULL")
-        avg_age = db.cursor.fetchone()[0]
+        # Статистика собирается параллельно со всех шардов
+        # (или из единственной базы, если шардирование не настроено)
+        stats = gather_stats()
         
-        # Проверяем наличие дополнительных таблиц
-        db.cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'user_profiles'
-            )
-        """)
-        has_profiles = db.cursor.fetchone()[0]
-        
-        if has_profiles:
-            db.cursor.execute("SELECT COUNT(*) FROM user_profiles")
-            profiles_count = db.cursor.fetchone()[0]
-        else:
-            profiles_count = 0
-            
         print(f"📈 Общая статистика:")
-        print(f"   Всего пользователей: {total_users}")
-        print(f"   Пользователей с указанным возрастом: {users_with_age}")
-        if avg_age:
-            print(f"   Средний возраст: {avg_age:.1f} лет")
-        print(f"   Создано профилей: {profiles_count}")
+        print(f"   Всего пользователей: {stats['total_users']}")
+        print(f"   Пользователей с указанным возрастом: {stats['users_with_age']}")
+        if stats['avg_age']:
+            print(f"   Средний возраст: {stats['avg_age']:.1f} лет")
+        print(f"   Создано профилей: {stats['profiles_count']}")
+        
+        shard_map = get_shard_map()
+        if shard_map is not None:
+            print(f"   Шардов: {len(shard_map.shards)}")
         
         # Последние добавленные пользователи
         print(f"\n🆕 Последние пользователи:")
-        db.cursor.execute("""
-            SELECT name, email, created_at 
-            FROM users 
-            ORDER BY created_at DESC 
-            LIMIT 3
-        """)
-        recent_users = db.cursor.fetchall()
-        
-        for i, (name, email, created_at) in enumerate(recent_users, 1):
+        for i, (name, email, created_at) in enumerate(stats['recent_users'], 1):
             print(f"   {i}. {name} ({email}) - {created_at}")
             
+        # Превышения бюджетов задержки за время работы приложения
+        timeouts = get_timeout_stats()
+        if timeouts:
+            print(f"\n⏱️ Превышения бюджета задержки:")
+            for operation, count in sorted(timeouts.items()):
+                print(f"   {operation}: {count}")
+            
+    except QueryTimeoutError:
+        raise
     except Exception as e:
         print(f"❌ Ошибка при получении статистики: {e}")
-    finally:
-        db.disconnect()
 
 def run_migrations_menu():
     """Запуск меню миграций"""
@@ -410,5 +394,37 @@ def save_user_profile(user_id, phone):
     finally:
         db.disconnect()
 
+def run_batch_mode(argv):
+    """
+    Неинтерактивный режим: выполнение операций из файла или stdin
+    
+    Args:
+        argv (list): Аргументы командной строки
+        
+    Returns:
+        int: Код завершения процесса
+    """
+    parser = argparse.ArgumentParser(description="Приложение для работы с PostgreSQL")
+    parser.add_argument(
+        '--batch', metavar='FILE', required=True,
+        help="файл с операциями в формате NDJSON ('-' - читать из stdin)"
+    )
+    args = parser.parse_args(argv)
+    
+    from batch import run_batch
+    
+    if args.batch == '-':
+        success = run_batch(sys.stdin)
+    else:
+        try:
+            with open(args.batch, encoding='utf-8') as f:
+                success = run_batch(f)
+        except OSError as e:
+            print(f"❌ Не удалось открыть файл операций: {e}", file=sys.stderr)
+            return 2
+    return 0 if success else 1
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_batch_mode(sys.argv[1:]))
     main()
\ No newline at end of file
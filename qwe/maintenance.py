@@ -0,0 +1,435 @@
+"""
+Обслуживание таблиц: статистика планировщика, раздувание и VACUUM
+
+После миграций с заполнением данных (004) и массовой загрузки статистика
+планировщика устаревает до прихода autovacuum, и первые запросы получают
+плохие планы. Модуль выполняет ANALYZE только для таблиц, в которых с
+прошлого анализа изменилась заметная доля строк, показывает раздувание
+таблиц и индексов и мертвые строки из pg_stat_user_tables и запускает
+VACUUM для таблиц, где мертвых строк накопилось слишком много.
+"""
+import argparse
+import math
+import threading
+import time
+
+from database import Database
+
+# Таблицы приложения, которые обслуживаются по умолчанию
+MAINTAINED_TABLES = ('users', 'user_profiles', 'audit_log')
+
+# ANALYZE, если с прошлого анализа изменилось больше этой доли строк
+ANALYZE_CHANGED_RATIO = 0.1
+ANALYZE_MIN_CHANGED = 1000
+
+# VACUUM, если мертвых строк больше этой доли и этого количества
+VACUUM_DEAD_RATIO = 0.2
+VACUUM_MIN_DEAD = 1000
+
+# Размеры служебных структур страницы (байты): заголовок страницы,
+# указатель на строку (ItemId), заголовок строки таблицы (HeapTupleHeader),
+# заголовок записи индекса (IndexTupleData) и его битовая карта NULL,
+# служебная область страницы B-дерева (BTPageOpaqueData)
+_PAGE_HEADER = 24
+_ITEM_ID = 4
+_HEAP_TUPLE_HEADER = 23
+_INDEX_TUPLE_HEADER = 8
+_INDEX_NULL_BITMAP = 4
+_BTREE_PAGE_SPECIAL = 16
+
+# Заполнение страниц по умолчанию (проценты)
+_HEAP_FILLFACTOR = 100
+_BTREE_FILLFACTOR = 90
+
+def _align(size, maxalign):
+    """Округление размера вверх до кратного MAXALIGN"""
+    return -(-int(math.ceil(size)) // maxalign) * maxalign
+
+def expected_table_bytes(reltuples, data_width, columns, has_nulls,
+                         block_size=8192, fillfactor=_HEAP_FILLFACTOR, maxalign=8):
+    """
+    Ожидаемый размер таблицы без раздувания
+
+    Оценка в духе запросов раздувания на основе pg_stats: строка - заголовок
+    с битовой картой NULL и данные средней ширины, каждое выровнено по
+    MAXALIGN, плюс указатель ItemId; страница - без заголовка и с учетом
+    fillfactor.
+
+    Args:
+        reltuples (float): Оценка количества строк (pg_class.reltuples)
+        data_width (float): Средняя ширина данных строки без NULL (pg_stats)
+        columns (int): Количество столбцов (размер битовой карты NULL)
+        has_nulls (bool): Есть ли в таблице NULL
+
+    Returns:
+        int: Ожидаемый размер в байтах
+    """
+    header = _HEAP_TUPLE_HEADER + (math.ceil(columns / 8) if has_nulls else 0)
+    tuple_size = _align(header, maxalign) + _align(data_width, maxalign) + _ITEM_ID
+    per_page = max(1, math.floor((block_size - _PAGE_HEADER) * fillfactor / 100 / tuple_size))
+    return math.ceil(max(reltuples, 0) / per_page) * block_size
+
+def expected_btree_bytes(reltuples, data_width, has_nulls,
+                         block_size=8192, fillfactor=_BTREE_FILLFACTOR, maxalign=8):
+    """
+    Ожидаемый размер B-дерева без раздувания (листовые страницы и метастраница)
+
+    Args:
+        reltuples (float): Оценка количества записей индекса
+        data_width (float): Средняя ширина ключа без NULL (pg_stats столбцов)
+        has_nulls (bool): Есть ли NULL в столбцах ключа
+
+    Returns:
+        int: Ожидаемый размер в байтах
+    """
+    header = _INDEX_TUPLE_HEADER + (_INDEX_NULL_BITMAP if has_nulls else 0)
+    tuple_size = _align(header, maxalign) + _align(data_width, maxalign) + _ITEM_ID
+    usable = (block_size - _PAGE_HEADER - _BTREE_PAGE_SPECIAL) * fillfactor / 100
+    per_page = max(1, math.floor(usable / tuple_size))
+    return (1 + math.ceil(max(reltuples, 0) / per_page)) * block_size
+
+def leaf_density_bloat(index_bytes, avg_leaf_density, fillfactor=_BTREE_FILLFACTOR):
+    """
+    Раздувание B-дерева по плотности листовых страниц (pgstatindex)
+
+    Returns:
+        tuple: (лишние байты, доля лишнего места 0..1)
+    """
+    if not index_bytes or avg_leaf_density is None or math.isnan(avg_leaf_density):
+        return 0, 0.0
+    bloat = max(0.0, 1 - avg_leaf_density / fillfactor)
+    return int(index_bytes * bloat), bloat
+
+def estimate_bloat(actual_bytes, expected_bytes):
+    """
+    Оценка раздувания по фактическому и ожидаемому размеру
+
+    Returns:
+        tuple: (лишние байты, доля лишнего места 0..1) или (None, None),
+            если ожидаемый размер неизвестен (нет статистики)
+    """
+    if expected_bytes is None:
+        return None, None
+    if not actual_bytes:
+        return 0, 0.0
+    wasted = max(0, actual_bytes - int(expected_bytes))
+    return wasted, wasted / actual_bytes
+
+def needs_analyze(live_tuples, modified_since_analyze, never_analyzed=False):
+    """Устарела ли статистика планировщика таблицы"""
+    if never_analyzed:
+        return live_tuples > 0 or modified_since_analyze > 0
+    return (modified_since_analyze >= ANALYZE_MIN_CHANGED
+            and modified_since_analyze > ANALYZE_CHANGED_RATIO * max(live_tuples, 1))
+
+def needs_vacuum(live_tuples, dead_tuples):
+    """Нужна ли таблице очистка мертвых строк"""
+    return (dead_tuples >= VACUUM_MIN_DEAD
+            and dead_tuples > VACUUM_DEAD_RATIO * (live_tuples + dead_tuples))
+
+def table_health(db, tables=MAINTAINED_TABLES):
+    """
+    Состояние таблиц по pg_stat_user_tables и оценке раздувания
+
+    Раздувание оценивается по pg_class и pg_stats (expected_table_bytes,
+    expected_btree_bytes); для B-деревьев при установленном расширении
+    pgstattuple используется точная плотность листьев из pgstatindex.
+    Без статистики (таблица не анализировалась) оценка - None.
+
+    Returns:
+        list: Словари table, live, dead, modified, last_analyze, last_vacuum,
+            size, wasted, bloat, indexes ([(индекс, размер, лишние байты, доля)])
+    """
+    block_size, version, has_pgstattuple = db.fetch_one(
+        "SELECT current_setting('block_size')::int, version(), "
+        "EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pgstattuple')"
+    )
+    maxalign = 8 if '64-bit' in version else 4
+
+    rows = db.fetch_all(
+        """
+        SELECT s.relname, s.n_live_tup, s.n_dead_tup, s.n_mod_since_analyze,
+               GREATEST(s.last_analyze, s.last_autoanalyze),
+               GREATEST(s.last_vacuum, s.last_autovacuum),
+               pg_table_size(s.relid),
+               c.relpages::bigint, c.reltuples,
+               (SELECT option_value::int FROM pg_options_to_table(c.reloptions)
+                WHERE option_name = 'fillfactor'),
+               (SELECT COUNT(*) FROM pg_attribute a
+                WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped),
+               st.columns, st.width, st.has_nulls
+        FROM pg_stat_user_tables s
+        JOIN pg_class c ON c.oid = s.relid
+        LEFT JOIN LATERAL (
+            SELECT COUNT(*) AS columns, SUM(avg_width * (1 - null_frac)) AS width,
+                   COALESCE(MAX(null_frac), 0) > 0 AS has_nulls
+            FROM pg_stats
+            WHERE schemaname = s.schemaname AND tablename = s.relname AND NOT inherited
+        ) st ON true
+        WHERE s.schemaname = current_schema() AND s.relname = ANY(%s)
+        ORDER BY s.relname
+        """,
+        (list(tables),)
+    )
+
+    indexes = {}
+    for (table, index, oid, method, pages, reltuples, fillfactor,
+         key_columns, stats_columns, width, has_nulls) in db.fetch_all(
+        """
+        SELECT t.relname, i.relname, i.oid, am.amname, i.relpages::bigint, i.reltuples,
+               (SELECT option_value::int FROM pg_options_to_table(i.reloptions)
+                WHERE option_name = 'fillfactor'),
+               x.indnatts, COUNT(st.attname),
+               SUM(st.avg_width * (1 - st.null_frac)),
+               COALESCE(MAX(st.null_frac), 0) > 0
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_class t ON t.oid = x.indrelid
+        JOIN pg_am am ON am.oid = i.relam
+        LEFT JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(x.indkey) AND a.attnum > 0
+        LEFT JOIN pg_stats st ON st.schemaname = current_schema() AND NOT st.inherited
+             AND st.tablename = t.relname AND st.attname = a.attname
+        WHERE t.relnamespace = current_schema()::regnamespace AND t.relname = ANY(%s)
+        GROUP BY t.relname, i.relname, i.oid, am.amname, i.relpages, i.reltuples, i.reloptions, x.indnatts
+        ORDER BY t.relname, i.relname
+        """,
+        (list(tables),)
+    ):
+        actual = pages * block_size
+        fillfactor = fillfactor or _BTREE_FILLFACTOR
+        if method == 'btree' and has_pgstattuple:
+            density = db.fetch_one("SELECT avg_leaf_density FROM pgstatindex(%s::regclass)", (oid,))
+            wasted, bloat = leaf_density_bloat(actual, density[0] if density else None, fillfactor)
+        elif method == 'btree' and stats_columns == key_columns and reltuples >= 0:
+            # Выражения в индексе и столбцы без статистики не оцениваются
+            expected = expected_btree_bytes(reltuples, width or 0, has_nulls,
+                                            block_size, fillfactor, maxalign)
+            wasted, bloat = estimate_bloat(actual, expected)
+        else:
+            wasted, bloat = None, None
+        indexes.setdefault(table, []).append((index, actual, wasted, bloat))
+
+    health = []
+    for (table, live, dead, modified, analyzed, vacuumed, size, pages, reltuples,
+         fillfactor, columns, stats_columns, width, has_nulls) in rows:
+        expected = None
+        if stats_columns and reltuples >= 0:
+            expected = expected_table_bytes(reltuples, width or 0, columns, has_nulls, block_size,
+                                            fillfactor or _HEAP_FILLFACTOR, maxalign)
+        wasted, bloat = estimate_bloat(pages * block_size, expected)
+        health.append({
+            'table': table,
+            'live': live,
+            'dead': dead,
+            'modified': modified,
+            'last_analyze': analyzed,
+            'last_vacuum': vacuumed,
+            'size': size,
+            'wasted': wasted,
+            'bloat': bloat,
+            'indexes': indexes.get(table, []),
+        })
+    return health
+
+def analyze_tables(tables=MAINTAINED_TABLES, force=False, config=None):
+    """
+    ANALYZE таблиц с устаревшей статистикой
+
+    Вызывается после миграций и массовой загрузки данных.
+
+    Args:
+        tables (iterable): Таблицы для проверки
+        force (bool): Анализировать без проверки количества изменений
+        config (dict, optional): Конфигурация подключения
+
+    Returns:
+        list: Проанализированные таблицы или None при ошибке подключения
+    """
+    db = Database('maintenance', config=config)
+    if not db.connect():
+        return None
+
+    analyzed = []
+    try:
+        for item in table_health(db, tables):
+            if force or needs_analyze(item['live'], item['modified'], item['last_analyze'] is None):
+                started = time.perf_counter()
+                if db.execute_query(f"ANALYZE {item['table']}"):
+                    analyzed.append(item['table'])
+                    print(f"✅ ANALYZE {item['table']}: {time.perf_counter() - started:.2f} с")
+    finally:
+        db.disconnect()
+    return analyzed
+
+def vacuum_tables(tables=None, config=None):
+    """
+    VACUUM (ANALYZE) таблиц с большим количеством мертвых строк
+
+    Args:
+        tables (iterable, optional): Таблицы для очистки (по умолчанию -
+            таблицы из MAINTAINED_TABLES, которым это нужно)
+        config (dict, optional): Конфигурация подключения
+
+    Returns:
+        list: Очищенные таблицы или None при ошибке подключения
+    """
+    db = Database('maintenance', config=config)
+    if not db.connect():
+        return None
+
+    vacuumed = []
+    try:
+        if tables is None:
+            tables = [item['table'] for item in table_health(db)
+                      if needs_vacuum(item['live'], item['dead'])]
+        # VACUUM нельзя выполнять внутри транзакции
+        db.connection.rollback()
+        db.connection.autocommit = True
+        for table in tables:
+            started = time.perf_counter()
+            try:
+                db.cursor.execute(f"VACUUM (ANALYZE) {table}")
+                vacuumed.append(table)
+                print(f"✅ VACUUM {table}: {time.perf_counter() - started:.2f} с")
+            except Exception as e:
+                print(f"❌ Ошибка VACUUM {table}: {e}")
+        db.connection.autocommit = False
+    finally:
+        db.disconnect()
+    return vacuumed
+
+def run_maintenance(config=None):
+    """
+    Обслуживание: ANALYZE устаревших таблиц и VACUUM раздутых
+
+    Args:
+        config (dict, optional): Конфигурация одной базы (по умолчанию -
+            все базы из db_config.py, по одной на шард)
+
+    Returns:
+        bool: True если все базы обслужены
+    """
+    ok = True
+    for target in _targets(config):
+        analyzed = analyze_tables(config=target)
+        vacuumed = vacuum_tables(config=target)
+        if analyzed is None or vacuumed is None:
+            ok = False
+        elif not analyzed and not vacuumed:
+            print(f"✅ {target['database']}: обслуживание не требуется")
+    return ok
+
+def _format_size(size):
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if size < 1024 or unit == 'ГБ':
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def _bloat_text(wasted, bloat):
+    if bloat is None:
+        return "нет оценки (нет статистики)"
+    return f"~{bloat:.0%} ({_format_size(wasted)})"
+
+def print_report(config=None):
+    """
+    Отчет о мертвых строках, раздувании и актуальности статистики
+
+    Args:
+        config (dict, optional): Конфигурация одной базы (по умолчанию -
+            все базы из db_config.py, по одной на шард)
+    """
+    for target in _targets(config):
+        _print_database_report(target)
+
+def _print_database_report(config):
+    db = Database('maintenance', config=config)
+    if not db.connect():
+        return
+    try:
+        health = table_health(db)
+    finally:
+        db.disconnect()
+
+    print(f"📊 Состояние таблиц ({config['database']}):")
+    print("-" * 50)
+    for item in health:
+        marks = []
+        if needs_analyze(item['live'], item['modified'], item['last_analyze'] is None):
+            marks.append("нужен ANALYZE")
+        if needs_vacuum(item['live'], item['dead']):
+            marks.append("нужен VACUUM")
+        print(f"{item['table']}: {_format_size(item['size'])}, строк ~{item['live']}, "
+              f"мертвых {item['dead']}, изменено с анализа {item['modified']}"
+              + (f" ⚠️ {', '.join(marks)}" if marks else ""))
+        print(f"   Раздувание: {_bloat_text(item['wasted'], item['bloat'])}")
+        print(f"   Последний ANALYZE: {item['last_analyze'] or 'никогда'}, "
+              f"VACUUM: {item['last_vacuum'] or 'никогда'}")
+        for index, size, wasted, bloat in item['indexes']:
+            print(f"   Индекс {index}: {_format_size(size)}, раздувание {_bloat_text(wasted, bloat)}")
+
+def start_scheduler(interval=3600, config=None):
+    """
+    Периодическое обслуживание в фоновом потоке
+
+    Args:
+        interval (float): Период между проверками в секундах
+        config (dict, optional): Конфигурация подключения
+
+    Returns:
+        threading.Event: Установите его, чтобы остановить планировщик
+    """
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            try:
+                run_maintenance(config)
+            except Exception as e:
+                print(f"❌ Ошибка обслуживания: {e}")
+
+    threading.Thread(target=loop, name='maintenance', daemon=True).start()
+    return stop
+
+def _configs():
+    """Конфигурации всех баз (по одной на шард)"""
+    try:
+        from db_config import DB_CONFIG
+    except ImportError:
+        print("❌ Файл конфигурации не найден. Запустите setup.py сначала.")
+        return []
+    from sharding import shard_configs
+    return shard_configs(DB_CONFIG)
+
+def _targets(config):
+    """Базы для обслуживания: переданная или все базы из конфигурации"""
+    return [config] if config is not None else _configs()
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание таблиц: ANALYZE, VACUUM и раздувание")
+    parser.add_argument('command', choices=['report', 'analyze', 'vacuum', 'run'],
+                        help="report - состояние таблиц, analyze - обновить статистику, "
+                             "vacuum - очистить мертвые строки, run - analyze + vacuum")
+    parser.add_argument('--force', action='store_true', help="ANALYZE всех таблиц без проверки")
+    parser.add_argument('--every', type=float,
+                        help="повторять run каждые N секунд (вместо планировщика cron)")
+    args = parser.parse_args()
+    Database.verbose = False
+
+    while True:
+        # Меню миграций вызывает те же функции без config - тоже по всем базам
+        if args.command == 'report':
+            print_report()
+        elif args.command == 'run':
+            run_maintenance()
+        else:
+            for config in _configs():
+                if args.command == 'analyze':
+                    analyze_tables(force=args.force, config=config)
+                else:
+                    vacuum_tables(config=config)
+        if not args.every:
+            break
+        time.sleep(args.every)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,24 @@
 import psycopg2
 from datetime import datetime
+import hashlib
 import os
 import sys
+import textwrap
+
+# Базовая схема: все миграции, объединенные командой squash
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.sql')
+
+# Миграции базы-справочника шардов (sharding.py): при шардировании
+# применяются только к ней
+DIRECTORY_MIGRATIONS = ('009_create_shard_directory',)
+
+MIGRATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS migrations (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL UNIQUE,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
 
 class DatabaseMigrator:
     def __init__(self, config):
@@ -41,13 +58,7 @@ class DatabaseMigrator:
     def create_migrations_table(self):
         """Создание таблицы для отслеживания миграций"""
         try:
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS migrations (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL UNIQUE,
-                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            self.cursor.execute(MIGRATIONS_TABLE_SQL)
             self.connection.commit()
             print("✅ Таблица миграций создана/проверена")
             return True
@@ -167,20 +178,384 @@ def get_migrations():
             """,
             "CREATE INDEX IF NOT EXISTS idx_audit_log_table_record ON audit_log(table_name, record_id)",
             "CREATE INDEX IF NOT EXISTS idx_audit_log_changed_at ON audit_log(changed_at)"
+        ],
+        
+        '006_create_change_notify_triggers': [
+            """
+            CREATE OR REPLACE FUNCTION notify_user_change() RETURNS trigger AS $$
+            DECLARE
+                payload JSONB;
+                changed TEXT[];
+                row_data JSONB;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    row_data := to_jsonb(OLD);
+                ELSE
+                    row_data := to_jsonb(NEW);
+                END IF;
+                
+                IF TG_OP = 'UPDATE' THEN
+                    -- Только реально изменившиеся поля; пустое обновление не публикуется
+                    SELECT array_agg(n.key ORDER BY n.key) INTO changed
+                    FROM jsonb_each(row_data) n
+                    WHERE n.value IS DISTINCT FROM to_jsonb(OLD) -> n.key;
+                    IF changed IS NULL THEN
+                        RETURN NULL;
+                    END IF;
+                END IF;
+                
+                payload := jsonb_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', lower(TG_OP),
+                    'id', row_data -> 'id'
+                );
+                IF changed IS NOT NULL THEN
+                    payload := payload || jsonb_build_object('changed', to_jsonb(changed));
+                END IF;
+                IF row_data ? 'user_id' THEN
+                    payload := payload || jsonb_build_object('user_id', row_data -> 'user_id');
+                END IF;
+                
+                PERFORM pg_notify('user_changes', payload::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS users_notify_change ON users",
+            """
+            CREATE TRIGGER users_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON users
+            FOR EACH ROW EXECUTE FUNCTION notify_user_change()
+            """,
+            "DROP TRIGGER IF EXISTS user_profiles_notify_change ON user_profiles",
+            """
+            CREATE TRIGGER user_profiles_notify_change
+            AFTER INSERT OR UPDATE OR DELETE ON user_profiles
+            FOR EACH ROW EXECUTE FUNCTION notify_user_change()
+            """
+        ],
+        
+        '007_add_updated_at_and_tombstones': [
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+            "UPDATE users SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)",
+            "COMMENT ON COLUMN users.updated_at IS 'Время последнего изменения (поддерживается триггером)'",
+            """
+            CREATE OR REPLACE FUNCTION set_users_updated_at() RETURNS trigger AS $$
+            BEGIN
+                -- now() - время начала транзакции: инкрементальный экспорт
+                -- опирается на то, что незакоммиченные строки не старше
+                -- начала самой старой пишущей транзакции
+                IF NEW IS DISTINCT FROM OLD THEN
+                    NEW.updated_at := now();
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS users_set_updated_at ON users",
+            """
+            CREATE TRIGGER users_set_updated_at
+            BEFORE UPDATE ON users
+            FOR EACH ROW EXECUTE FUNCTION set_users_updated_at()
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users(updated_at, id)",
+            """
+            CREATE TABLE IF NOT EXISTS users_tombstones (
+                user_id INTEGER PRIMARY KEY,
+                deleted_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_users_tombstones_deleted_at ON users_tombstones(deleted_at, user_id)",
+            """
+            CREATE OR REPLACE FUNCTION record_user_tombstone() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO users_tombstones (user_id, deleted_at) VALUES (OLD.id, now())
+                ON CONFLICT (user_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """,
+            "DROP TRIGGER IF EXISTS users_record_tombstone ON users",
+            """
+            CREATE TRIGGER users_record_tombstone
+            AFTER DELETE ON users
+            FOR EACH ROW EXECUTE FUNCTION record_user_tombstone()
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS export_watermarks (
+                consumer VARCHAR(100) PRIMARY KEY,
+                updated_at TIMESTAMP,
+                last_id INTEGER,
+                deleted_at TIMESTAMP,
+                deleted_id INTEGER,
+                saved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        ],
+        
+        '008_create_slow_query_log_table': [
+            """
+            CREATE TABLE IF NOT EXISTS slow_query_log (
+                id SERIAL PRIMARY KEY,
+                query TEXT NOT NULL,
+                duration_ms NUMERIC(12, 2),
+                operation VARCHAR(100),
+                plan JSONB,
+                captured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_slow_query_log_captured_at ON slow_query_log(captured_at)"
+        ],
+        
+        '009_create_shard_directory': [
+            # Применяется только к базе-справочнику шардов (DIRECTORY_MIGRATIONS);
+            # без шардирования - к единственной базе
+            """
+            DO $$
+            BEGIN
+                CREATE SEQUENCE IF NOT EXISTS global_user_id_seq;
+                -- Глобальные ID начинаются после уже существующих локальных
+                -- (в отдельной базе справочника таблицы users нет)
+                IF to_regclass('users') IS NOT NULL THEN
+                    PERFORM setval('global_user_id_seq',
+                                   (SELECT COALESCE(MAX(id), 0) + 1 FROM users), false);
+                END IF;
+            END;
+            $$
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS user_email_index (
+                email VARCHAR(100) PRIMARY KEY,
+                user_id INTEGER NOT NULL UNIQUE
+            )
+            """
+        ],
+        
+        '010_create_jobs_table': [
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id BIGSERIAL PRIMARY KEY,
+                kind VARCHAR(100) NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{}',
+                status VARCHAR(20) NOT NULL DEFAULT 'queued'
+                    CHECK (status IN ('queued', 'running', 'done', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                run_after TIMESTAMP NOT NULL DEFAULT now(),
+                locked_by VARCHAR(100),
+                locked_until TIMESTAMP,
+                progress JSONB,
+                result JSONB,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+            """,
+            "COMMENT ON TABLE jobs IS 'Очередь фоновых задач (см. jobs.py)'",
+            # Частичные индексы: воркеры ищут только готовые и просроченные задачи
+            "CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs(run_after, id) WHERE status = 'queued'",
+            "CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs(locked_until) WHERE status = 'running'",
+            "CREATE INDEX IF NOT EXISTS idx_jobs_finished_at ON jobs(finished_at) WHERE finished_at IS NOT NULL"
+        ],
+        
+        '011_skip_noop_change_notify': [
+            # После 007 триггер обновляет updated_at при любом UPDATE, и пустое
+            # обновление (SET name = name) публиковалось как изменение
+            """
+            CREATE OR REPLACE FUNCTION notify_user_change() RETURNS trigger AS $$
+            DECLARE
+                payload JSONB;
+                changed TEXT[];
+                row_data JSONB;
+                old_data JSONB;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    row_data := to_jsonb(OLD);
+                ELSE
+                    row_data := to_jsonb(NEW);
+                END IF;
+                
+                IF TG_OP = 'UPDATE' THEN
+                    -- Только реально изменившиеся поля без служебного updated_at;
+                    -- пустое обновление не публикуется
+                    old_data := to_jsonb(OLD);
+                    SELECT array_agg(n.key ORDER BY n.key) INTO changed
+                    FROM jsonb_each(row_data) n
+                    WHERE n.key <> 'updated_at' AND n.value IS DISTINCT FROM old_data -> n.key;
+                    IF changed IS NULL THEN
+                        RETURN NULL;
+                    END IF;
+                END IF;
+                
+                payload := jsonb_build_object(
+                    'table', TG_TABLE_NAME,
+                    'op', lower(TG_OP),
+                    'id', row_data -> 'id'
+                );
+                IF changed IS NOT NULL THEN
+                    payload := payload || jsonb_build_object('changed', to_jsonb(changed));
+                END IF;
+                IF row_data ? 'user_id' THEN
+                    payload := payload || jsonb_build_object('user_id', row_data -> 'user_id');
+                END IF;
+                
+                PERFORM pg_notify('user_changes', payload::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+            """
         ]
     }
     
     return migrations
 
-def run_all_migrations():
-    """Запуск всех миграций"""
+def migration_checksum(sql_commands):
+    """Контрольная сумма команд миграции (для проверки актуальности базовой схемы)"""
+    return hashlib.sha1(repr(list(sql_commands)).encode('utf-8')).hexdigest()[:12]
+
+def is_data_statement(sql):
+    """Команда миграции, изменяющая данные, а не схему (заполнение, пересчет)"""
+    words = textwrap.dedent(sql).split(None, 1)
+    return bool(words) and words[0].upper() in ('INSERT', 'UPDATE', 'DELETE')
+
+def squash_migrations(path=BASELINE_PATH):
+    """
+    Объединение таблицы users и всех миграций в один SQL-файл базовой схемы
+    
+    Файл выполняется на новой базе одним запросом и отмечает все вошедшие
+    миграции как примененные. В него входит только схема: команды заполнения
+    данных (is_data_statement) на новой пустой базе ничего не меняют.
+    Заголовок содержит контрольные суммы миграций: если миграцию изменят
+    после squash, базовая схема не будет использована.
+    
+    Args:
+        path (str): Путь к файлу базовой схемы
+        
+    Returns:
+        list: Названия вошедших миграций
+    """
+    from setup import USERS_TABLE_SQL
+    
+    migrations = get_migrations()
+    lines = [
+        "-- Базовая схема: таблица users и миграции, объединенные командой",
+        "-- python migrations.py squash. Не редактируйте вручную.",
+    ]
+    for name, sql_commands in migrations.items():
+        lines.append(f"-- migration: {name} {migration_checksum(sql_commands)}")
+    lines.append("")
+    
+    statements = [USERS_TABLE_SQL, MIGRATIONS_TABLE_SQL]
+    for name, sql_commands in migrations.items():
+        statements.append(f"-- {name}")
+        statements.extend(sql for sql in sql_commands if not is_data_statement(sql))
+    names = ", ".join(f"('{name}')" for name in migrations)
+    statements.append(f"INSERT INTO migrations (name) VALUES {names} ON CONFLICT (name) DO NOTHING")
+    
+    for statement in statements:
+        statement = textwrap.dedent(statement).strip()
+        lines.append(statement if statement.startswith('--') else statement + ";")
+    
+    # Переводы строк - как у остальных файлов репозитория (CRLF)
+    with open(path, 'w', encoding='utf-8', newline='\r\n') as f:
+        f.write("\n".join(lines) + "\n")
+    
+    print(f"✅ Базовая схема сохранена в {path} (миграций: {len(migrations)})")
+    return list(migrations)
+
+def load_baseline(path=BASELINE_PATH):
+    """
+    Чтение базовой схемы с проверкой актуальности
+    
+    Returns:
+        tuple: (названия миграций, SQL) или None, если файла нет или
+            вошедшие в него миграции с тех пор изменились
+    """
+    if not os.path.exists(path):
+        return None
+        
+    with open(path, encoding='utf-8') as f:
+        sql = f.read()
+        
+    migrations = get_migrations()
+    names = []
+    for line in sql.splitlines():
+        if not line.startswith("-- migration: "):
+            continue
+        name, checksum = line[len("-- migration: "):].split()
+        if name not in migrations or migration_checksum(migrations[name]) != checksum:
+            print(f"⚠️ Базовая схема устарела (миграция {name} изменена), "
+                  f"выполните: python migrations.py squash")
+            return None
+        names.append(name)
+    return names, sql
+
+def apply_baseline(cursor, path=BASELINE_PATH):
+    """
+    Создание схемы новой базы из базовой схемы одним запросом
+    
+    Args:
+        cursor: Курсор подключения к новой базе (коммит - за вызывающим)
+        path (str): Путь к файлу базовой схемы
+        
+    Returns:
+        list: Примененные миграции или None (тогда используются обычные миграции)
+    """
+    baseline = load_baseline(path)
+    if baseline is None:
+        return None
+    names, sql = baseline
     try:
-        from db_config import DB_CONFIG
-    except ImportError:
-        print("❌ Файл конфигурации не найден. Запустите setup.py сначала.")
-        return False
+        cursor.execute(sql)
+    except Exception as e:
+        print(f"⚠️ Не удалось применить базовую схему: {e}")
+        return None
+    return names
+
+def run_all_migrations(config=None):
+    """
+    Запуск всех миграций (на каждом шарде, если настроено шардирование)
+    
+    Args:
+        config (dict, optional): Конфигурация подключения (по умолчанию из db_config.py)
+    """
+    if config is None:
+        try:
+            from db_config import DB_CONFIG
+            config = DB_CONFIG
+        except ImportError:
+            print("❌ Файл конфигурации не найден. Запустите setup.py сначала.")
+            return False
+            
+    from sharding import ShardMap, shard_configs
+    
+    targets = shard_configs(config)
+    if not config.get('shards'):
+        return run_migrations_on(targets[0])
         
-    migrator = DatabaseMigrator(DB_CONFIG)
+    # Миграции справочника - только в базе справочника
+    directory = ShardMap(config).directory
+    shard_migrations = [name for name in get_migrations() if name not in DIRECTORY_MIGRATIONS]
+    for shard_config in targets:
+        print(f"\n🗄️ Шард: {shard_config['database']}")
+        names = None if shard_config == directory else shard_migrations
+        if not run_migrations_on(shard_config, names):
+            return False
+    if directory not in targets:
+        print(f"\n🗄️ Справочник: {directory['database']}")
+        return run_migrations_on(directory, DIRECTORY_MIGRATIONS)
+    return True
+
+def run_migrations_on(config, names=None):
+    """
+    Применение миграций к одной базе данных
+    
+    Args:
+        config (dict): Конфигурация подключения к базе
+        names (iterable, optional): Применяемые миграции (по умолчанию все)
+    """
+    migrator = DatabaseMigrator(config)
     
     if not migrator.connect():
         return False
@@ -190,14 +565,19 @@ def run_all_migrations():
         return False
         
     migrations = get_migrations()
+    if names is not None:
+        migrations = {name: migrations[name] for name in migrations if name in names}
     applied_count = 0
+    newly_applied = 0
     
     print(f"🔄 Найдено {len(migrations)} миграций для применения")
     print("=" * 50)
     
     for migration_name, sql_commands in migrations.items():
+        already_applied = migrator.is_migration_applied(migration_name)
         if migrator.run_migration(migration_name, sql_commands):
             applied_count += 1
+            newly_applied += not already_applied
         else:
             print(f"❌ Прерывание миграций из-за ошибки")
             migrator.disconnect()
@@ -208,6 +588,11 @@ def run_all_migrations():
     print("=" * 50)
     print(f"🎉 Миграции завершены! Применено: {applied_count}/{len(migrations)}")
     
+    if newly_applied:
+        # Миграции меняют схему и заполняют данные - обновляем статистику планировщика
+        from maintenance import analyze_tables
+        analyze_tables(config=config)
+    
     return applied_count == len(migrations)
 
 def show_migration_status():
@@ -287,6 +672,34 @@ def rollback_last_migration():
             ],
             '005_create_audit_log_table': [
                 "DROP TABLE IF EXISTS audit_log"
+            ],
+            '006_create_change_notify_triggers': [
+                "DROP TRIGGER IF EXISTS users_notify_change ON users",
+                "DROP TRIGGER IF EXISTS user_profiles_notify_change ON user_profiles",
+                "DROP FUNCTION IF EXISTS notify_user_change()"
+            ],
+            '007_add_updated_at_and_tombstones': [
+                "DROP TABLE IF EXISTS export_watermarks",
+                "DROP TRIGGER IF EXISTS users_record_tombstone ON users",
+                "DROP FUNCTION IF EXISTS record_user_tombstone()",
+                "DROP TABLE IF EXISTS users_tombstones",
+                "DROP TRIGGER IF EXISTS users_set_updated_at ON users",
+                "DROP FUNCTION IF EXISTS set_users_updated_at()",
+                "ALTER TABLE users DROP COLUMN IF EXISTS updated_at"
+            ],
+            '008_create_slow_query_log_table': [
+                "DROP TABLE IF EXISTS slow_query_log"
+            ],
+            '009_create_shard_directory': [
+                "DROP TABLE IF EXISTS user_email_index",
+                "DROP SEQUENCE IF EXISTS global_user_id_seq"
+            ],
+            '010_create_jobs_table': [
+                "DROP TABLE IF EXISTS jobs"
+            ],
+            '011_skip_noop_change_notify': [
+                # Функция уведомлений в редакции миграции 006
+                get_migrations()['006_create_change_notify_triggers'][0]
             ]
         }
         
@@ -322,9 +735,11 @@ def main():
         print("1. Применить все миграции")
         print("2. Показать статус миграций")
         print("3. Откатить последнюю миграцию")
-        print("4. Выход")
+        print("4. Состояние таблиц (мертвые строки, раздувание)")
+        print("5. Обслуживание таблиц (ANALYZE, VACUUM)")
+        print("6. Выход")
         
-        choice = input("Ваш выбор (1-4): ").strip()
+        choice = input("Ваш выбор (1-6): ").strip()
         
         if choice == '1':
             run_all_migrations()
@@ -337,10 +752,19 @@ def main():
             else:
                 print("❌ Откат отменен")
         elif choice == '4':
+            from maintenance import print_report
+            print_report()
+        elif choice == '5':
+            from maintenance import run_maintenance
+            run_maintenance()
+        elif choice == '6':
             print("👋 Выход из системы миграций")
             break
         else:
             print("❌ Неверный выбор")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if sys.argv[1:] == ['squash']:
+        squash_migrations()
+    else:
+        main()
\ No newline at end of file
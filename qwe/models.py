@@ -1,6 +1,188 @@
-from database import Database
+import json
+import select
+import time
+
+import psycopg2
+
+from database import Database, QueryTimeoutError
+from query import UserQuery
+from sharding import fetch_all_users, get_shard_map
+from write_behind import WriteBehindBuffer
+
+# Канал LISTEN/NOTIFY, в который триггеры миграции 006 публикуют изменения
+CHANGE_CHANNEL = 'user_changes'
+
+# Максимальное число ключей в одном запросе = ANY(%s) пакетных выборок
+LOOKUP_CHUNK_SIZE = 5000
+
+def coalesce_changes(events):
+    """
+    Объединение пачки уведомлений об изменениях по ключу (таблица, id)
+    
+    insert + update -> insert, update + update -> update (объединение полей),
+    insert + delete -> событие исчезает, update + delete -> delete.
+    События разных шардов (ключ 'shard') не объединяются: ID профилей
+    в шардах независимы.
+    
+    Args:
+        events (list): Словари уведомлений в порядке поступления
+        
+    Returns:
+        list: Объединенные события в порядке первого появления ключа
+    """
+    merged = {}
+    for event in events:
+        key = (event.get('shard'), event.get('table'), event.get('id'))
+        previous = merged.get(key)
+        if previous is None:
+            merged[key] = dict(event)
+            continue
+            
+        if event['op'] == 'delete':
+            if previous['op'] == 'insert':
+                # Запись появилась и исчезла внутри окна - сообщать нечего
+                merged[key] = None
+            else:
+                merged[key] = dict(event)
+        elif event['op'] == 'update' and previous['op'] == 'insert':
+            # Потребитель все равно прочитает новую запись целиком
+            continue
+        elif event['op'] == 'update' and previous['op'] == 'update':
+            changed = set(previous.get('changed', [])) | set(event.get('changed', []))
+            previous['changed'] = sorted(changed)
+        else:
+            merged[key] = dict(event)
+            
+    return [event for event in merged.values() if event is not None]
+
+def _database_for(operation, timeout, user_id):
+    """Подключение к базе, в которой хранится пользователь (с учетом шардирования)"""
+    shard_map = get_shard_map()
+    if shard_map is None:
+        return Database(operation, timeout)
+    return Database(operation, timeout, config=shard_map.config_for_id(user_id))
+
+def _delete_in_batches(config, batches, pause, max_replication_lag, progress, done, total):
+    """
+    Выполнение пакетов удаления короткими транзакциями с паузами
+    
+    Args:
+        config (dict): Конфигурация базы (None - по умолчанию)
+        batches: Функция от курсора, генерирующая списки удаленных ID по пакетам
+        pause (float): Пауза между пакетами в секундах
+        max_replication_lag (float): Допустимое отставание реплик в секундах (None - не проверять)
+        progress: Функция progress(удалено, всего) или None
+        done (int): Удалено на предыдущих шагах (для отчета о прогрессе)
+        total (int): Всего к удалению (None, если неизвестно)
+        
+    Returns:
+        int: Количество удаленных пользователей
+    """
+    shard_map = get_shard_map()
+    db = Database('purge', config=config)
+    if not db.connect():
+        return 0
+    
+    deleted = 0
+    try:
+        for ids in batches(db.cursor):
+            db.connection.commit()
+            if shard_map is not None and ids:
+                shard_map.release_many(ids)
+            deleted += len(ids)
+            if progress:
+                progress(done + deleted, total)
+                
+            # Ждем, пока реплики догонят, чтобы не раздувать отставание
+            while max_replication_lag is not None:
+                lag = db.fetch_one(
+                    "SELECT COALESCE(MAX(EXTRACT(EPOCH FROM replay_lag)), 0) FROM pg_stat_replication"
+                )
+                db.connection.commit()
+                if not lag or lag[0] <= max_replication_lag:
+                    break
+                time.sleep(max(pause, 0.5))
+            if pause:
+                time.sleep(pause)
+    except QueryTimeoutError:
+        raise
+    except Exception as e:
+        print(f"❌ Ошибка пакетного удаления: {e}")
+        db.connection.rollback()
+    finally:
+        db.disconnect()
+        
+    return deleted
+
+def _fetch_by_keys(column, keys, timeout, config=None):
+    """
+    Выборка пользователей по списку значений столбца запросами = ANY(%s)
+    
+    Returns:
+        dict: {значение ключа: User}
+        
+    Raises:
+        ConnectionError: База данных недоступна
+        psycopg2.Error: Ошибка запроса (ключи не считаются ненайденными)
+    """
+    found = {}
+    if not keys:
+        return found
+        
+    db = Database('get_many', timeout, config=config)
+    if not db.connect():
+        raise ConnectionError("База данных недоступна")
+    
+    query = f"""
+        SELECT id, name, email, age, created_at 
+        FROM users 
+        WHERE {column} = ANY(%s)
+    """
+    try:
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            rows = db.fetch_all(query, (keys[start:start + LOOKUP_CHUNK_SIZE],))
+            if db.last_error is not None:
+                raise db.last_error
+            for row in rows:
+                user = User(name=row[1], email=row[2], age=row[3], id=row[0], created_at=row[4])
+                found[user.id if column == 'id' else user.email] = user
+    finally:
+        db.disconnect()
+    return found
 
 class User:
+    # Буфер отложенной записи; None - save() пишет в базу сразу
+    write_buffer = None
+    
+    @classmethod
+    def enable_write_behind(cls, **options):
+        """
+        Режим отложенной записи: save() буферизуется и схлопывается
+        
+        Args:
+            **options: Параметры WriteBehindBuffer (max_size, flush_interval,
+                on_error, timeout)
+        """
+        cls.disable_write_behind()
+        cls.write_buffer = WriteBehindBuffer(**options).start()
+        
+    @classmethod
+    def disable_write_behind(cls):
+        """Запись накопленных сохранений и возврат к немедленной записи"""
+        buffer, cls.write_buffer = cls.write_buffer, None
+        if buffer is not None:
+            buffer.close()
+            
+    @classmethod
+    def flush(cls):
+        """
+        Запись накопленных сохранений (в режиме отложенной записи)
+        
+        Returns:
+            int: Количество записанных пользователей
+        """
+        return cls.write_buffer.flush() if cls.write_buffer is not None else 0
+    
     def __init__(self, name, email, age, id=None, created_at=None):
         """
         Модель пользователя
@@ -18,14 +200,28 @@ class User:
         self.age = age
         self.created_at = created_at
         
-    def save(self):
+    def save(self, timeout=None):
         """
         Сохранение пользователя в базу данных
         
+        Args:
+            timeout (float, optional): Бюджет задержки в секундах (по умолчанию из настроек)
+        
         Returns:
-            bool: True если успешно, False если ошибка
+            bool: True если успешно, False если ошибка (в режиме отложенной
+                записи - всегда True, ошибки получает on_error буфера)
+            
+        Raises:
+            QueryTimeoutError: Превышен бюджет задержки
         """
-        db = Database()
+        if User.write_buffer is not None:
+            return User.write_buffer.add(self)
+            
+        shard_map = get_shard_map()
+        if shard_map is not None:
+            return self._save_sharded(shard_map, timeout)
+            
+        db = Database('save', timeout)
         if not db.connect():
             return False
         
@@ -50,6 +246,8 @@ class User:
                     WHERE id = %s
                 """
                 success = db.execute_query(query, (self.name, self.email, self.age, self.id))
+        except QueryTimeoutError:
+            raise
         except Exception as e:
             print(f"❌ Ошибка при сохранении пользователя: {e}")
             success = False
@@ -58,26 +256,86 @@ class User:
             
         return success
         
+    def _save_sharded(self, shard_map, timeout):
+        """Сохранение пользователя в его шард с учетом справочника email -> ID"""
+        if self.id is None:
+            # ID выдает справочник; он же проверяет уникальность email
+            try:
+                user_id = shard_map.reserve_email(self.email)
+            except (ConnectionError, psycopg2.Error) as e:
+                print(f"❌ Справочник email недоступен: {e}")
+                return False
+            if user_id is None:
+                print(f"❌ Пользователь с email '{self.email}' уже существует")
+                return False
+            query = "INSERT INTO users (id, name, email, age) VALUES (%s, %s, %s, %s)"
+            params = (user_id, self.name, self.email, self.age)
+        else:
+            user_id = self.id
+            # Прежний email возвращается в справочник, если запись в шард не удастся
+            old_email = shard_map.email_for_id(user_id)
+            if not shard_map.update_email(user_id, self.email):
+                return False
+            query = "UPDATE users SET name = %s, email = %s, age = %s WHERE id = %s"
+            params = (self.name, self.email, self.age, user_id)
+            
+        db = Database('save', timeout, config=shard_map.config_for_id(user_id))
+        success = False
+        try:
+            if db.connect():
+                success = db.execute_query(query, params)
+        finally:
+            db.disconnect()
+            # Освобождаем зарезервированный email, если вставка не удалась,
+            # или возвращаем прежний, если не удалось обновление
+            if not success and self.id is None:
+                shard_map.release(user_id)
+            elif not success and old_email not in (None, self.email):
+                shard_map.update_email(user_id, old_email)
+                
+        if success and self.id is None:
+            self.id = user_id
+        return success
+        
     @staticmethod
-    def get_all():
+    def get_all(timeout=None):
         """
         Получение всех пользователей из базы данных
         
+        Args:
+            timeout (float, optional): Бюджет задержки в секундах (по умолчанию из настроек)
+        
         Returns:
             list: Список объектов User
+            
+        Raises:
+            QueryTimeoutError: Превышен бюджет задержки
         """
-        db = Database()
-        if not db.connect():
-            return []
-        
         query = """
             SELECT id, name, email, age, created_at 
             FROM users 
             ORDER BY id
         """
-        results = db.fetch_all(query)
         
-        db.disconnect()
+        shard_map = get_shard_map()
+        if shard_map is not None:
+            # Параллельный запрос ко всем шардам и слияние по id
+            try:
+                results = fetch_all_users(shard_map, query, timeout)
+            except ConnectionError as e:
+                print(f"❌ {e}")
+                return []
+            except psycopg2.Error:
+                # Ошибка уже выведена Database; частичный список не возвращается
+                return []
+        else:
+            db = Database('get_all', timeout)
+            if not db.connect():
+                return []
+            try:
+                results = db.fetch_all(query)
+            finally:
+                db.disconnect()
         
         users = []
         for row in results:
@@ -93,17 +351,21 @@ class User:
         return users
         
     @staticmethod
-    def get_by_id(user_id):
+    def get_by_id(user_id, timeout=None):
         """
         Получение пользователя по ID
         
         Args:
             user_id (int): ID пользователя
+            timeout (float, optional): Бюджет задержки в секундах (по умолчанию из настроек)
             
         Returns:
             User: Объект пользователя или None если не найден
+            
+        Raises:
+            QueryTimeoutError: Превышен бюджет задержки
         """
-        db = Database()
+        db = _database_for('get_by_id', timeout, user_id)
         if not db.connect():
             return None
         
@@ -112,9 +374,10 @@ class User:
             FROM users 
             WHERE id = %s
         """
-        result = db.fetch_one(query, (user_id,))
-        
-        db.disconnect()
+        try:
+            result = db.fetch_one(query, (user_id,))
+        finally:
+            db.disconnect()
         
         if result:
             return User(
@@ -127,24 +390,37 @@ class User:
         return None
         
     @staticmethod
-    def get_by_email(email):
+    def get_by_email(email, timeout=None):
         """
         Получение пользователя по email
         
         Args:
             email (str): Email пользователя
+            timeout (float, optional): Бюджет задержки в секундах (по умолчанию из настроек)
             
         Returns:
             User: Объект пользователя или None если не найден
+            
+        Raises:
+            QueryTimeoutError: Превышен бюджет задержки
         """
-        db = Database()
+        shard_map = get_shard_map()
+        if shard_map is not None:
+            # Шард определяется по ID из справочника email -> ID
+            user_id = shard_map.lookup_email(email)
+            if user_id is None:
+                return None
+            db = Database('get_by_email', timeout, config=shard_map.config_for_id(user_id))
+        else:
+            db = Database('get_by_email', timeout)
         if not db.connect():
             return None
         
         query = "SELECT id, name, email, age FROM users WHERE email = %s"
-        result = db.fetch_one(query, (email,))
-        
-        db.disconnect()
+        try:
+            result = db.fetch_one(query, (email,))
+        finally:
+            db.disconnect()
         
         if result:
             return User(
@@ -155,27 +431,306 @@ class User:
             )
         return None
         
-    def delete(self):
+    def delete(self, timeout=None):
         """
         Удаление пользователя из базы данных
         
+        Args:
+            timeout (float, optional): Бюджет задержки в секундах (по умолчанию из настроек)
+        
         Returns:
             bool: True если успешно, False если ошибка
+            
+        Raises:
+            QueryTimeoutError: Превышен бюджет задержки
         """
         if self.id is None:
             print("❌ Нельзя удалить пользователя без ID")
             return False
             
-        db = Database()
+        db = _database_for('delete', timeout, self.id)
         if not db.connect():
             return False
         
         query = "DELETE FROM users WHERE id = %s"
-        success = db.execute_query(query, (self.id,))
-        
-        db.disconnect()
+        try:
+            success = db.execute_query(query, (self.id,))
+        finally:
+            db.disconnect()
+            
+        shard_map = get_shard_map()
+        if success and shard_map is not None:
+            shard_map.release(self.id)
         return success
         
+    @staticmethod
+    def filter(**conditions):
+        """
+        Запрос пользователей с условиями, выполняемыми в SQL
+        
+        Пример: User.filter(age__gte=18, status="active").order_by("-created_at").limit(50)
+        
+        Args:
+            **conditions: поле=значение или поле__оператор=значение (см. query.LOOKUPS)
+            
+        Returns:
+            UserQuery: Запрос (выполняется при all(), count(), exists() или итерации)
+        """
+        return UserQuery(User).filter(**conditions)
+        
+    @staticmethod
+    def get_many(ids, timeout=None):
+        """
+        Получение пользователей по списку ID одним запросом (пакетами
+        по LOOKUP_CHUNK_SIZE для очень больших списков)
+        
+        Args:
+            ids (iterable): ID пользователей
+            timeout (float, optional): Бюджет задержки в секундах
+            
+        Returns:
+            tuple: (список User в порядке входных ID, список ненайденных ID)
+            
+        Raises:
+            QueryTimeoutError: Превышен бюджет задержки
+            ConnectionError: База данных недоступна
+            psycopg2.Error: Ошибка запроса
+        """
+        ids = list(ids)
+        unique = list(dict.fromkeys(ids))
+        
+        shard_map = get_shard_map()
+        if shard_map is None:
+            found = _fetch_by_keys('id', unique, timeout)
+        else:
+            # Каждый шард получает только свои ID; шарды опрашиваются параллельно
+            groups = [[] for _ in shard_map.shards]
+            for user_id in unique:
+                groups[shard_map.shard_index(user_id)].append(user_id)
+                
+            def fetch(config):
+                return _fetch_by_keys('id', groups[shard_map.shards.index(config)], timeout, config)
+                
+            found = {}
+            for part in shard_map.scatter(fetch):
+                found.update(part)
+                
+        users = [found[user_id] for user_id in ids if user_id in found]
+        missing = [user_id for user_id in unique if user_id not in found]
+        return users, missing
+        
+    @staticmethod
+    def get_many_by_email(emails, timeout=None):
+        """
+        Получение пользователей по списку email одним запросом
+        
+        Args:
+            emails (iterable): Email пользователей
+            timeout (float, optional): Бюджет задержки в секундах
+            
+        Returns:
+            tuple: (список User в порядке входных email, список ненайденных email)
+            
+        Raises:
+            QueryTimeoutError: Превышен бюджет задержки
+            ConnectionError: База данных недоступна
+            psycopg2.Error: Ошибка запроса
+        """
+        emails = list(emails)
+        unique = list(dict.fromkeys(emails))
+        
+        shard_map = get_shard_map()
+        if shard_map is None:
+            found = _fetch_by_keys('email', unique, timeout)
+        else:
+            # Справочник email -> ID, затем пакетная выборка по ID из шардов
+            ids = shard_map.lookup_emails(unique)
+            users, _ = User.get_many(ids.values(), timeout)
+            found = {user.email: user for user in users}
+            
+        users = [found[email] for email in emails if email in found]
+        missing = [email for email in unique if email not in found]
+        return users, missing
+        
+    @staticmethod
+    def delete_many(ids, batch_size=1000, pause=0.05, max_replication_lag=None, progress=None):
+        """
+        Удаление пользователей по списку ID пакетами
+        
+        Каждый пакет удаляется одним запросом в отдельной короткой транзакции
+        (профили удаляются каскадно в той же транзакции), между пакетами
+        выдерживается пауза, поэтому блокировки держатся недолго.
+        
+        Args:
+            ids (iterable): ID пользователей
+            batch_size (int): Размер пакета
+            pause (float): Пауза между пакетами в секундах
+            max_replication_lag (float, optional): Ждать, пока отставание реплик
+                не станет меньше указанного (секунды)
+            progress (callable, optional): progress(удалено, всего)
+            
+        Returns:
+            int: Количество удаленных пользователей
+        """
+        ids = list(dict.fromkeys(ids))
+        
+        # С шардированием ID группируются по шардам
+        shard_map = get_shard_map()
+        groups = {}
+        for user_id in ids:
+            index = shard_map.shard_index(user_id) if shard_map else None
+            groups.setdefault(index, []).append(user_id)
+            
+        deleted = 0
+        for index, group in groups.items():
+            def batches(cursor, group=group):
+                for start in range(0, len(group), batch_size):
+                    cursor.execute(
+                        "DELETE FROM users WHERE id = ANY(%s) RETURNING id",
+                        (group[start:start + batch_size],)
+                    )
+                    yield [row[0] for row in cursor.fetchall()]
+                    
+            config = shard_map.shards[index] if shard_map else None
+            deleted += _delete_in_batches(
+                config, batches, pause, max_replication_lag, progress, deleted, len(ids)
+            )
+        return deleted
+        
+    @staticmethod
+    def purge(status=None, created_before=None, batch_size=1000, pause=0.05,
+              max_replication_lag=None, progress=None):
+        """
+        Удаление пользователей по условию пакетами (например, неактивных)
+        
+        Args:
+            status (str, optional): Удалять пользователей с этим статусом
+            created_before (datetime, optional): Удалять созданных раньше этой даты
+            batch_size (int): Размер пакета
+            pause (float): Пауза между пакетами в секундах
+            max_replication_lag (float, optional): Допустимое отставание реплик (секунды)
+            progress (callable, optional): progress(удалено, всего)
+            
+        Returns:
+            int: Количество удаленных пользователей
+        """
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = %s")
+            params.append(status)
+        if created_before is not None:
+            conditions.append("created_at < %s")
+            params.append(created_before)
+        if not conditions:
+            # Защита от случайного удаления всех пользователей
+            print("❌ Не задано ни одного условия удаления")
+            return 0
+        where = " AND ".join(conditions)
+        
+        def batches(cursor):
+            while True:
+                # SKIP LOCKED: строки, занятые другими транзакциями, не ждем
+                cursor.execute(
+                    f"""
+                    WITH batch AS (
+                        SELECT id FROM users WHERE {where}
+                        ORDER BY id LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    DELETE FROM users USING batch
+                    WHERE users.id = batch.id
+                    RETURNING users.id
+                    """,
+                    (*params, batch_size)
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    return
+                yield ids
+                
+        shard_map = get_shard_map()
+        configs = shard_map.shards if shard_map else [None]
+        deleted = 0
+        for config in configs:
+            deleted += _delete_in_batches(
+                config, batches, pause, max_replication_lag, progress, deleted, None
+            )
+        return deleted
+        
+    @staticmethod
+    def watch(coalesce=0.2, idle_timeout=None):
+        """
+        Поток изменений таблиц users и user_profiles (LISTEN/NOTIFY)
+        
+        Требует миграцию 006. Уведомления, пришедшие в течение окна
+        coalesce, объединяются (см. coalesce_changes), поэтому серия
+        изменений одной записи выдается одним событием. При шардировании
+        уведомления слушаются на всех шардах, события получают ключ 'shard'.
+        
+        Args:
+            coalesce (float): Окно объединения уведомлений в секундах
+            idle_timeout (float, optional): Завершить поток, если изменений
+                не было дольше указанного времени (None - ждать бесконечно)
+            
+        Yields:
+            dict: Событие {'table', 'op', 'id', ['changed'], ['user_id'], ['shard']}
+        """
+        shard_map = get_shard_map()
+        configs = shard_map.shards if shard_map is not None else [None]
+        listeners = []
+        try:
+            for config in configs:
+                db = Database(config=config)
+                if not db.connect():
+                    return
+                listeners.append(db)
+                db.connection.autocommit = True
+                db.cursor.execute(f"LISTEN {CHANGE_CHANNEL}")
+            # Подключение -> имя шарда (None без шардирования)
+            connections = {
+                db.connection: config['database'] if config is not None else None
+                for db, config in zip(listeners, configs)
+            }
+            
+            def poll(timeout):
+                ready, _, _ = select.select(list(connections), [], [], timeout)
+                for connection in ready:
+                    connection.poll()
+                return ready
+            
+            while True:
+                # Ожидание первого уведомления без активного опроса
+                if not any(connection.notifies for connection in connections):
+                    if not poll(idle_timeout):
+                        return
+                    
+                # Добираем уведомления, пришедшие в окне объединения
+                deadline = time.monotonic() + coalesce
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    poll(remaining)
+                        
+                events = []
+                for connection, shard in connections.items():
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            event = json.loads(notify.payload)
+                        except ValueError:
+                            print(f"⚠️ Некорректное уведомление: {notify.payload}")
+                            continue
+                        if shard is not None:
+                            event['shard'] = shard
+                        events.append(event)
+                        
+                for event in coalesce_changes(events):
+                    yield event
+        finally:
+            for db in listeners:
+                db.disconnect()
+        
     def __str__(self):
         """Строковое представление пользователя"""
         return f"User(id={self.id}, name='{self.name}', email='{self.email}', age={self.age})"
\ No newline at end of file
@@ -0,0 +1,67 @@
+import argparse
+import time
+from datetime import datetime
+
+from database import Database
+from models import User
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетное удаление пользователей по условию")
+    parser.add_argument('--status', choices=['active', 'inactive'], help="статус удаляемых пользователей")
+    parser.add_argument('--created-before', type=datetime.fromisoformat,
+                        help="удалять созданных раньше даты (ГГГГ-ММ-ДД)")
+    parser.add_argument('--batch-size', type=int, default=1000, help="пользователей в одной транзакции")
+    parser.add_argument('--pause', type=float, default=0.05, help="пауза между пакетами, с")
+    parser.add_argument('--max-replication-lag', type=float,
+                        help="ждать, пока отставание реплик не станет меньше (с)")
+    parser.add_argument('--enqueue', action='store_true',
+                        help="поставить удаление в очередь задач (jobs.py) вместо выполнения здесь")
+    args = parser.parse_args()
+
+    if args.status is None and args.created_before is None:
+        print("❌ Укажите хотя бы одно условие: --status или --created-before")
+        return
+
+    conditions = []
+    if args.status:
+        conditions.append(f"статус = {args.status}")
+    if args.created_before:
+        conditions.append(f"создан до {args.created_before:%Y-%m-%d}")
+    confirm = input(f"Удалить пользователей ({', '.join(conditions)})? (yes/NO): ").strip().lower()
+    if confirm != 'yes':
+        print("✅ Удаление отменено")
+        return
+
+    Database.verbose = False
+
+    if args.enqueue:
+        from jobs import enqueue
+        job_id = enqueue('purge', {
+            'status': args.status,
+            'created_before': args.created_before.isoformat() if args.created_before else None,
+            'batch_size': args.batch_size,
+            'pause': args.pause,
+            'max_replication_lag': args.max_replication_lag,
+        })
+        if job_id is not None:
+            print(f"✅ Задача #{job_id} поставлена в очередь: python jobs.py status")
+        return
+
+    started = time.perf_counter()
+
+    def progress(done, total):
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(f"\r🗑️ Удалено: {done} ({rate:,.0f}/с)", end="", flush=True)
+
+    deleted = User.purge(
+        status=args.status,
+        created_before=args.created_before,
+        batch_size=args.batch_size,
+        pause=args.pause,
+        max_replication_lag=args.max_replication_lag,
+        progress=progress
+    )
+    print(f"\n✅ Удалено пользователей: {deleted} за {time.perf_counter() - started:.1f} с")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Построитель запросов к таблице users
+
+    User.filter(age__gte=18, status="active").order_by("-created_at").limit(50)
+
+Условия, сортировка и LIMIT/OFFSET выполняются в SQL. Текст запроса
+зависит только от "формы" запроса (поля, операторы, сортировка, наличие
+лимита), а не от значений, поэтому он строится один раз на форму и
+берется из кэша (compile_query); значения передаются параметрами.
+"""
+from functools import lru_cache
+
+import psycopg2
+
+from database import Database
+from sharding import get_shard_map
+
+# Столбцы, по которым можно фильтровать и сортировать
+FIELDS = ('id', 'name', 'email', 'age', 'status', 'created_at', 'updated_at')
+
+USER_COLUMNS = "id, name, email, age, created_at"
+
+# Операторы условий: поле__оператор=значение
+LOOKUPS = {
+    'exact': "{} = %s",
+    'ne': "{} <> %s",
+    'gt': "{} > %s",
+    'gte': "{} >= %s",
+    'lt': "{} < %s",
+    'lte': "{} <= %s",
+    'in': "{} = ANY(%s)",
+    'contains': "{} LIKE %s",
+    'icontains': "{} ILIKE %s",
+    'startswith': "{} LIKE %s",
+}
+
+# Количество различных форм запросов в кэше
+CACHE_SIZE = 256
+
+def _like_pattern(value, lookup):
+    """Экранирование спецсимволов LIKE в значении"""
+    escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%' if lookup == 'startswith' else f'%{escaped}%'
+
+def _parse_condition(key, value):
+    """
+    Разбор условия вида поле__оператор
+
+    Returns:
+        tuple: (элемент формы запроса, параметр или None)
+    """
+    field, _, lookup = key.partition('__')
+    lookup = lookup or 'exact'
+    if field not in FIELDS:
+        raise ValueError(f"Неизвестное поле: {field}")
+    if lookup == 'isnull':
+        # Значение определяет текст SQL, поэтому входит в форму запроса
+        return (field, 'isnull', bool(value)), None
+    if lookup not in LOOKUPS:
+        raise ValueError(f"Неизвестный оператор: {lookup}")
+    if lookup == 'exact' and value is None:
+        return (field, 'isnull', True), None
+    if lookup == 'in':
+        value = list(value)
+    elif lookup in ('contains', 'icontains', 'startswith'):
+        value = _like_pattern(value, lookup)
+    return (field, lookup, None), value
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_query(mode, conditions, ordering, limited, offset):
+    """
+    Построение SQL по форме запроса (результат кэшируется)
+
+    Args:
+        mode (str): 'select', 'count' или 'exists'
+        conditions (tuple): Элементы (поле, оператор, значение isnull)
+        ordering (tuple): Поля сортировки, '-' в начале - по убыванию
+        limited (bool): Есть ли LIMIT
+        offset (bool): Есть ли OFFSET
+
+    Returns:
+        str: Текст запроса с плейсхолдерами %s
+    """
+    where = []
+    for field, lookup, isnull in conditions:
+        if lookup == 'isnull':
+            where.append(f"{field} IS {'' if isnull else 'NOT '}NULL")
+        else:
+            where.append(LOOKUPS[lookup].format(field))
+    where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+    order_sql = ""
+    if ordering and mode == 'select':
+        order_sql = " ORDER BY " + ", ".join(
+            f"{field[1:]} DESC" if field.startswith('-') else field for field in ordering
+        )
+    page_sql = (" LIMIT %s" if limited else "") + (" OFFSET %s" if offset else "")
+
+    if mode == 'select':
+        return f"SELECT {USER_COLUMNS} FROM users{where_sql}{order_sql}{page_sql}"
+    if mode == 'count':
+        if page_sql:
+            return f"SELECT COUNT(*) FROM (SELECT 1 FROM users{where_sql}{page_sql}) AS page"
+        return f"SELECT COUNT(*) FROM users{where_sql}"
+    # EXISTS останавливается на первой подходящей строке
+    return f"SELECT EXISTS (SELECT 1 FROM users{where_sql}{page_sql})"
+
+class UserQuery:
+    """
+    Цепочка условий запроса к пользователям
+
+    Каждый метод возвращает новый объект, исходный не изменяется, поэтому
+    общую часть запроса можно сохранить и достраивать по-разному.
+    """
+
+    def __init__(self, model, conditions=(), params=(), ordering=('id',), limit=None, offset=None,
+                 timeout=None):
+        self.model = model
+        self.conditions = conditions
+        self.params = params
+        self.ordering = ordering
+        self._limit = limit
+        self._offset = offset
+        self.timeout = timeout
+
+    def _clone(self, **changes):
+        state = {
+            'conditions': self.conditions, 'params': self.params, 'ordering': self.ordering,
+            'limit': self._limit, 'offset': self._offset, 'timeout': self.timeout,
+        }
+        state.update(changes)
+        return UserQuery(self.model, **state)
+
+    def filter(self, **conditions):
+        """
+        Добавление условий (объединяются через AND)
+
+        Args:
+            **conditions: поле=значение или поле__оператор=значение, операторы:
+                exact, ne, gt, gte, lt, lte, in, isnull, contains, icontains, startswith
+        """
+        shape, params = list(self.conditions), list(self.params)
+        for key, value in conditions.items():
+            item, param = _parse_condition(key, value)
+            shape.append(item)
+            if item[1] != 'isnull':
+                params.append(param)
+        return self._clone(conditions=tuple(shape), params=tuple(params))
+
+    def order_by(self, *fields):
+        """Сортировка по полям ('-поле' - по убыванию); заменяет предыдущую"""
+        for field in fields:
+            if field.lstrip('-') not in FIELDS:
+                raise ValueError(f"Неизвестное поле: {field.lstrip('-')}")
+        # id в конце делает порядок однозначным
+        if 'id' not in [field.lstrip('-') for field in fields]:
+            fields = fields + ('id',)
+        return self._clone(ordering=fields)
+
+    def limit(self, count):
+        return self._clone(limit=count)
+
+    def offset(self, count):
+        return self._clone(offset=count)
+
+    def with_timeout(self, timeout):
+        """Бюджет задержки запроса в секундах"""
+        return self._clone(timeout=timeout)
+
+    def sql(self, mode='select'):
+        """
+        Текст запроса и параметры
+
+        Returns:
+            tuple: (SQL, список параметров)
+        """
+        query = compile_query(mode, self.conditions, self.ordering,
+                              self._limit is not None, bool(self._offset))
+        params = list(self.params)
+        if self._limit is not None:
+            params.append(self._limit)
+        if self._offset:
+            params.append(self._offset)
+        return query, params
+
+    def _run(self, mode, config=None, page=None):
+        """Выполнение запроса в одной базе"""
+        query, params = self.sql(mode) if page is None else page.sql(mode)
+        db = Database('get_all', self.timeout, config=config)
+        if not db.connect():
+            raise ConnectionError("База данных недоступна")
+        try:
+            rows = db.fetch_all(query, params)
+            if db.last_error is not None:
+                raise db.last_error
+            return rows
+        finally:
+            db.disconnect()
+
+    def _rows(self):
+        shard_map = get_shard_map()
+        if shard_map is None:
+            return self._run('select')
+
+        # Каждый шард возвращает первые limit + offset строк своей части,
+        # общий порядок и страница собираются из них
+        page = self._clone(
+            limit=self._limit + (self._offset or 0) if self._limit is not None else None,
+            offset=None
+        )
+        rows = [row for part in shard_map.scatter(lambda config: self._run('select', config, page))
+                for row in part]
+        fields = [column.strip() for column in USER_COLUMNS.split(',')]
+        for field in reversed(self.ordering):
+            name = field.lstrip('-')
+            if name not in fields:
+                raise ValueError(f"Сортировка по {name} не поддерживается при шардировании")
+            index = fields.index(name)
+            rows.sort(key=lambda row: (row[index] is None, row[index]), reverse=field.startswith('-'))
+        start = self._offset or 0
+        return rows[start:start + self._limit] if self._limit is not None else rows[start:]
+
+    def all(self, raise_errors=False):
+        """
+        Выполнение запроса
+
+        Args:
+            raise_errors (bool): Передавать ошибки базы вызывающему вместо
+                пустого списка (пустой результат и сбой иначе неразличимы)
+
+        Returns:
+            list: Список объектов пользователя
+
+        Raises:
+            ConnectionError, psycopg2.Error: Только при raise_errors=True
+        """
+        try:
+            rows = self._rows()
+        except ConnectionError as e:
+            if raise_errors:
+                raise
+            print(f"❌ {e}")
+            return []
+        except psycopg2.Error:
+            # Ошибка уже выведена Database
+            if raise_errors:
+                raise
+            return []
+        return [self.model(name=row[1], email=row[2], age=row[3], id=row[0], created_at=row[4])
+                for row in rows]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def first(self):
+        """Первый пользователь или None"""
+        users = self.limit(1).all()
+        return users[0] if users else None
+
+    def count(self):
+        """
+        Количество подходящих пользователей (SELECT COUNT(*) без выборки строк)
+
+        Returns:
+            int: Количество или 0 при ошибке подключения
+        """
+        shard_map = get_shard_map()
+        try:
+            if shard_map is None:
+                return self._run('count')[0][0]
+            if self._limit is not None or self._offset:
+                return len(self._rows())
+            return sum(part[0][0] for part in shard_map.scatter(lambda config: self._run('count', config)))
+        except ConnectionError as e:
+            print(f"❌ {e}")
+            return 0
+        except psycopg2.Error:
+            return 0
+
+    def exists(self):
+        """
+        Есть ли хотя бы один подходящий пользователь (SELECT EXISTS)
+
+        Returns:
+            bool: True если есть
+        """
+        shard_map = get_shard_map()
+        try:
+            if shard_map is None:
+                return self._run('exists')[0][0]
+            if self._offset or self._limit is not None:
+                return bool(self.limit(min(self._limit, 1) if self._limit is not None else 1)._rows())
+            return any(part[0][0] for part in shard_map.scatter(lambda config: self._run('exists', config)))
+        except ConnectionError as e:
+            print(f"❌ {e}")
+            return False
+        except psycopg2.Error:
+            return False
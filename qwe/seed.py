@@ -0,0 +1,246 @@
+import argparse
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+
+import psycopg2
+
+from sharding import unsupported_with_shards
+
+# Справочники для генерации правдоподобных данных: (кириллица, латиница)
+FIRST_NAMES = [
+    ('Иван', 'ivan'), ('Петр', 'petr'), ('Мария', 'maria'), ('Анна', 'anna'),
+    ('Алексей', 'aleksey'), ('Ольга', 'olga'), ('Дмитрий', 'dmitriy'), ('Елена', 'elena'),
+    ('Сергей', 'sergey'), ('Наталья', 'natalya'), ('Андрей', 'andrey'), ('Татьяна', 'tatyana'),
+    ('Михаил', 'mikhail'), ('Екатерина', 'ekaterina'), ('Николай', 'nikolay'), ('Ирина', 'irina')
+]
+LAST_NAMES = [
+    ('Иванов', 'ivanov'), ('Петров', 'petrov'), ('Сидоров', 'sidorov'), ('Смирнов', 'smirnov'),
+    ('Кузнецов', 'kuznetsov'), ('Попов', 'popov'), ('Васильев', 'vasilyev'), ('Соколов', 'sokolov'),
+    ('Михайлов', 'mikhaylov'), ('Новиков', 'novikov'), ('Федоров', 'fedorov'), ('Морозов', 'morozov')
+]
+CITIES = [
+    ('Москва', 'Россия'), ('Санкт-Петербург', 'Россия'), ('Казань', 'Россия'),
+    ('Новосибирск', 'Россия'), ('Екатеринбург', 'Россия'), ('Минск', 'Беларусь'),
+    ('Алматы', 'Казахстан')
+]
+DOMAINS = ['example.com', 'mail.example.com', 'test.example.org']
+
+# Даты создания равномерно распределяются по фиксированному окну,
+# чтобы результат не зависел от момента запуска
+CREATED_FROM = datetime(2019, 1, 1)
+CREATED_SPAN_SECONDS = int(timedelta(days=5 * 365).total_seconds())
+
+def _copy_value(value):
+    """Экранирование значения для текстового формата COPY"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def _copy_row(*values):
+    return '\t'.join(_copy_value(v) for v in values) + '\n'
+
+def generate_chunk(first_id, offset, count, seed):
+    """
+    Генерация пакета строк для users, user_profiles и audit_log
+
+    Args:
+        first_id (int): Первый зарезервированный ID
+        offset (int): Смещение пакета от first_id
+        count (int): Количество пользователей
+        seed (int): Базовое зерно генератора
+
+    Returns:
+        tuple: Три буфера в формате COPY (users, profiles, audit)
+    """
+    # Зерно зависит только от смещения пакета: один и тот же seed дает
+    # те же данные независимо от числа воркеров
+    rng = random.Random(seed * 1_000_003 + offset)
+    users, profiles, audit = io.StringIO(), io.StringIO(), io.StringIO()
+
+    for user_id in range(first_id + offset, first_id + offset + count):
+        first, first_lat = rng.choice(FIRST_NAMES)
+        last, last_lat = rng.choice(LAST_NAMES)
+        name = f"{first} {last}"
+        # ID в адресе гарантирует уникальность email
+        email = f"{first_lat}.{last_lat}.{user_id}@{rng.choice(DOMAINS)}"
+        age = None if rng.random() < 0.05 else int(rng.triangular(16, 85, 32))
+        created_at = CREATED_FROM + timedelta(seconds=rng.randrange(CREATED_SPAN_SECONDS))
+        status = 'inactive' if rng.random() < 0.1 else 'active'
+        city, country = rng.choice(CITIES)
+
+        users.write(_copy_row(user_id, name, email, age, created_at, status))
+        profiles.write(_copy_row(user_id, city, country, created_at, created_at))
+        new_data = {'name': name, 'email': email, 'age': age, 'status': status}
+        audit.write(_copy_row(
+            'users', user_id, 'INSERT',
+            json.dumps(new_data, ensure_ascii=False), 'seed', created_at
+        ))
+
+    for buffer in (users, profiles, audit):
+        buffer.seek(0)
+    return users, profiles, audit
+
+def _connect(config):
+    return psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        database=config.get('database', 'python_db'),
+        user=config['user'],
+        password=config['password']
+    )
+
+# Подключение процесса-воркера (одно на процесс, см. _init_worker)
+_worker_connection = None
+
+def _init_worker(config):
+    """Инициализация процесса-воркера: открытие собственного подключения"""
+    global _worker_connection
+    _worker_connection = _connect(config)
+    # Для генерации тестовых данных ожидание сброса WAL не нужно
+    with _worker_connection.cursor() as cursor:
+        cursor.execute("SET synchronous_commit = off")
+    _worker_connection.commit()
+
+def load_chunk(args):
+    """
+    Загрузка одного пакета в процессе-воркере
+
+    Args:
+        args (tuple): (first_id, offset, count, seed)
+
+    Returns:
+        int: Количество загруженных пользователей
+    """
+    first_id, offset, count, seed = args
+    users, profiles, audit = generate_chunk(first_id, offset, count, seed)
+
+    try:
+        with _worker_connection.cursor() as cursor:
+            cursor.copy_expert(
+                "COPY users (id, name, email, age, created_at, status) FROM STDIN", users
+            )
+            cursor.copy_expert(
+                "COPY user_profiles (user_id, city, country, created_at, updated_at) FROM STDIN",
+                profiles
+            )
+            cursor.copy_expert(
+                "COPY audit_log (table_name, record_id, action, new_data, changed_by, changed_at) "
+                "FROM STDIN", audit
+            )
+        _worker_connection.commit()
+    except Exception:
+        _worker_connection.rollback()
+        raise
+
+    return count
+
+def reserve_ids(config, count):
+    """
+    Резервирование непрерывного диапазона ID в последовательности users_id_seq
+
+    Параллельная вставка (INSERT с ID по умолчанию) между nextval и setval
+    получила бы ID из зарезервированного диапазона. Блокировка таблицы
+    ждет завершения текущих вставок и не пускает новые до COMMIT, а
+    сдвиг последовательности выполняется одним запросом.
+
+    Returns:
+        int: Первый зарезервированный ID
+    """
+    conn = _connect(config)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("LOCK TABLE users IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT setval('users_id_seq', nextval('users_id_seq') + %s - 1)", (count,)
+        )
+        first_id = cursor.fetchone()[0] - count + 1
+        conn.commit()
+        cursor.close()
+        return first_id
+    finally:
+        conn.close()
+
+def seed_users(count, workers=4, chunk_size=50_000, seed=42, config=None):
+    """
+    Генерация и потоковая загрузка пользователей через COPY
+
+    Args:
+        count (int): Количество пользователей
+        workers (int): Количество процессов-загрузчиков
+        chunk_size (int): Размер пакета (строк на один COPY и COMMIT)
+        seed (int): Зерно генератора для воспроизводимости
+        config (dict, optional): Конфигурация подключения
+
+    Returns:
+        bool: True если успешно, False если ошибка
+    """
+    if config is None:
+        try:
+            from db_config import DB_CONFIG
+            config = DB_CONFIG
+        except ImportError:
+            print("❌ Файл конфигурации не найден. Запустите setup.py сначала.")
+            return False
+
+    # ID выдаются последовательностью users одной базы, минуя справочник шардов
+    error = unsupported_with_shards("Генерация данных", config)
+    if error:
+        print(f"❌ {error}")
+        return False
+
+    try:
+        first_id = reserve_ids(config, count)
+    except Exception as e:
+        print(f"❌ Ошибка подключения: {e}")
+        return False
+
+    # Каждый пакет - отдельная задача пула; пакеты коммитятся независимо
+    tasks = [
+        (first_id, offset, min(chunk_size, count - offset), seed)
+        for offset in range(0, count, chunk_size)
+    ]
+
+    print(f"🔄 Генерация {count} пользователей в {workers} процессах...")
+    started = time.perf_counter()
+    loaded = 0
+
+    try:
+        with Pool(processes=workers, initializer=_init_worker, initargs=(config,)) as pool:
+            for size in pool.imap_unordered(load_chunk, tasks):
+                loaded += size
+                print(f"\r   Загружено: {loaded}/{count}", end="", flush=True)
+        print()
+    except Exception as e:
+        print(f"\n❌ Ошибка загрузки данных: {e}")
+        return False
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Загружено пользователей: {loaded} (ID {first_id}-{first_id + count - 1})")
+    print(f"   Время: {elapsed:.1f} с, {loaded / elapsed:,.0f} пользователей/с")
+
+    # Статистика планировщика после массовой загрузки устарела
+    from maintenance import analyze_tables
+    analyze_tables(force=True, config=config)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация тестовых данных для нагрузочного тестирования")
+    parser.add_argument('count', type=int, help="количество пользователей")
+    parser.add_argument('--workers', type=int, default=4, help="количество процессов (по умолчанию 4)")
+    parser.add_argument('--chunk-size', type=int, default=50_000, help="строк в одном пакете COPY")
+    parser.add_argument('--seed', type=int, default=42, help="зерно генератора")
+    args = parser.parse_args()
+
+    if args.count <= 0 or args.workers <= 0 or args.chunk_size <= 0:
+        print("❌ Параметры должны быть положительными числами")
+        return
+
+    seed_users(args.count, args.workers, args.chunk_size, args.seed)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,26 @@
 import psycopg2
 
+# Основная таблица users (остальные объекты создаются миграциями)
+USERS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        email VARCHAR(100) UNIQUE NOT NULL,
+        age INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# Тестовые пользователи новой базы
+SEED_USERS_SQL = """
+    INSERT INTO users (name, email, age) 
+    VALUES 
+        ('Иван Иванов', 'ivan@example.com', 25),
+        ('Петр Петров', 'petr@example.com', 30),
+        ('Мария Сидорова', 'maria@example.com', 28)
+    ON CONFLICT (email) DO NOTHING
+"""
+
 def get_db_config():
     """Получение настроек базы данных от пользователя"""
     print("🔧 Настройка подключения к PostgreSQL")
@@ -17,6 +38,19 @@ def get_db_config():
         'password': password
     }
 
+def create_tables(cursor):
+    """
+    Создание основной таблицы users
+    
+    Args:
+        cursor: Курсор подключения к целевой базе данных
+    """
+    cursor.execute(USERS_TABLE_SQL)
+
+def add_seed_users(cursor):
+    """Добавление тестовых пользователей"""
+    cursor.execute(SEED_USERS_SQL)
+
 def create_database(config):
     """Создание базы данных и таблиц"""
     try:
@@ -56,27 +90,25 @@ def create_database(config):
         )
         cursor = conn.cursor()
         
+        if not exists:
+            # Новая база: вся схема одним запросом из базовой схемы (baseline.sql),
+            # дальше применяются только миграции, добавленные после нее.
+            # Схема создается до тестовых данных: заполняющие команды миграций
+            # в базовую схему не входят и на непустой базе были бы пропущены
+            from migrations import apply_baseline
+            applied = apply_baseline(cursor)
+            if applied:
+                conn.commit()
+                print(f"✅ Базовая схема применена (миграций: {len(applied)})")
+            else:
+                conn.rollback()
+        
         # Создаем основную таблицу users
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(100) NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                age INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        create_tables(cursor)
         print("✅ Таблица 'users' создана")
         
         # Добавляем тестовые данные
-        cursor.execute("""
-            INSERT INTO users (name, email, age) 
-            VALUES 
-                ('Иван Иванов', 'ivan@example.com', 25),
-                ('Петр Петров', 'petr@example.com', 30),
-                ('Мария Сидорова', 'maria@example.com', 28)
-            ON CONFLICT (email) DO NOTHING
-        """)
+        add_seed_users(cursor)
         
         conn.commit()
         print("✅ Тестовые данные добавлены")
@@ -0,0 +1,482 @@
+"""
+Шардирование пользователей по нескольким базам PostgreSQL
+
+Карта шардов задается в db_config.py ключом 'shards' - списком имен баз
+на том же сервере или словарей с переопределением параметров подключения:
+
+    DB_CONFIG = {..., 'shards': ['python_db_0', 'python_db_1',
+                                 {'host': 'db2', 'database': 'python_db_2'}]}
+
+Пользователь хранится в шарде crc32(id) % N. ID выдаются глобальной
+последовательностью в базе-справочнике (ключ 'shard_directory', по
+умолчанию первый шард), там же хранится индекс email -> ID, который
+обеспечивает уникальность email по всем шардам.
+"""
+import argparse
+import heapq
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from database import Database
+
+def _shard_config(base, shard):
+    """Конфигурация подключения к шарду на основе общей конфигурации"""
+    config = {k: v for k, v in base.items() if k not in ('shards', 'shard_directory')}
+    if isinstance(shard, str):
+        config['database'] = shard
+    else:
+        config.update(shard)
+    return config
+
+def shard_configs(config):
+    """
+    Список конфигураций всех баз для применения миграций
+
+    Returns:
+        list: Конфигурации шардов или [config] без шардирования
+    """
+    if not config.get('shards'):
+        return [dict(config, database=config.get('database', 'python_db'))]
+    return [_shard_config(config, shard) for shard in config['shards']]
+
+class ShardMap:
+    """Маршрутизация операций с пользователями по шардам"""
+
+    def __init__(self, config):
+        self.shards = shard_configs(config)
+        directory = config.get('shard_directory')
+        self.directory = _shard_config(config, directory) if directory else self.shards[0]
+
+    def shard_index(self, user_id):
+        """Номер шарда пользователя (стабильный хеш ID)"""
+        return zlib.crc32(int(user_id).to_bytes(8, 'little', signed=True)) % len(self.shards)
+
+    def config_for_id(self, user_id):
+        return self.shards[self.shard_index(user_id)]
+
+    def scatter(self, func):
+        """
+        Параллельное выполнение функции на всех шардах
+
+        Args:
+            func: Функция от конфигурации шарда
+
+        Returns:
+            list: Результаты в порядке шардов
+        """
+        with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+            return list(executor.map(func, self.shards))
+
+    def _directory_query(self, query, params, fetch=True, raise_errors=False):
+        """
+        Выполнение запроса к справочнику (email -> ID)
+
+        Args:
+            raise_errors (bool): Передавать ошибки вызывающему вместо None
+                (иначе недоступный справочник неотличим от пустого ответа)
+        """
+        db = Database('directory', config=self.directory)
+        if not db.connect():
+            if raise_errors:
+                raise ConnectionError("Справочник шардов недоступен")
+            return None
+        try:
+            if fetch:
+                row = db.fetch_one(query, params)
+                if raise_errors and db.last_error is not None:
+                    raise db.last_error
+                db.connection.commit()
+                return row
+            return db.execute_query(query, params)
+        finally:
+            db.disconnect()
+
+    def reserve_email(self, email):
+        """
+        Резервирование email и выдача глобального ID нового пользователя
+
+        Returns:
+            int: ID пользователя или None, если email уже занят
+
+        Raises:
+            ConnectionError: Справочник недоступен
+            psycopg2.Error: Ошибка запроса к справочнику
+        """
+        row = self._directory_query(
+            """
+            INSERT INTO user_email_index (email, user_id)
+            VALUES (%s, nextval('global_user_id_seq'))
+            ON CONFLICT (email) DO NOTHING
+            RETURNING user_id
+            """,
+            (email,), raise_errors=True
+        )
+        return row[0] if row else None
+
+    def lookup_email(self, email):
+        """ID пользователя по email или None"""
+        row = self._directory_query(
+            "SELECT user_id FROM user_email_index WHERE email = %s", (email,)
+        )
+        return row[0] if row else None
+
+    def email_for_id(self, user_id):
+        """Email пользователя в справочнике или None"""
+        row = self._directory_query(
+            "SELECT email FROM user_email_index WHERE user_id = %s", (user_id,)
+        )
+        return row[0] if row else None
+
+    def lookup_emails(self, emails):
+        """
+        ID пользователей по списку email одним запросом
+
+        Returns:
+            dict: {email: user_id} для найденных email
+
+        Raises:
+            ConnectionError: Справочник недоступен
+            psycopg2.Error: Ошибка запроса к справочнику
+        """
+        db = Database('directory', config=self.directory)
+        if not db.connect():
+            raise ConnectionError("Справочник шардов недоступен")
+        try:
+            rows = db.fetch_all(
+                "SELECT email, user_id FROM user_email_index WHERE email = ANY(%s)", (list(emails),)
+            )
+            if db.last_error is not None:
+                raise db.last_error
+        finally:
+            db.disconnect()
+        return dict(rows)
+
+    def update_email(self, user_id, email):
+        """Смена email пользователя в справочнике (False, если email занят)"""
+        return self._directory_query(
+            "UPDATE user_email_index SET email = %s WHERE user_id = %s",
+            (email, user_id), fetch=False
+        )
+
+    def release(self, user_id):
+        """Удаление пользователя из справочника"""
+        return self._directory_query(
+            "DELETE FROM user_email_index WHERE user_id = %s", (user_id,), fetch=False
+        )
+
+    def release_many(self, user_ids):
+        """Удаление группы пользователей из справочника одним запросом"""
+        return self._directory_query(
+            "DELETE FROM user_email_index WHERE user_id = ANY(%s)", (list(user_ids),), fetch=False
+        )
+
+def get_shard_map():
+    """
+    Карта шардов из текущей конфигурации
+
+    Returns:
+        ShardMap: Карта или None, если шардирование не настроено
+    """
+    try:
+        from db_config import DB_CONFIG
+    except ImportError:
+        return None
+    if not DB_CONFIG.get('shards'):
+        return None
+    return ShardMap(DB_CONFIG)
+
+def unsupported_with_shards(feature, config=None):
+    """
+    Отказ для операции, которая работает только с одной базой
+
+    Args:
+        feature (str): Название операции для сообщения
+        config (dict, optional): Конфигурация (по умолчанию из db_config.py)
+
+    Returns:
+        str: Сообщение об отказе, если настроено шардирование, иначе None
+    """
+    sharded = config.get('shards') if config is not None else get_shard_map() is not None
+    if not sharded:
+        return None
+    return f"{feature} работает только с одной базой, а в конфигурации заданы шарды ('shards')"
+
+def fetch_all_users(shard_map, query, timeout=None):
+    """
+    Параллельный запрос ко всем шардам с объединением строк по ID
+
+    Args:
+        shard_map (ShardMap): Карта шардов
+        query (str): Запрос, возвращающий строки, упорядоченные по первому столбцу (id)
+        timeout (float, optional): Бюджет задержки для каждого шарда
+
+    Returns:
+        list: Строки всех шардов в порядке id
+
+    Raises:
+        ConnectionError: Шард недоступен
+        psycopg2.Error: Ошибка запроса на шарде (неполный результат не возвращается)
+    """
+    def fetch(config):
+        db = Database('get_all', timeout, config=config)
+        if not db.connect():
+            raise ConnectionError(f"Шард {config['database']} недоступен")
+        try:
+            rows = db.fetch_all(query)
+            if db.last_error is not None:
+                raise db.last_error
+            return rows
+        finally:
+            db.disconnect()
+
+    return list(heapq.merge(*shard_map.scatter(fetch), key=lambda row: row[0]))
+
+def gather_stats(shard_map=None):
+    """
+    Статистика по пользователям (по всем шардам параллельно)
+
+    Returns:
+        dict: total_users, users_with_age, avg_age, profiles_count, recent_users
+    """
+    if shard_map is None:
+        shard_map = get_shard_map()
+
+    def collect(config):
+        db = Database('stats', config=config)
+        if not db.connect():
+            raise ConnectionError("База данных недоступна")
+
+        def fetch_one(query):
+            # Агрегаты всегда возвращают строку: None - ошибка запроса
+            row = db.fetch_one(query)
+            if row is None:
+                raise db.last_error or ConnectionError("База данных недоступна")
+            return row
+
+        try:
+            total, with_age, age_sum = fetch_one("SELECT COUNT(*), COUNT(age), SUM(age) FROM users")
+            has_profiles = fetch_one("SELECT to_regclass('user_profiles') IS NOT NULL")[0]
+            profiles = fetch_one("SELECT COUNT(*) FROM user_profiles")[0] if has_profiles else 0
+            recent = db.fetch_all("""
+                SELECT name, email, created_at
+                FROM users
+                ORDER BY created_at DESC
+                LIMIT 3
+            """)
+            if db.last_error is not None:
+                raise db.last_error
+            return total, with_age, age_sum or 0, profiles, recent
+        finally:
+            db.disconnect()
+
+    if shard_map:
+        parts = shard_map.scatter(collect)
+    else:
+        parts = [collect(None)]
+
+    with_age = sum(p[1] for p in parts)
+    recent = [row for p in parts for row in p[4] if row[2] is not None]
+    return {
+        'total_users': sum(p[0] for p in parts),
+        'users_with_age': with_age,
+        'avg_age': sum(p[2] for p in parts) / with_age if with_age else None,
+        'profiles_count': sum(p[3] for p in parts),
+        'recent_users': sorted(recent, key=lambda row: row[2], reverse=True)[:3],
+    }
+
+def rebuild_email_index(shard_map, batch_size=10000):
+    """
+    Заполнение справочника email -> ID пользователями, уже лежащими в шардах
+
+    Нужно после перехода на шардирование с единственной базы: ее
+    пользователи в справочник не попадают, и их email не проверяется на
+    уникальность. Повторный запуск безопасен. Глобальная последовательность
+    ID продвигается за максимальный ID справочника.
+
+    Args:
+        shard_map (ShardMap): Карта шардов
+        batch_size (int): Размер порции чтения из шарда
+
+    Returns:
+        dict: added - добавлено, conflicts - email или ID уже заняты другим
+            пользователем, misplaced - пользователи не в своем шарде по хешу ID
+
+    Raises:
+        ConnectionError: Шард или справочник недоступен
+        psycopg2.Error: Ошибка запроса
+    """
+    directory = Database('directory', config=shard_map.directory)
+    if not directory.connect():
+        raise ConnectionError("Справочник шардов недоступен")
+    stats = Counter(added=0, conflicts=0, misplaced=0)
+    try:
+        for index, config in enumerate(shard_map.shards):
+            db = Database('directory', config=config)
+            if not db.connect():
+                raise ConnectionError(f"Шард {config['database']} недоступен")
+            try:
+                last_id = 0
+                while True:
+                    rows = db.fetch_all(
+                        "SELECT id, email FROM users WHERE id > %s ORDER BY id LIMIT %s",
+                        (last_id, batch_size)
+                    )
+                    if db.last_error is not None:
+                        raise db.last_error
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+                    stats['misplaced'] += sum(1 for user_id, _ in rows if shard_map.shard_index(user_id) != index)
+
+                    added = execute_values(
+                        directory.cursor,
+                        "INSERT INTO user_email_index (email, user_id) VALUES %s "
+                        "ON CONFLICT DO NOTHING RETURNING user_id",
+                        [(email, user_id) for user_id, email in rows],
+                        page_size=len(rows), fetch=True
+                    )
+                    stats['added'] += len(added)
+                    # Не вставленные строки - либо уже в справочнике, либо конфликт
+                    directory.cursor.execute(
+                        """
+                        SELECT COUNT(*)
+                        FROM unnest(%s::text[], %s::integer[]) AS v (email, user_id)
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM user_email_index i
+                            WHERE i.email = v.email AND i.user_id = v.user_id
+                        )
+                        """,
+                        ([email for _, email in rows], [user_id for user_id, _ in rows])
+                    )
+                    stats['conflicts'] += directory.cursor.fetchone()[0]
+            finally:
+                db.disconnect()
+
+        directory.cursor.execute("""
+            SELECT setval('global_user_id_seq', GREATEST(
+                (SELECT COALESCE(MAX(user_id), 0) FROM user_email_index),
+                (SELECT last_value FROM global_user_id_seq)
+            ))
+        """)
+        directory.connection.commit()
+    except Exception:
+        directory.connection.rollback()
+        raise
+    finally:
+        directory.disconnect()
+    return dict(stats)
+
+def reindex_existing_users():
+    """Заполнение справочника существующими пользователями с выводом отчета"""
+    shard_map = get_shard_map()
+    if shard_map is None:
+        print("ℹ️ Шардирование не настроено (ключ 'shards' в db_config.py)")
+        return False
+    try:
+        stats = rebuild_email_index(shard_map)
+    except (ConnectionError, psycopg2.Error) as e:
+        print(f"❌ Ошибка заполнения справочника: {e}")
+        return False
+
+    print(f"✅ Добавлено в справочник email: {stats['added']}")
+    if stats['conflicts']:
+        print(f"⚠️ Email или ID уже заняты другим пользователем: {stats['conflicts']}")
+    if stats['misplaced']:
+        print(f"⚠️ Пользователей не в своем шарде: {stats['misplaced']} "
+              f"(get_by_id ищет их в шарде по хешу ID)")
+    return True
+
+def init_shards():
+    """Создание баз всех шардов и справочника, таблицы users и применение миграций"""
+    try:
+        from db_config import DB_CONFIG
+    except ImportError:
+        print("❌ Файл конфигурации не найден. Запустите setup.py сначала.")
+        return False
+
+    from migrations import run_all_migrations
+    from setup import create_tables
+
+    shards = shard_configs(DB_CONFIG)
+    directory = ShardMap(DB_CONFIG).directory if DB_CONFIG.get('shards') else None
+    # Отдельная база справочника содержит только справочник, без таблицы users
+    extra = [directory] if directory is not None and directory not in shards else []
+    for config in shards + extra:
+        name = config['database']
+        try:
+            conn = psycopg2.connect(
+                host=config['host'], port=config['port'],
+                user=config['user'], password=config['password'],
+                database="postgres"
+            )
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s", (name,))
+            if not cursor.fetchone():
+                cursor.execute(f'CREATE DATABASE "{name}"')
+                print(f"✅ База данных '{name}' создана")
+            conn.close()
+
+            conn = psycopg2.connect(
+                host=config['host'], port=config['port'],
+                user=config['user'], password=config['password'],
+                database=name
+            )
+            if config in shards:
+                create_tables(conn.cursor())
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"❌ Ошибка создания шарда '{name}': {e}")
+            return False
+
+    if not run_all_migrations(DB_CONFIG):
+        return False
+    # Пользователи, которые уже были в базах шардов (например, в прежней
+    # единственной базе), попадают в справочник
+    return reindex_existing_users() if DB_CONFIG.get('shards') else True
+
+def show_status():
+    """Распределение пользователей по шардам"""
+    shard_map = get_shard_map()
+    if shard_map is None:
+        print("ℹ️ Шардирование не настроено (ключ 'shards' в db_config.py)")
+        return
+
+    def count(config):
+        db = Database('stats', config=config)
+        if not db.connect():
+            return None
+        try:
+            row = db.fetch_one("SELECT COUNT(*) FROM users")
+            return row[0] if row else None
+        finally:
+            db.disconnect()
+
+    print("📊 Шарды:")
+    for config, users in zip(shard_map.shards, shard_map.scatter(count)):
+        marker = " (справочник)" if config == shard_map.directory else ""
+        print(f"   {config['database']}{marker}: "
+              f"{users if users is not None else 'недоступен'} пользователей")
+
+def main():
+    parser = argparse.ArgumentParser(description="Управление шардами пользователей")
+    parser.add_argument('command', choices=['init', 'status', 'reindex'],
+                        help="init - создать базы шардов и применить миграции, status - распределение, "
+                             "reindex - внести существующих пользователей в справочник email")
+    args = parser.parse_args()
+    Database.verbose = False
+
+    if args.command == 'init':
+        init_shards()
+    elif args.command == 'reindex':
+        reindex_existing_users()
+    else:
+        show_status()
+
+if __name__ == "__main__":
+    main()
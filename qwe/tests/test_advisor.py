@@ -0,0 +1,36 @@
+from advisor import analyze_plan
+
+TABLE_ROWS = {'users': 1_000_000}
+TABLE_COLUMNS = {'users': {'id', 'name', 'email', 'age', 'created_at'}}
+
+def test_sort_over_seq_scan_suggests_index():
+    plan = {
+        'Node Type': 'Limit',
+        'Plans': [{
+            'Node Type': 'Sort',
+            'Sort Key': ['users.created_at DESC'],
+            'Plans': [{'Node Type': 'Seq Scan', 'Relation Name': 'users'}],
+        }],
+    }
+    suggestions = analyze_plan(plan, TABLE_ROWS, TABLE_COLUMNS)
+    assert [s.to_sql() for s in suggestions] == [
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)"
+    ]
+
+def test_not_null_filter_suggests_partial_index():
+    plan = {
+        'Node Type': 'Aggregate',
+        'Plans': [{'Node Type': 'Seq Scan', 'Relation Name': 'users', 'Filter': '(age IS NOT NULL)'}],
+    }
+    suggestions = analyze_plan(plan, TABLE_ROWS, TABLE_COLUMNS)
+    assert [s.to_sql() for s in suggestions] == [
+        "CREATE INDEX IF NOT EXISTS idx_users_age_not_null ON users(age) WHERE age IS NOT NULL"
+    ]
+
+def test_small_tables_are_ignored():
+    plan = {'Node Type': 'Seq Scan', 'Relation Name': 'users', 'Filter': "(email = 'a')"}
+    assert analyze_plan(plan, {'users': 100}, TABLE_COLUMNS) == []
+
+def test_string_literals_are_not_columns():
+    plan = {'Node Type': 'Seq Scan', 'Relation Name': 'users', 'Filter': "((email)::text = 'age, name'::text)"}
+    assert [s.columns for s in analyze_plan(plan, TABLE_ROWS, TABLE_COLUMNS)] == [('email',)]
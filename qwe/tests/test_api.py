@@ -0,0 +1,140 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import asyncio
+import json
+
+import api
+from api import HttpError, UserService, _validate_fields, parse_conditions
+from database import Database
+from models import User
+from query import UserQuery
+
+def test_parse_conditions():
+    assert parse_conditions({'age__gte': '18', 'status': 'active', 'id__in': '1,2'}) == \
+        {'age__gte': 18, 'status': 'active', 'id__in': [1, 2]}
+    assert parse_conditions({'age__isnull': 'true'}) == {'age__isnull': True}
+
+def test_validate_fields():
+    assert _validate_fields({'name': ' Иван ', 'email': 'i@example.com', 'age': '30'}, required=True) == \
+        {'name': 'Иван', 'email': 'i@example.com', 'age': 30}
+    assert _validate_fields({'age': 31}, required=False) == {'age': 31}
+    with pytest.raises(HttpError):
+        _validate_fields({'name': 'Иван'}, required=True)
+    with pytest.raises(HttpError):
+        _validate_fields({'age': 200}, required=False)
+
+def test_validate_fields_lengths():
+    with pytest.raises(HttpError):
+        _validate_fields({'name': 'И' * 101, 'email': 'i@example.com'}, required=True)
+    with pytest.raises(HttpError):
+        _validate_fields({'email': 'i' * 90 + '@example.com'}, required=False)
+
+async def _request(port, method, path, payload=None):
+    """
+    Один запрос к сервису
+
+    Returns:
+        tuple: (статус, разобранное тело JSON)
+
+    Raises:
+        asyncio.IncompleteReadError: Поток оборван до завершающего блока
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    writer.write(f"{method} {path} HTTP/1.1\r\nConnection: close\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    try:
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) != b'\r\n':
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding') == 'chunked':
+            data = b''
+            while True:
+                size = int(await reader.readuntil(b'\r\n'), 16)
+                chunk = await reader.readexactly(size + 2)
+                if not size:
+                    break
+                data += chunk[:-2]
+        else:
+            data = await reader.readexactly(int(headers.get('content-length', 0)))
+        return status, json.loads(data) if data else None
+    finally:
+        writer.close()
+
+def _serve(scenario):
+    """Запуск сервиса на свободном порту и выполнение scenario(port)"""
+    async def run():
+        service = UserService(pool_size=2)
+        server = await asyncio.start_server(service.handle_connection, '127.0.0.1', 0)
+        try:
+            await scenario(server.sockets[0].getsockname()[1])
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.executor.shutdown()
+            Database.disable_pool()
+        return service
+    return asyncio.run(run())
+
+def test_server_crud_and_list(committed_db):
+    async def scenario(port):
+        status, created = await _request(port, 'POST', '/users', {'name': 'Анна', 'email': 'a@example.com'})
+        assert status == 201
+        for i in range(4):
+            await _request(port, 'POST', '/users', {'name': f'U{i}', 'email': f'u{i}@example.com'})
+
+        status, page = await _request(port, 'GET', '/users?limit=3')
+        assert status == 200
+        assert [u['email'] for u in page['users']] == ['a@example.com', 'u0@example.com', 'u1@example.com']
+        assert page['next_after'] == page['users'][-1]['id']
+        status, page = await _request(port, 'GET', f"/users?after={page['next_after']}")
+        assert [u['email'] for u in page['users']] == ['u2@example.com', 'u3@example.com']
+        assert page['next_after'] is None
+
+        assert (await _request(port, 'GET', f"/users/{created['id']}"))[0] == 200
+        assert (await _request(port, 'GET', '/users/999999'))[0] == 404
+        assert (await _request(port, 'POST', '/users', {'name': 'X', 'email': 'a@example.com'}))[0] == 409
+        assert (await _request(port, 'PATCH', f"/users/{created['id']}", {'email': 'u0@example.com'}))[0] == 409
+        assert (await _request(port, 'PATCH', f"/users/{created['id']}", {'name': 'И' * 101}))[0] == 400
+        assert (await _request(port, 'PATCH', '/users/999999', {'name': 'Б'}))[0] == 404
+        status, updated = await _request(port, 'PATCH', f"/users/{created['id']}", {'name': 'Анна Б'})
+        assert (status, updated['name']) == (200, 'Анна Б')
+        assert (await _request(port, 'DELETE', f"/users/{created['id']}"))[0] == 204
+
+    service = _serve(scenario)
+    assert service.metrics['create'].statuses[409] == 1
+
+def test_server_reports_database_errors(committed_db, monkeypatch):
+    monkeypatch.setattr(api, 'PAGE_SIZE', 2)
+    for i in range(5):
+        User(name=f'U{i}', email=f'u{i}@example.com', age=None).save()
+
+    async def scenario(port):
+        # Ошибка на второй странице - поток оборван, а не короткий список
+        calls = []
+        run = UserQuery._run
+        def failing_run(self, *args, **kwargs):
+            calls.append(args)
+            if len(calls) > 1:
+                raise ConnectionError("База данных недоступна")
+            return run(self, *args, **kwargs)
+        monkeypatch.setattr(UserQuery, '_run', failing_run)
+        with pytest.raises(asyncio.IncompleteReadError):
+            await _request(port, 'GET', '/users')
+
+        # Ошибка до заголовков и при поиске по ID - 503, а не пустой список и 404
+        monkeypatch.setattr(Database, 'connect', lambda self: False)
+        assert (await _request(port, 'GET', '/users'))[0] == 503
+        assert (await _request(port, 'GET', '/users/1'))[0] == 503
+        assert (await _request(port, 'PATCH', '/users/1', {'name': 'Б'}))[0] == 503
+
+        # Непредвиденная ошибка обработчика - 500
+        monkeypatch.setattr(User, 'get_many', staticmethod(lambda ids, timeout=None: 1 / 0))
+        assert (await _request(port, 'GET', '/users/1'))[0] == 500
+
+    service = _serve(scenario)
+    assert service.metrics['list'].statuses == {503: 2}
@@ -0,0 +1,29 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from batch import run_add, run_update
+
+def test_add_saves_phone(db):
+    results = run_add(db.cursor, [(1, {'name': 'Иван', 'email': 'i@example.com', 'phone': '+7 900'})])
+    assert results[1]['ok']
+    assert db.fetch_one("SELECT phone FROM users WHERE email = 'i@example.com'") == ('+7 900',)
+
+def test_add_isolates_invalid_rows(db):
+    results = run_add(db.cursor, [
+        (1, {'name': 'A', 'email': 'a@example.com'}),
+        (2, {'name': 'B', 'email': 'b@example.com', 'phone': '1' * 21}),
+        (3, {'name': 'C' * 101, 'email': 'c@example.com'}),
+        # Проходит проверку, но отвергается при вставке
+        (4, {'name': 'D\x00', 'email': 'd@example.com'}),
+        (5, {'name': 'E', 'email': 'a@example.com'}),
+        (6, {'name': 'F', 'email': 'f@example.com'}),
+    ])
+    assert [results[i]['ok'] for i in range(1, 7)] == [True, False, False, False, False, True]
+    assert 'уже существует' in results[5]['error']
+    assert db.fetch_one("SELECT COUNT(*) FROM users")[0] == 2
+
+def test_update_validates_lengths(db):
+    from batch import BatchError
+    with pytest.raises(BatchError):
+        run_update(db.cursor, [(1, {'id': 1, 'phone': '1' * 21})])
@@ -0,0 +1,29 @@
+import pytest
+
+from bloom import BloomFilter
+
+def test_added_items_are_found():
+    bloom = BloomFilter(1000, 0.01)
+    emails = [f"user{i}@example.com" for i in range(1000)]
+    for email in emails:
+        bloom.add(email)
+    assert all(email in bloom for email in emails)
+    assert len(bloom) == 1000
+
+def test_false_positive_rate_is_bounded():
+    bloom = BloomFilter(10_000, 0.01)
+    for i in range(10_000):
+        bloom.add(f"user{i}@example.com")
+    false_positives = sum(f"other{i}@example.com" in bloom for i in range(10_000))
+    assert false_positives / 10_000 < 0.02
+
+def test_memory_is_fixed():
+    bloom = BloomFilter(1_000_000, 0.01)
+    # ~9.6 бита на элемент при 1% ошибок
+    assert 1_100_000 < bloom.memory_bytes < 1_300_000
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        BloomFilter(0)
+    with pytest.raises(ValueError):
+        BloomFilter(100, 1.5)
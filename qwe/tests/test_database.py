@@ -0,0 +1,116 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import database
+from database import Database
+
+def _capture(config, query, params=None):
+    """Выполнение запроса через Database и ожидание фонового захвата плана"""
+    db = Database('capture', config=config)
+    assert db.connect()
+    try:
+        db.fetch_all(query, params)
+    finally:
+        db.disconnect()
+    database._plan_queue.join()
+
+def _captured(committed_db, operation='capture'):
+    return committed_db.fetch_all(
+        "SELECT query, plan FROM slow_query_log WHERE operation = %s ORDER BY id", (operation,)
+    )
+
+@pytest.fixture
+def slow_config(test_database):
+    """Конфигурация, в которой любой запрос считается медленным"""
+    return dict(test_database, slow_query_threshold=0, slow_query_cooldown=0)
+
+def test_slow_query_plan_is_captured_without_analyze(committed_db, slow_config):
+    _capture(slow_config, "SELECT id FROM users WHERE age > %s", (30,))
+    [(query, plan)] = _captured(committed_db)
+    # В журнал попадает текст с плейсхолдерами, значения параметров не сохраняются
+    assert query == "SELECT id FROM users WHERE age > %s"
+    assert plan[0]['Plan']['Relation Name'] == 'users'
+    # Без slow_query_analyze запрос повторно не выполняется
+    assert 'Actual Total Time' not in plan[0]['Plan']
+
+def test_slow_query_analyze_is_opt_in(committed_db, slow_config):
+    _capture(dict(slow_config, slow_query_analyze=True), "SELECT id FROM users WHERE age > %s", (40,))
+    [(_, plan)] = _captured(committed_db)
+    assert 'Actual Total Time' in plan[0]['Plan']
+
+def test_sampling_and_cooldown_limit_captures(committed_db, slow_config):
+    _capture(dict(slow_config, slow_query_sample_rate=0), "SELECT id FROM users WHERE age > 50")
+    assert _captured(committed_db) == []
+
+    config = dict(slow_config, slow_query_cooldown=300)
+    for _ in range(3):
+        _capture(config, "SELECT id FROM users WHERE age > 60")
+    assert len(_captured(committed_db)) == 1
+
+def test_cooldown_map_is_bounded(committed_db, slow_config, monkeypatch):
+    monkeypatch.setattr(database, 'MAX_TRACKED_SLOW_QUERIES', 3)
+    monkeypatch.setattr(database, '_last_captured', database.OrderedDict())
+    config = dict(slow_config, slow_query_cooldown=300)
+    for age in range(5):
+        _capture(config, f"SELECT id FROM users WHERE age > {age}")
+    assert list(database._last_captured) == [
+        f"SELECT id FROM users WHERE age > {age}" for age in (2, 3, 4)
+    ]
+
+def test_expired_cooldowns_are_pruned(committed_db, slow_config, monkeypatch):
+    monkeypatch.setattr(database, '_last_captured', database.OrderedDict())
+    _capture(dict(slow_config, slow_query_cooldown=300), "SELECT 1")
+    # Запись старше cooldown удаляется при следующем захвате
+    database._last_captured["SELECT 1"] -= 600
+    _capture(dict(slow_config, slow_query_cooldown=300), "SELECT 2")
+    assert list(database._last_captured) == ["SELECT 2"]
+
+def test_capture_errors_respect_verbose(committed_db, slow_config, monkeypatch, capsys):
+    broken = dict(slow_config, database='no_such_database')
+    monkeypatch.setattr(Database, 'verbose', False)
+    database._submit_plan_capture(broken, "SELECT 1", None, 1.0, 'capture')
+    database._plan_queue.join()
+    assert 'план' not in capsys.readouterr().out
+
+    monkeypatch.setattr(Database, 'verbose', True)
+    database._submit_plan_capture(broken, "SELECT 2", None, 1.0, 'capture')
+    database._plan_queue.join()
+    assert 'Не удалось сохранить план' in capsys.readouterr().out
+
+def test_default_statement_timeouts(test_database):
+    assert Database('get_by_id', config=test_database).timeout == database.DEFAULT_STATEMENT_TIMEOUTS['get_by_id']
+    config = dict(test_database, statement_timeouts={'get_all': None})
+    assert Database('get_all', config=config).timeout is None
+    assert Database('get_all', timeout=3, config=config).timeout == 3
+
+def test_statement_timeout_raises_and_is_counted(test_database):
+    before = database.get_timeout_stats().get('sleep', 0)
+    db = Database('sleep', timeout=0.1, config=test_database)
+    assert db.connect()
+    try:
+        with pytest.raises(database.QueryTimeoutError) as info:
+            db.fetch_all("SELECT pg_sleep(2)")
+        assert info.value.operation == 'sleep' and info.value.timeout == 0.1
+        # После отмены подключение пригодно для следующих запросов
+        assert db.fetch_one("SELECT 1") == (1,)
+    finally:
+        db.disconnect()
+    assert database.get_timeout_stats()['sleep'] == before + 1
+
+def test_manual_cancel_is_not_a_timeout(committed_db, test_database):
+    import threading
+
+    before = database.get_timeout_stats().get('sleep', 0)
+    db = Database('sleep', timeout=30, config=test_database)
+    assert db.connect()
+    pid = db.connection.get_backend_pid()
+    cancel = threading.Timer(0.2, lambda: committed_db.fetch_one("SELECT pg_cancel_backend(%s)", (pid,)))
+    cancel.start()
+    try:
+        assert db.fetch_all("SELECT pg_sleep(5)") == []
+        assert isinstance(db.last_error, database.psycopg2.errors.QueryCanceled)
+    finally:
+        cancel.join()
+        db.disconnect()
+    assert database.get_timeout_stats().get('sleep', 0) == before
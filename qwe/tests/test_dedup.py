@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from dedup import (blocking_keys, candidate_groups, cluster_pairs, find_duplicates, make_record,
+                   merge_report, normalize_email, normalize_name, score_pair)
+from models import User
+
+def test_normalize_email():
+    assert normalize_email("Ivan.Ivanov+shop@GoogleMail.com") == \
+        ("ivanivanov@gmail.com", "ivanivanov", "gmail.com")
+    # Вне gmail точки значимы для ящика, но не для ключа сравнения
+    assert normalize_email("Ivan.Ivanov@mail.ru") == ("ivan.ivanov@mail.ru", "ivanivanov", "mail.ru")
+
+def test_normalize_name_ignores_order_case_and_script():
+    assert normalize_name("Иванов  Иван") == normalize_name("ivan IVANOV") == "ivan ivanov"
+
+def test_score_pair():
+    a = make_record(1, "Иван Иванов", "Ivan.Ivanov@mail.ru")
+    b = make_record(2, "Ivanov Ivan", "ivanivanov@mail.ru")
+    other = make_record(3, "Петр Сидоров", "sidorov@yandex.ru")
+    assert score_pair(a, b) == (1.0, ['email_local', 'name'])
+    assert score_pair(a, other)[0] < 0.5
+
+def test_large_blocks_use_window():
+    records = [make_record(i, "Иван Иванов", f"user{i}@example.com") for i in range(100)]
+    assert ('name', 'ivan ivanov') in blocking_keys(records[0])
+    assert {mode for mode, _ in candidate_groups(records, window=3, max_block=10)} == {'window'}
+
+def test_find_duplicates_without_database():
+    records = [
+        make_record(1, "Иван Иванов", "Ivan.Ivanov@mail.ru"),
+        make_record(2, "Ivanov Ivan", "ivanivanov@mail.ru"),
+        make_record(3, "Анна", "anna@example.com"),
+        make_record(4, "Петр", "petr+a@gmail.com"),
+        make_record(5, "Петр", "p.e.t.r@gmail.com"),
+    ]
+    result = find_duplicates(workers=1, records=records)
+    assert result['clusters'] == [[1, 2], [4, 5]]
+
+def test_cluster_pairs_is_transitive():
+    assert cluster_pairs([(3, 4), (1, 2), (2, 3), (7, 8)]) == [[1, 2, 3, 4], [7, 8]]
+
+def test_merge_report_from_database(db):
+    for name, email in (("Иван Иванов", "ivan.ivanov@example.com"),
+                        ("Ivanov Ivan", "ivanivanov@example.com"),
+                        ("Анна Смирнова", "anna@example.com")):
+        User(name=name, email=email, age=30).save()
+    result = find_duplicates(workers=1)
+    report = merge_report(result)
+    assert len(report) == 1
+    assert sorted(user['email'] for user in report[0]['users']) == \
+        ["ivan.ivanov@example.com", "ivanivanov@example.com"]
+    assert report[0]['keep'] == min(report[0]['ids'])
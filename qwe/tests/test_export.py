@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import csv
+import json
+
+import psycopg2
+
+from export import IncrementalExporter, export_parallel, id_ranges
+
+def test_id_ranges_cover_all_ids():
+    ranges = id_ranges(1, 10, 3)
+    assert ranges == [(1, 5), (5, 9), (9, 11)]
+
+def test_id_ranges_small_table():
+    assert id_ranges(7, 8, 16) == [(7, 8), (8, 9)]
+    assert id_ranges(None, None, 4) == []
+
+def test_transaction_opened_before_export_is_not_skipped(committed_db, test_database):
+    # Транзакция началась до экспорта, но еще ничего не записала (нет xid)
+    late = psycopg2.connect(**{k: test_database[k] for k in ('host', 'port', 'user', 'password', 'database')})
+    try:
+        late_cursor = late.cursor()
+        late_cursor.execute("SELECT 1")
+        committed_db.execute_query(
+            "INSERT INTO users (name, email, age) VALUES ('Ранний', 'early@example.com', 30)"
+        )
+
+        exporter = IncrementalExporter('test')
+        assert exporter.connect()
+        try:
+            list(exporter.changes())
+            assert exporter.save_watermark(exporter.watermark)
+
+            # Строка получит updated_at = начало транзакции, т.е. раньше строки выше
+            late_cursor.execute(
+                "INSERT INTO users (name, email, age) VALUES ('Поздний', 'late@example.com', 30)"
+            )
+            late.commit()
+
+            exported = [change['user']['email'] for change in exporter.changes()
+                        if change['op'] == 'upsert']
+        finally:
+            exporter.disconnect()
+    finally:
+        late.close()
+    assert 'late@example.com' in exported
+
+def test_parallel_export_matches_table(committed_db, tmp_path):
+    for i in range(57):
+        committed_db.execute_query(
+            "INSERT INTO users (name, email, age) VALUES (%s, %s, %s)",
+            (f"Пользователь {i}", f"user{i}@example.com", 20 + i % 40)
+        )
+    expected = {row[0] for row in committed_db.fetch_all("SELECT id FROM users")}
+
+    manifest = export_parallel(str(tmp_path), workers=3, parts=5)
+    assert manifest is not None
+    assert json.loads((tmp_path / 'manifest.json').read_text(encoding='utf-8')) == manifest
+    assert manifest['rows'] == len(expected)
+    assert [part['part'] for part in manifest['parts']] == [1, 2, 3, 4, 5]
+
+    exported = []
+    for part in manifest['parts']:
+        with open(tmp_path / part['file'], encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == part['rows']
+        assert all(part['id_from'] <= int(row['id']) < part['id_to'] for row in rows)
+        exported.extend(int(row['id']) for row in rows)
+    # Каждая строка выгружена ровно один раз
+    assert sorted(exported) == sorted(expected)
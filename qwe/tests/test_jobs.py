@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import jobs
+
+def test_retry_delay_is_exponential():
+    assert [jobs.retry_delay(n) for n in (1, 2, 3)] == [10, 20, 40]
+
+def test_job_runs_and_completes(db, monkeypatch):
+    calls = []
+    monkeypatch.setitem(jobs.HANDLERS, 'test', lambda payload, job: calls.append(payload) or {'ok': True})
+    job_id = jobs.enqueue('test', {'x': 1})
+    assert jobs.Worker(kinds=['test']).run(max_jobs=1) == 1
+    assert calls == [{'x': 1}]
+    assert db.fetch_one("SELECT status, attempts, result FROM jobs WHERE id = %s", (job_id,)) == \
+        ('done', 1, {'ok': True})
+
+def test_failed_job_is_requeued_with_delay(db, monkeypatch):
+    def broken(payload, job):
+        raise RuntimeError("сбой")
+    monkeypatch.setitem(jobs.HANDLERS, 'test', broken)
+    job_id = jobs.enqueue('test', max_attempts=2)
+    worker = jobs.Worker(kinds=['test'])
+    worker.run(max_jobs=1)
+    status, attempts, error, delayed = db.fetch_one(
+        "SELECT status, attempts, last_error, run_after > now() FROM jobs WHERE id = %s", (job_id,)
+    )
+    assert (status, attempts, delayed) == ('queued', 1, True)
+    assert "сбой" in error
+    # Отложенная задача не выдается до run_after
+    assert worker.db.connect() and worker.claim() is None
+
+def test_worker_survives_killed_backend(committed_db, monkeypatch):
+    calls = []
+    monkeypatch.setitem(jobs.HANDLERS, 'test', lambda payload, job: calls.append(payload) or {})
+    monkeypatch.setattr(jobs, 'RECONNECT_DELAY', 0.05)
+    worker = jobs.Worker(kinds=['test'], poll_interval=0.05)
+    thread = threading.Thread(target=worker.run, kwargs={'max_jobs': 1}, daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 5
+    while worker.db.connection is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    backend = worker.db.connection.get_backend_pid()
+    assert committed_db.fetch_one("SELECT pg_terminate_backend(%s)", (backend,)) == (True,)
+
+    job_id = jobs.enqueue('test', {'after': 'restart'})
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert calls == [{'after': 'restart'}]
+    assert committed_db.fetch_one("SELECT status FROM jobs WHERE id = %s", (job_id,)) == ('done',)
+
+def test_migrate_job_applies_migrations(db, monkeypatch):
+    import migrations
+    calls = []
+    monkeypatch.setattr(migrations, 'run_all_migrations', lambda: calls.append(True) or True)
+    jobs.enqueue('migrate')
+    assert jobs.Worker(kinds=['migrate']).run(max_jobs=1) == 1
+    assert calls == [True]
+    assert db.fetch_one("SELECT status FROM jobs WHERE kind = 'migrate'") == ('done',)
+
+def test_queue_status_reports_query_errors(db, monkeypatch, capsys):
+    def failing_fetch_one(self, query, params=None):
+        self.last_error = psycopg2.OperationalError("server closed the connection")
+        return None
+    monkeypatch.setattr(type(db), 'fetch_one', failing_fetch_one)
+    assert jobs.queue_status() is None
+    assert 'Ошибка чтения очереди' in capsys.readouterr().out
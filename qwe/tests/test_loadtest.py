@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from loadtest import LoadContext, _timed, parse_mix, run_load
+
+def test_parse_mix_rejects_empty_weights():
+    assert parse_mix("get=3,update") == (['get', 'update'], [3.0, 1.0])
+    with pytest.raises(ValueError):
+        parse_mix("get=0,update=0")
+    with pytest.raises(ValueError):
+        parse_mix("get=-1,update=2")
+
+def test_run_load_rejects_zero_duration():
+    with pytest.raises(ValueError):
+        run_load(duration=0)
+
+def test_get_counts_database_errors(db, monkeypatch):
+    from conftest import TransactionalDatabase
+    from models import User
+
+    user = User(name="Нагрузка", email="load@example.com", age=30)
+    assert user.save()
+    ctx = LoadContext((user.id, user.id), seed=1)
+    samples = []
+    _timed(ctx, 'get', 0.0, 0.0, samples)
+    _timed(ctx, 'update', 0.0, 0.0, samples)
+    assert [sample[3] for sample in samples] == [True, True]
+
+    monkeypatch.setattr(TransactionalDatabase, 'connect', lambda self: False)
+    _timed(ctx, 'get', 0.0, 0.0, samples)
+    _timed(ctx, 'update', 0.0, 0.0, samples)
+    assert [sample[3] for sample in samples[2:]] == [False, False]
+
+def test_get_uses_get_by_id(monkeypatch):
+    from models import User
+
+    calls = []
+    monkeypatch.setattr(User, 'get_by_id', staticmethod(lambda user_id: calls.append(user_id)))
+    monkeypatch.setattr(User, 'get_many', staticmethod(lambda *args: pytest.fail("get_many")))
+    ctx = LoadContext((5, 5), seed=1)
+    samples = []
+    _timed(ctx, 'get', 0.0, 0.0, samples)
+    assert calls == [5] and samples[0][3] is False
+
+def test_context_random_is_reproducible():
+    first, second = LoadContext((1, 1000), seed=7), LoadContext((1, 1000), seed=7)
+    assert [first.random_id() for _ in range(5)] == [second.random_id() for _ in range(5)]
+    assert first.randint(16, 85) == second.randint(16, 85)
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from maintenance import (
+    estimate_bloat, expected_btree_bytes, leaf_density_bloat, needs_analyze, needs_vacuum,
+    table_health,
+)
+
+def test_estimate_bloat():
+    assert estimate_bloat(1000, 250) == (750, 0.75)
+    assert estimate_bloat(1000, 2000) == (0, 0.0)
+    assert estimate_bloat(0, 100) == (0, 0.0)
+    assert estimate_bloat(1000, None) == (None, None)
+
+def test_expected_btree_bytes():
+    # integer: 8 байт заголовка + 4 байта ключа (выравнивание до 8) + ItemId -
+    # 366 записей на страницу при fillfactor 90
+    assert expected_btree_bytes(300_000, 4, False) == (1 + 820) * 8192
+    assert expected_btree_bytes(0, 4, False) == 8192
+    assert leaf_density_bloat(8192 * 100, 45.0) == (8192 * 50, 0.5)
+    assert leaf_density_bloat(8192 * 100, 95.0) == (0, 0.0)
+
+def test_table_health_on_fresh_data(db):
+    db.execute_query(
+        "INSERT INTO users (name, email, age) "
+        "SELECT 'Пользователь ' || i, 'health' || i || '@example.com', 20 + i %% 50 "
+        "FROM generate_series(1, 20000) AS i"
+    )
+    db.execute_query("CREATE INDEX idx_test_users_age ON users(age)")
+    db.execute_query("ANALYZE users")
+
+    users, = table_health(db, ['users'])
+    assert users['live'] >= 0 and users['bloat'] < 0.15
+    indexes = {name: (size, bloat) for name, size, _, bloat in users['indexes']}
+    # Только что построенные и заполненные по возрастанию ключа индексы не раздуты
+    assert indexes['users_pkey'][0] > 0 and indexes['users_pkey'][1] < 0.15
+    assert indexes['idx_test_users_age'][1] < 0.15
+
+def test_needs_analyze():
+    assert needs_analyze(0, 50_000, never_analyzed=True)
+    assert needs_analyze(100_000, 20_000)
+    assert not needs_analyze(100_000, 5_000)
+    assert not needs_analyze(10, 500)
+
+def test_needs_vacuum():
+    assert needs_vacuum(10_000, 5_000)
+    assert not needs_vacuum(100_000, 5_000)
+    assert not needs_vacuum(100, 500)
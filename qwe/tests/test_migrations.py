@@ -0,0 +1,101 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import psycopg2
+
+from migrations import (
+    BASELINE_PATH, apply_baseline, get_migrations, is_data_statement, load_baseline,
+    squash_migrations,
+)
+from setup import add_seed_users, create_tables
+
+def test_baseline_matches_migrations():
+    names, _ = load_baseline()
+    assert names == list(get_migrations())
+
+def test_squash_is_schema_only(tmp_path):
+    path = tmp_path / 'baseline.sql'
+    squash_migrations(str(path))
+    data = path.read_bytes()
+    # Файл в репозитории совпадает с результатом squash, включая переводы строк
+    with open(BASELINE_PATH, 'rb') as f:
+        assert data == f.read()
+    assert b'\r\n' in data and b'\r\r' not in data
+
+    sql = data.decode('utf-8')
+    for commands in get_migrations().values():
+        for command in filter(is_data_statement, commands):
+            assert command.strip().splitlines()[0].strip() not in sql
+
+def _connect(config):
+    return psycopg2.connect(
+        host=config['host'], port=config['port'], user=config['user'],
+        password=config['password'], database=config['database']
+    )
+
+def _columns(config):
+    conn = _connect(config)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name, column_name, data_type FROM information_schema.columns "
+                "WHERE table_schema = current_schema() ORDER BY 1, 2"
+            )
+            columns = cursor.fetchall()
+            cursor.execute("SELECT name FROM migrations ORDER BY name")
+            return columns, cursor.fetchall()
+    finally:
+        conn.close()
+
+def _row_counts(config, seed=False):
+    """Количество строк в каждой таблице (seed - с тестовыми пользователями, без коммита)"""
+    conn = _connect(config)
+    try:
+        with conn.cursor() as cursor:
+            if seed:
+                add_seed_users(cursor)
+            cursor.execute(
+                "SELECT table_name FROM information_schema.tables "
+                "WHERE table_schema = current_schema() AND table_type = 'BASE TABLE' ORDER BY 1"
+            )
+            counts = {}
+            for (table,) in cursor.fetchall():
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                counts[table] = cursor.fetchone()[0]
+            return counts
+    finally:
+        conn.rollback()
+        conn.close()
+
+def test_baseline_schema_matches_migrations(test_database):
+    from conftest import _admin_connect
+
+    name = f"{test_database['database']}_baseline"
+    admin = _admin_connect(test_database)
+    cursor = admin.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+    cursor.execute(f"CREATE DATABASE {name}")
+    config = dict(test_database, database=name)
+    try:
+        conn = psycopg2.connect(
+            host=config['host'], port=config['port'], user=config['user'],
+            password=config['password'], database=name
+        )
+        try:
+            # Порядок как в setup.create_database: схема, затем тестовые данные
+            with conn.cursor() as baseline_cursor:
+                assert apply_baseline(baseline_cursor) == list(get_migrations())
+                create_tables(baseline_cursor)
+                add_seed_users(baseline_cursor)
+            conn.commit()
+        finally:
+            conn.close()
+        assert _columns(config) == _columns(test_database)
+        # Данные совпадают с базой, где те же пользователи добавлены после миграций
+        counts = _row_counts(config)
+        assert counts == _row_counts(test_database, seed=True)
+        assert counts['users'] == 3 and counts['user_profiles'] == 0
+    finally:
+        cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+        admin.close()
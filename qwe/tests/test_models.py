@@ -0,0 +1,156 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from models import User
+
+def test_save_creates_user(db):
+    user = User(name="Тест", email="test@example.com", age=20)
+    assert user.save()
+    assert user.id is not None
+    assert User.get_by_id(user.id).email == "test@example.com"
+
+def test_save_updates_user(db):
+    user = User(name="Тест", email="update@example.com", age=20)
+    user.save()
+    user.age = 21
+    assert user.save()
+    assert User.get_by_id(user.id).age == 21
+
+def test_get_by_email(db):
+    User(name="Тест", email="find@example.com", age=30).save()
+    assert User.get_by_email("find@example.com").name == "Тест"
+    assert User.get_by_email("missing@example.com") is None
+
+def test_duplicate_email_rejected(db):
+    assert User(name="A", email="dup@example.com", age=1).save()
+    assert not User(name="B", email="dup@example.com", age=2).save()
+
+def test_delete(db):
+    user = User(name="Тест", email="delete@example.com", age=40)
+    user.save()
+    assert user.delete()
+    assert User.get_by_id(user.id) is None
+
+def test_get_many_keeps_input_order(db):
+    users = [User(name="Тест", email=f"get{i}@example.com", age=20) for i in range(3)]
+    for user in users:
+        user.save()
+    found, missing = User.get_many([users[2].id, 10**9, users[0].id])
+    assert [u.id for u in found] == [users[2].id, users[0].id]
+    assert missing == [10**9]
+
+def test_get_many_by_email(db):
+    User(name="A", email="a@example.com", age=20).save()
+    User(name="B", email="b@example.com", age=20).save()
+    found, missing = User.get_many_by_email(["b@example.com", "none@example.com", "a@example.com"])
+    assert [u.name for u in found] == ["B", "A"]
+    assert missing == ["none@example.com"]
+
+def test_delete_many(db):
+    users = [User(name="Тест", email=f"many{i}@example.com", age=20) for i in range(5)]
+    for user in users:
+        user.save()
+    progress = []
+    deleted = User.delete_many([u.id for u in users[:3]] + [10**9], batch_size=2, pause=0,
+                               progress=lambda done, total: progress.append(done))
+    assert deleted == 3
+    assert progress == [2, 3]
+    assert [u.id for u in User.get_all()] == [u.id for u in users[3:]]
+
+def test_purge_by_status(db):
+    active = User(name="A", email="active@example.com", age=20)
+    inactive = User(name="B", email="inactive@example.com", age=20)
+    active.save()
+    inactive.save()
+    db.execute_query("UPDATE users SET status = 'inactive' WHERE id = %s", (inactive.id,))
+    assert User.purge(status='inactive', batch_size=1, pause=0) == 1
+    assert [u.id for u in User.get_all()] == [active.id]
+
+def test_purge_requires_condition(db):
+    User(name="A", email="keep@example.com", age=20).save()
+    assert User.purge() == 0
+    assert len(User.get_all()) == 1
+
+def test_get_all_is_isolated(db):
+    # Данные предыдущих тестов откатываются
+    assert User.get_all() == []
+
+def test_coalesce_changes():
+    from models import coalesce_changes
+    events = [
+        {'table': 'users', 'op': 'update', 'id': 1, 'changed': ['age']},
+        {'table': 'users', 'op': 'insert', 'id': 2},
+        {'table': 'users', 'op': 'update', 'id': 1, 'changed': ['name']},
+        {'table': 'users', 'op': 'update', 'id': 2, 'changed': ['age']},
+        {'table': 'users', 'op': 'insert', 'id': 3},
+        {'table': 'users', 'op': 'delete', 'id': 3},
+        {'table': 'user_profiles', 'op': 'insert', 'id': 1, 'shard': 'a'},
+        {'table': 'user_profiles', 'op': 'delete', 'id': 1, 'shard': 'b'},
+    ]
+    assert coalesce_changes(events) == [
+        {'table': 'users', 'op': 'update', 'id': 1, 'changed': ['age', 'name']},
+        {'table': 'users', 'op': 'insert', 'id': 2},
+        {'table': 'user_profiles', 'op': 'insert', 'id': 1, 'shard': 'a'},
+        {'table': 'user_profiles', 'op': 'delete', 'id': 1, 'shard': 'b'},
+    ]
+
+def test_get_many_raises_when_database_is_down(db, monkeypatch):
+    from conftest import TransactionalDatabase
+    monkeypatch.setattr(TransactionalDatabase, 'connect', lambda self: False)
+    with pytest.raises(ConnectionError):
+        User.get_many([1])
+
+def test_pool_survives_failed_reset(committed_db, test_database):
+    from database import ConnectionPool
+    pool = ConnectionPool(test_database, maxconn=1)
+    try:
+        conn = pool.getconn()
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        committed_db.fetch_one("SELECT pg_terminate_backend(%s)", (conn.get_backend_pid(),))
+        pool.putconn(conn)
+
+        conn = pool.getconn(timeout=1)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            assert cursor.fetchone() == (1,)
+        pool.putconn(conn)
+    finally:
+        pool.closeall()
+
+def test_watch_publishes_changes(committed_db):
+    import threading
+    import time
+
+    events = []
+    watcher = threading.Thread(target=lambda: events.extend(User.watch(coalesce=0.05, idle_timeout=1)))
+    watcher.start()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        listening = committed_db.fetch_one(
+            "SELECT COUNT(*) FROM pg_stat_activity WHERE query = 'LISTEN user_changes'"
+        )[0]
+        # Снимок pg_stat_activity фиксируется до конца транзакции
+        committed_db.connection.commit()
+        if listening:
+            break
+        time.sleep(0.01)
+
+    user = User(name="Тест", email="watch@example.com", age=20)
+    assert user.save()
+    time.sleep(0.2)
+    # Пустое обновление (меняется только updated_at) не публикуется
+    committed_db.execute_query("UPDATE users SET name = name WHERE id = %s", (user.id,))
+    time.sleep(0.2)
+    user.age = 21
+    assert user.save()
+    time.sleep(0.2)
+    assert user.delete()
+    watcher.join()
+
+    assert events == [
+        {'table': 'users', 'op': 'insert', 'id': user.id},
+        {'table': 'users', 'op': 'update', 'id': user.id, 'changed': ['age']},
+        {'table': 'users', 'op': 'delete', 'id': user.id},
+    ]
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from models import User
+from query import UserQuery, compile_query
+
+def test_sql_pushes_predicates_sort_and_limit():
+    query, params = User.filter(age__gte=18, status="active").order_by("-created_at").limit(50).sql()
+    assert query == ("SELECT id, name, email, age, created_at FROM users "
+                     "WHERE age >= %s AND status = %s ORDER BY created_at DESC, id LIMIT %s")
+    assert params == [18, "active", 50]
+
+def test_same_shape_reuses_compiled_sql():
+    compile_query.cache_clear()
+    User.filter(age__gte=18).sql()
+    User.filter(age__gte=65).sql()
+    assert compile_query.cache_info().hits == 1
+
+def test_count_and_exists_sql():
+    query = User.filter(email__isnull=False)
+    assert query.sql('count')[0] == "SELECT COUNT(*) FROM users WHERE email IS NOT NULL"
+    assert query.sql('exists')[0] == "SELECT EXISTS (SELECT 1 FROM users WHERE email IS NOT NULL)"
+
+def test_unknown_field_rejected():
+    with pytest.raises(ValueError):
+        UserQuery(User).filter(password="x")
+
+def test_filter_runs_in_database(db):
+    for i, age in enumerate([15, 20, 40]):
+        User(name=f"U{i}", email=f"q{i}@example.com", age=age).save()
+    adults = User.filter(age__gte=18).order_by("-age")
+    assert [u.age for u in adults.all()] == [40, 20]
+    assert adults.count() == 2
+    assert adults.limit(1).count() == 1
+    assert adults.exists()
+    assert not User.filter(age__gt=100).exists()
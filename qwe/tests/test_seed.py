@@ -0,0 +1,30 @@
+import threading
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from seed import _connect, reserve_ids
+
+def test_reserve_ids_does_not_overlap_concurrent_insert(committed_db, test_database):
+    # Вставка в открытой транзакции уже получила ID из последовательности
+    conn = _connect(test_database)
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (name, email) VALUES ('A', 'a@example.com') RETURNING id")
+    inserted = cursor.fetchone()[0]
+
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(first=reserve_ids(test_database, 100)))
+    thread.start()
+    thread.join(0.3)
+    # Резервирование ждет завершения вставки
+    assert thread.is_alive()
+    conn.commit()
+    conn.close()
+    thread.join(5)
+
+    first = result['first']
+    assert first > inserted
+    second = reserve_ids(test_database, 10)
+    assert second == first + 100
+    assert committed_db.fetch_one("SELECT nextval('users_id_seq')")[0] == second + 10
@@ -0,0 +1,208 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import psycopg2
+
+from database import Database
+from models import User
+from sharding import ShardMap, fetch_all_users, gather_stats, rebuild_email_index
+
+def _shard_ids(config):
+    db = Database(config=config)
+    assert db.connect()
+    try:
+        return {row[0] for row in db.fetch_all("SELECT id FROM users")}
+    finally:
+        db.disconnect()
+
+def _create(count):
+    users = []
+    for i in range(count):
+        user = User(name=f"U{i}", email=f"u{i}@example.com", age=20 + i % 7)
+        assert user.save()
+        users.append(user)
+    return users
+
+def test_users_routed_to_their_shard(sharded_db):
+    users = _create(20)
+    stored = [_shard_ids(config) for config in sharded_db.shards]
+    for user in users:
+        assert user.id in stored[sharded_db.shard_index(user.id)]
+    assert all(stored) and not stored[0] & stored[1]
+    # Справочник - отдельная база без пользователей
+    assert not _shard_ids(sharded_db.directory)
+    assert User.get_by_id(users[3].id).email == "u3@example.com"
+    assert User.get_by_email("u4@example.com").id == users[4].id
+
+def test_scatter_gather_ordering(sharded_db):
+    users = _create(20)
+    assert [user.id for user in User.get_all()] == sorted(user.id for user in users)
+
+    expected = sorted((u for u in users if u.age >= 22), key=lambda u: (-u.age, u.id))
+    page = User.filter(age__gte=22).order_by('-age').limit(5).offset(2).all()
+    assert [user.id for user in page] == [user.id for user in expected[2:7]]
+    assert User.filter(age__gte=22).count() == len(expected)
+
+def test_email_unique_across_shards(sharded_db):
+    users = _create(20)
+    first = users[0]
+    other = next(u for u in users if sharded_db.shard_index(u.id) != sharded_db.shard_index(first.id))
+    assert not User(name="Dup", email="u0@example.com", age=None).save()
+    old_email = other.email
+    other.email = "u0@example.com"
+    assert not other.save()
+    assert User.get_by_id(other.id).email == old_email
+
+    # После удаления email снова свободен
+    assert first.delete()
+    assert User(name="New", email="u0@example.com", age=None).save()
+
+def test_failed_shard_update_restores_directory(sharded_db):
+    user, = _create(1)
+    user.email = "new@example.com"
+    user.name = "x" * 101
+    assert not user.save()
+    assert sharded_db.lookup_email("u0@example.com") == user.id
+    assert sharded_db.lookup_email("new@example.com") is None
+
+def test_failed_shard_is_not_skipped(sharded_db, shard_databases, monkeypatch, capsys):
+    import db_config
+
+    _create(4)
+    # Второй "шард" - служебная база postgres, в ней нет таблицы users
+    broken = dict(shard_databases, shards=[shard_databases['shards'][0], 'postgres'])
+    shard_map = ShardMap(broken)
+    with pytest.raises(psycopg2.Error):
+        fetch_all_users(shard_map, "SELECT id FROM users ORDER BY id")
+    with pytest.raises(psycopg2.Error):
+        gather_stats(shard_map)
+
+    monkeypatch.setattr(db_config, "DB_CONFIG", broken)
+    assert User.get_all() == []
+
+def test_directory_outage_is_not_reported_as_duplicate(sharded_db, shard_databases, monkeypatch, capsys):
+    import db_config
+
+    config = dict(shard_databases, shard_directory=f"{shard_databases['shard_directory']}_missing")
+    monkeypatch.setattr(db_config, "DB_CONFIG", config)
+    with pytest.raises(ConnectionError):
+        ShardMap(config).reserve_email("new@example.com")
+    assert not User(name="New", email="new@example.com", age=None).save()
+    output = capsys.readouterr().out
+    assert "Справочник email недоступен" in output and "уже существует" not in output
+
+def test_rebuild_email_index_adds_existing_users(sharded_db):
+    # Пользователи, записанные в шарды до появления справочника
+    placed = {}
+    for user_id in range(1, 9):
+        placed.setdefault(sharded_db.shard_index(user_id), []).append(user_id)
+    misplaced = placed[0][0]
+    for index, config in enumerate(sharded_db.shards):
+        ids = [user_id for user_id in placed.get(index, []) if user_id != misplaced]
+        if index == 1:
+            ids.append(misplaced)
+        db = Database(config=config)
+        assert db.connect()
+        try:
+            for user_id in ids:
+                assert db.execute_query(
+                    "INSERT INTO users (id, name, email, age) VALUES (%s, 'Старый', %s, 30)",
+                    (user_id, f"old{user_id}@example.com")
+                )
+        finally:
+            db.disconnect()
+
+    stats = rebuild_email_index(sharded_db)
+    assert stats == {'added': 8, 'conflicts': 0, 'misplaced': 1}
+    assert sharded_db.lookup_email("old5@example.com") == 5
+    assert not User(name="Дубль", email="old5@example.com", age=None).save()
+
+    user = User(name="Новый", email="new@example.com", age=None)
+    assert user.save() and user.id > 8
+    # Повторный запуск ничего не добавляет
+    assert rebuild_email_index(sharded_db) == {'added': 0, 'conflicts': 0, 'misplaced': 1}
+
+def test_single_database_tools_refuse_shards(sharded_db, tmp_path):
+    import io
+
+    from batch import run_batch
+    from export import export_incremental, export_parallel
+    from seed import seed_users
+    from user_cache import UserCache
+
+    assert not run_batch(['{"op": "stats"}'], out=io.StringIO())
+    assert not seed_users(10, workers=1)
+    assert export_incremental('test', io.StringIO()) == -1
+    assert export_parallel(str(tmp_path / 'export'), workers=1) is None
+    with pytest.raises(ValueError):
+        UserCache(str(tmp_path / "cache.db"))
+    assert not _shard_ids(sharded_db.shards[0]) and not _shard_ids(sharded_db.shards[1])
+
+def test_email_filter_reads_directory(sharded_db):
+    from bloom import EmailFilter
+
+    users = _create(10)
+    email_filter = EmailFilter.build()
+    assert all(user.email in email_filter.bloom for user in users)
+    assert email_filter.exists("u3@example.com")
+    assert not email_filter.exists("missing@example.com")
+
+def test_watch_listens_on_every_shard(sharded_db):
+    import threading
+    import time
+
+    events = []
+    watcher = threading.Thread(target=lambda: events.extend(User.watch(coalesce=0.05, idle_timeout=1)))
+    watcher.start()
+    admin = Database(config=sharded_db.directory)
+    assert admin.connect()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            listening = admin.fetch_one(
+                "SELECT COUNT(*) FROM pg_stat_activity WHERE query = 'LISTEN user_changes'"
+            )[0]
+            admin.connection.commit()
+            if listening >= len(sharded_db.shards):
+                break
+            time.sleep(0.01)
+    finally:
+        admin.disconnect()
+
+    users = _create(6)
+    watcher.join()
+
+    shards = [config['database'] for config in sharded_db.shards]
+    assert sorted((event['id'], event['shard']) for event in events if event['table'] == 'users') == \
+        sorted((user.id, shards[sharded_db.shard_index(user.id)]) for user in users)
+    assert len({event['shard'] for event in events}) == 2
+
+def test_init_applies_directory_migration_only_to_directory(test_database, monkeypatch):
+    import db_config
+    from conftest import _admin_connect
+    from sharding import init_shards
+
+    names = [f"{test_database['database']}_init_{suffix}" for suffix in ('0', '1', 'directory')]
+    config = dict(test_database, shards=names[:2], shard_directory=names[2])
+    monkeypatch.setattr(db_config, "DB_CONFIG", config)
+
+    def tables(name):
+        db = Database(config=dict(test_database, database=name))
+        assert db.connect()
+        try:
+            return db.fetch_one(
+                "SELECT to_regclass('users') IS NOT NULL, to_regclass('user_email_index') IS NOT NULL"
+            )
+        finally:
+            db.disconnect()
+
+    try:
+        assert init_shards()
+        assert [tables(name) for name in names] == [(True, False), (True, False), (False, True)]
+    finally:
+        admin = _admin_connect(test_database)
+        with admin.cursor() as cursor:
+            for name in names:
+                cursor.execute(f"DROP DATABASE IF EXISTS {name}")
+        admin.close()
@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from user_cache import UserCache
+
+def test_lookups_are_served_locally(tmp_path):
+    cache = UserCache(str(tmp_path / "cache.db"), max_staleness=None)
+    cache.connection.execute(
+        "INSERT INTO users (id, name, email, age, created_at) VALUES (1, 'Тест', 'a@example.com', 30, NULL)"
+    )
+    assert cache.get_by_id(1).email == "a@example.com"
+    assert cache.get_by_email("a@example.com").id == 1
+    assert cache.get_by_email("missing@example.com") is None
+    assert cache.age is None
+    cache.close()
+
+def test_concurrent_lookups(tmp_path):
+    cache = UserCache(str(tmp_path / "cache.db"), max_staleness=None)
+    cache.connection.executemany(
+        "INSERT INTO users (id, name, email, age, created_at) VALUES (?, 'Тест', ?, 30, NULL)",
+        [(i, f"u{i}@example.com") for i in range(1, 51)]
+    )
+    errors = []
+
+    def worker():
+        try:
+            for i in range(1, 51):
+                assert cache.get_by_id(i).email == f"u{i}@example.com"
+                assert cache.get_by_email(f"u{i}@example.com").id == i
+                assert len(cache) == 50
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.close()
+    assert errors == []
+
+def test_initial_watermark(tmp_path):
+    cache = UserCache(str(tmp_path / "cache.db"))
+    assert cache.watermark['last_id'] == 0
+    cache.close()
+
+def test_sync_applies_database_changes(committed_db, tmp_path):
+    for name, email in (('Первый', 'one@example.com'), ('Второй', 'two@example.com'),
+                        ('Третий', 'three@example.com')):
+        committed_db.execute_query(
+            "INSERT INTO users (name, email, age) VALUES (%s, %s, 30)", (name, email)
+        )
+    ids = {email: user_id for user_id, email in committed_db.fetch_all("SELECT id, email FROM users")}
+
+    cache = UserCache(str(tmp_path / "cache.db"), max_staleness=None)
+    try:
+        assert cache.sync() == 3
+        assert cache.get_by_email('two@example.com').id == ids['two@example.com']
+
+        committed_db.execute_query(
+            "UPDATE users SET email = 'second@example.com', age = 31 WHERE id = %s",
+            (ids['two@example.com'],)
+        )
+        committed_db.execute_query("DELETE FROM users WHERE id = %s", (ids['three@example.com'],))
+        assert cache.sync() == 2
+
+        updated = cache.get_by_id(ids['two@example.com'])
+        assert (updated.email, updated.age) == ('second@example.com', 31)
+        assert cache.get_by_email('two@example.com') is None
+        assert cache.get_by_id(ids['three@example.com']) is None
+        assert [user.id for user in cache.get_all()] == [ids['one@example.com'], ids['two@example.com']]
+        assert cache.sync() == 0
+    finally:
+        cache.close()
+
+def test_failed_sync_is_not_retried_on_every_lookup(tmp_path, monkeypatch):
+    attempts = []
+    monkeypatch.setattr(UserCache, '_sync', lambda self: attempts.append(1) or -1)
+    cache = UserCache(str(tmp_path / "cache.db"), max_staleness=0, retry_interval=60)
+    try:
+        for _ in range(5):
+            assert cache.get_by_id(1) is None
+        assert len(attempts) == 1
+
+        cache._failed_at -= 60
+        cache.get_by_id(1)
+        assert len(attempts) == 2
+    finally:
+        cache.close()
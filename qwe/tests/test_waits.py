@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from waits import WaitSampler, normalize_query, wait_label
+
+class FakeDatabase:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetch_all(self, query, params=None):
+        return self.rows
+
+def test_normalize_query():
+    assert normalize_query("SELECT * FROM users WHERE id = 42 AND email = 'a@b.c'") == \
+        "SELECT * FROM users WHERE id = ? AND email = ?"
+    assert normalize_query("DELETE FROM users WHERE id IN (1, 2, 3)") == \
+        "DELETE FROM users WHERE id IN (?, ...)"
+
+def test_wait_label():
+    assert wait_label('active', None, None) == 'CPU'
+    assert wait_label('active', 'Lock', 'transactionid') == 'Lock:transactionid'
+
+def test_sample_builds_profile_and_blocking_graph():
+    sampler = WaitSampler()
+    sampler.sample(FakeDatabase([
+        (1, 'idle in transaction', 'Client', 'ClientRead', "UPDATE users SET age = 1 WHERE id = 7", [], 5, None),
+        (2, 'active', 'Lock', 'transactionid', "UPDATE users SET age = 2 WHERE id = 7", [1], 3, 'transactionid  ShareLock'),
+    ]))
+    update = "UPDATE users SET age = ? WHERE id = ?"
+    assert sampler.profile[(update, 'Lock:transactionid')] == 1
+    assert sampler.blocking[(update, update, 'transactionid  ShareLock')] == 1
+    assert sampler.top_queries()[0][1] == 2
+    assert "Lock;transactionid 1" in "\n".join(sampler.collapsed())
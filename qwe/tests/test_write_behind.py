@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from models import User
+from write_behind import WriteBehindBuffer
+
+@pytest.fixture
+def buffer(monkeypatch):
+    errors = []
+    buffer = WriteBehindBuffer(max_size=100, flush_interval=None,
+                               on_error=lambda users, error: errors.append((users, error)))
+    buffer.errors = errors
+    monkeypatch.setattr(User, "write_buffer", buffer)
+    return buffer
+
+def test_saves_are_coalesced_until_flush(db, buffer):
+    user = User(name="Тест", email="wb@example.com", age=20)
+    user.save()
+    assert buffer.flush() == 1 and user.id is not None
+
+    for age in (21, 22, 23):
+        user.age = age
+        assert user.save()
+    assert len(buffer) == 1 and buffer.stats['coalesced'] == 2
+    assert db.fetch_one("SELECT age FROM users WHERE id = %s", (user.id,)) == (20,)
+
+    assert buffer.flush() == 1
+    assert db.fetch_one("SELECT age FROM users WHERE id = %s", (user.id,)) == (23,)
+
+def test_size_trigger_flushes(db, buffer):
+    buffer.max_size = 2
+    users = [User(name="A", email=f"wb{i}@example.com", age=20) for i in range(2)]
+    for user in users:
+        user.save()
+    assert len(buffer) == 0 and all(user.id is not None for user in users)
+
+def test_failed_row_does_not_block_batch(db, buffer):
+    User(name="A", email="taken@example.com", age=1).save()
+    buffer.flush()
+    ok = User(name="B", email="free@example.com", age=2)
+    dup = User(name="C", email="taken@example.com", age=3)
+    ok.save()
+    dup.save()
+    assert buffer.flush() == 1
+    assert ok.id is not None and dup.id is None
+    assert [users for users, _ in buffer.errors] == [[dup]]
+
+def test_save_during_flush_is_not_inserted_twice(db, buffer):
+    user = User(name="Тест", email="inflight@example.com", age=20)
+    user.save()
+
+    write = buffer._write
+    def write_and_save_again(entries, config=None):
+        # Повторное сохранение, пока вставка еще не вернула ID
+        user.age = 21
+        user.save()
+        return write(entries, config)
+    buffer._write = write_and_save_again
+    assert buffer.flush() == 1
+    buffer._write = write
+
+    assert list(buffer._pending) == [user.id]
+    assert buffer.flush() == 1 and buffer.errors == []
+    assert db.fetch_all("SELECT age FROM users WHERE email = 'inflight@example.com'") == [(21,)]
@@ -0,0 +1,305 @@
+"""
+Локальный кэш справочника пользователей
+
+Копия таблицы users хранится в файле SQLite рядом с приложением и
+отображается в память (PRAGMA mmap_size), поэтому при запуске утилиты
+не нужно ничего загружать из PostgreSQL: поиск по ID и email сразу
+обслуживается локально по индексам файла.
+
+Обновление - дельта-синхронизация через IncrementalExporter: из базы
+читаются только строки, изменившиеся после водяного знака кэша, и
+удаления из users_tombstones (миграция 007). Водяной знак хранится в
+самом файле кэша и сохраняется в одной транзакции с изменениями.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from database import Database
+from export import INITIAL_WATERMARK, IncrementalExporter
+from models import User
+from sharding import unsupported_with_shards
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'user_cache.db')
+
+# Допустимый возраст данных кэша по умолчанию (секунды)
+DEFAULT_MAX_STALENESS = 60
+
+# Пауза перед повторной синхронизацией после неудачной (секунды)
+DEFAULT_RETRY_INTERVAL = 10
+
+# Размер отображаемой в память части файла
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Имя потребителя в IncrementalExporter (водяной знак хранится локально)
+CACHE_CONSUMER = 'local_user_cache'
+
+class UserCache:
+    """
+    Локальный снимок пользователей с поиском по ID и email
+
+    Перед каждым поиском проверяется возраст данных: если последняя
+    синхронизация была раньше max_staleness секунд назад, кэш
+    дозапрашивает изменения. Синхронизацию выполняет один поток, остальные
+    в это время отвечают по имеющимся данным. Если база недоступна, ответ
+    дается по устаревшим данным, а следующая попытка синхронизации - не
+    раньше чем через retry_interval секунд.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_staleness=DEFAULT_MAX_STALENESS, batch_size=1000,
+                 retry_interval=DEFAULT_RETRY_INTERVAL):
+        """
+        Args:
+            path (str): Путь к файлу кэша
+            max_staleness (float): Допустимый возраст данных в секундах
+                (None - не синхронизировать автоматически)
+            batch_size (int): Размер порции чтения изменений из базы
+            retry_interval (float): Пауза перед повтором после неудачной синхронизации
+
+        Raises:
+            ValueError: Настроено шардирование (синхронизация идет из одной базы)
+        """
+        error = unsupported_with_shards("Локальный кэш пользователей")
+        if error:
+            raise ValueError(error)
+        self.path = path
+        self.max_staleness = max_staleness
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        # Одно подключение SQLite используется из разных потоков (пул потоков
+        # api.py), поэтому обращения к нему выполняются по одному; блокировка
+        # повторно входимая: запись изменений и meta идет под одной блокировкой
+        self._lock = threading.RLock()
+        # Синхронизации выполняются по одному; чтение из PostgreSQL идет без
+        # блокировки подключения, поиск в это время не ждет
+        self._sync_lock = threading.Lock()
+        # Время неудачной синхронизации (time.monotonic()) или None
+        self._failed_at = None
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY,
+                name TEXT,
+                email TEXT,
+                age INTEGER,
+                created_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_users_email ON users(email);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self.connection.commit()
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+    def _query(self, sql, params=(), fetch='one'):
+        """Запрос к файлу кэша под блокировкой подключения"""
+        with self._lock:
+            cursor = self.connection.execute(sql, params)
+            return cursor.fetchone() if fetch == 'one' else cursor.fetchall()
+
+    def _meta(self, key):
+        row = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return json.loads(row[0]) if row else None
+
+    def _set_meta(self, key, value):
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value))
+            )
+
+    @property
+    def watermark(self):
+        """Водяной знак последней синхронизации"""
+        stored = self._meta('watermark')
+        if not stored:
+            return dict(INITIAL_WATERMARK)
+        return {
+            'updated_at': datetime.fromisoformat(stored['updated_at']),
+            'last_id': stored['last_id'],
+            'deleted_at': datetime.fromisoformat(stored['deleted_at']),
+            'deleted_id': stored['deleted_id'],
+        }
+
+    @property
+    def synced_at(self):
+        """Время последней успешной синхронизации (time.time()) или None"""
+        return self._meta('synced_at')
+
+    @property
+    def age(self):
+        """Возраст данных кэша в секундах (None, если кэш не синхронизирован)"""
+        synced_at = self.synced_at
+        return time.time() - synced_at if synced_at is not None else None
+
+    def sync(self):
+        """
+        Дозапрос изменений из базы после водяного знака кэша
+
+        Returns:
+            int: Количество примененных изменений или -1 при ошибке
+        """
+        with self._sync_lock:
+            return self._try_sync()
+
+    def _try_sync(self):
+        """Синхронизация с учетом неудачной попытки (под _sync_lock)"""
+        count = self._sync()
+        self._failed_at = time.monotonic() if count < 0 else None
+        return count
+
+    def _sync(self):
+        exporter = IncrementalExporter(CACHE_CONSUMER, self.batch_size)
+        if not exporter.connect():
+            return -1
+
+        count = 0
+        try:
+            for change in exporter.changes(self.watermark):
+                with self._lock:
+                    if change['op'] == 'upsert':
+                        user = change['user']
+                        created_at = user['created_at']
+                        self.connection.execute(
+                            "INSERT OR REPLACE INTO users (id, name, email, age, created_at) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (user['id'], user['name'], user['email'], user['age'],
+                             created_at.isoformat() if created_at else None)
+                        )
+                    else:
+                        self.connection.execute("DELETE FROM users WHERE id = ?", (change['id'],))
+                count += 1
+
+            watermark = exporter.watermark
+            with self._lock:
+                self._set_meta('watermark', {
+                    'updated_at': watermark['updated_at'].isoformat(),
+                    'last_id': watermark['last_id'],
+                    'deleted_at': watermark['deleted_at'].isoformat(),
+                    'deleted_id': watermark['deleted_id'],
+                })
+                self._set_meta('synced_at', time.time())
+                # Изменения и водяной знак фиксируются вместе
+                self.connection.commit()
+        except Exception as e:
+            with self._lock:
+                self.connection.rollback()
+            print(f"❌ Ошибка синхронизации кэша: {e}")
+            return -1
+        finally:
+            exporter.disconnect()
+
+        return count
+
+    def _needs_sync(self):
+        age = self.age
+        if age is not None and age <= self.max_staleness:
+            return False
+        # После неудачной попытки база не опрашивается retry_interval секунд,
+        # иначе каждый поиск ждал бы таймаута подключения
+        return self._failed_at is None or time.monotonic() - self._failed_at >= self.retry_interval
+
+    def _ensure_fresh(self):
+        if self.max_staleness is None or not self._needs_sync():
+            return
+        # Пока другой поток синхронизирует кэш, поиск отвечает по имеющимся
+        # данным; ждать приходится, только если кэш еще ни разу не заполнен
+        if not self._sync_lock.acquire(blocking=self.synced_at is None):
+            return
+        try:
+            if self._needs_sync():
+                age = self.age
+                if self._try_sync() < 0 and age is not None:
+                    print(f"⚠️ База недоступна, данные кэша устарели на {age:.0f} с")
+        finally:
+            self._sync_lock.release()
+
+    def _user(self, row):
+        if row is None:
+            return None
+        created_at = datetime.fromisoformat(row[4]) if row[4] else None
+        return User(name=row[1], email=row[2], age=row[3], id=row[0], created_at=created_at)
+
+    def get_by_id(self, user_id):
+        """
+        Поиск пользователя по ID в локальном кэше
+
+        Returns:
+            User: Объект пользователя или None если не найден
+        """
+        self._ensure_fresh()
+        return self._user(self._query(
+            "SELECT id, name, email, age, created_at FROM users WHERE id = ?", (user_id,)
+        ))
+
+    def get_by_email(self, email):
+        """
+        Поиск пользователя по email в локальном кэше
+
+        Returns:
+            User: Объект пользователя или None если не найден
+        """
+        self._ensure_fresh()
+        return self._user(self._query(
+            "SELECT id, name, email, age, created_at FROM users WHERE email = ?", (email,)
+        ))
+
+    def get_all(self):
+        """
+        Все пользователи из локального кэша
+
+        Returns:
+            list: Список объектов User в порядке ID
+        """
+        self._ensure_fresh()
+        rows = self._query("SELECT id, name, email, age, created_at FROM users ORDER BY id", fetch='all')
+        return [self._user(row) for row in rows]
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM users")[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный кэш справочника пользователей")
+    parser.add_argument('command', choices=['sync', 'status', 'rebuild'],
+                        help="sync - дозапросить изменения, status - состояние кэша, "
+                             "rebuild - удалить кэш и загрузить заново")
+    parser.add_argument('--path', default=DEFAULT_CACHE_PATH, help="файл кэша")
+    args = parser.parse_args()
+    Database.verbose = False
+
+    if args.command == 'rebuild':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+
+    try:
+        cache = UserCache(args.path, max_staleness=None)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    try:
+        if args.command in ('sync', 'rebuild'):
+            count = cache.sync()
+            if count >= 0:
+                print(f"✅ Применено изменений: {count}, пользователей в кэше: {len(cache)}")
+        else:
+            age = cache.age
+            print(f"📊 Кэш: {args.path}")
+            print(f"   Пользователей: {len(cache)}")
+            print(f"   Последняя синхронизация: "
+                  f"{f'{age:.0f} с назад' if age is not None else 'не выполнялась'}")
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
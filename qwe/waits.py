@@ -0,0 +1,227 @@
+"""
+Сэмплер ожиданий и блокировок
+
+Периодически снимает pg_stat_activity (события ожидания активных сеансов)
+и граф блокировок (pg_blocking_pids, pg_locks) и накапливает профиль:
+сколько замеров каждый запрос провел на CPU или в каждом ожидании, и кто
+кого блокировал. Запросы нормализуются (литералы заменяются на ?), поэтому
+одинаковые по форме запросы попадают в одну строку профиля.
+
+Профиль выводится в виде сводки или в "свернутом" формате
+(query;wait_type;wait_event count), который принимает flamegraph.pl.
+"""
+import argparse
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from database import Database
+
+DEFAULT_INTERVAL = 0.1
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+def normalize_query(query, max_length=200):
+    """
+    Приведение запроса к форме без литералов
+
+    Returns:
+        str: Запрос с ? вместо строк и чисел и схлопнутыми пробелами
+    """
+    if not query:
+        return '<нет запроса>'
+    query = _STRING_RE.sub('?', query)
+    query = _NUMBER_RE.sub('?', query)
+    query = _LIST_RE.sub('(?, ...)', query)
+    query = _SPACE_RE.sub(' ', query).strip()
+    return query[:max_length]
+
+def wait_label(state, wait_event_type, wait_event):
+    """Название ожидания для профиля ('CPU' для работающего сеанса)"""
+    if wait_event_type:
+        return f"{wait_event_type}:{wait_event}"
+    if state == 'active':
+        return 'CPU'
+    return state or 'unknown'
+
+class WaitSampler:
+    """
+    Накопление профиля ожиданий по периодическим замерам
+
+    Использование из кода:
+        sampler = WaitSampler(interval=0.1)
+        sampler.start()
+        ...  # нагрузка
+        sampler.stop()
+        sampler.print_report()
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL, config=None):
+        """
+        Args:
+            interval (float): Период между замерами в секундах
+            config (dict, optional): Конфигурация подключения
+        """
+        self.interval = interval
+        self.config = config
+        self.samples = 0
+        # (запрос, ожидание) -> количество замеров
+        self.profile = Counter()
+        # (блокирующий запрос, ожидающий запрос, объект блокировки) -> количество замеров
+        self.blocking = Counter()
+        self.max_wait = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self, db):
+        """Один замер активных сеансов и блокировок текущей базы"""
+        rows = db.fetch_all("""
+            SELECT a.pid, a.state, a.wait_event_type, a.wait_event, a.query,
+                   pg_blocking_pids(a.pid),
+                   EXTRACT(EPOCH FROM now() - a.query_start),
+                   (SELECT string_agg(DISTINCT l.locktype || ' ' ||
+                           COALESCE(l.relation::regclass::text, '') || ' ' || l.mode, ', ')
+                    FROM pg_locks l WHERE l.pid = a.pid AND NOT l.granted)
+            FROM pg_stat_activity a
+            WHERE a.datname = current_database()
+              AND a.pid <> pg_backend_pid()
+              AND a.backend_type = 'client backend'
+              AND a.state IS DISTINCT FROM 'idle'
+        """)
+        queries = {row[0]: normalize_query(row[4]) for row in rows}
+
+        with self._lock:
+            self.samples += 1
+            for pid, state, wait_type, wait_event, _, blockers, waited, lock in rows:
+                query = queries[pid]
+                label = wait_label(state, wait_type, wait_event)
+                self.profile[(query, label)] += 1
+                if wait_type and waited is not None:
+                    self.max_wait[query] = max(self.max_wait.get(query, 0), float(waited))
+                for blocker in blockers or []:
+                    # Блокирующий сеанс может простаивать в транзакции (idle in transaction)
+                    blocker_query = queries.get(blocker, f'<pid {blocker}: простаивает в транзакции>')
+                    self.blocking[(blocker_query, query, (lock or '').strip())] += 1
+        return len(rows)
+
+    def run(self, duration=None):
+        """
+        Сбор замеров в текущем потоке
+
+        Args:
+            duration (float, optional): Длительность в секундах (None - до stop())
+        """
+        db = Database('diagnostics', config=self.config)
+        if not db.connect():
+            return False
+        deadline = time.monotonic() + duration if duration else None
+        try:
+            while not self._stop.is_set():
+                self.sample(db)
+                # Замер не должен удерживать снимок статистики между итерациями
+                db.connection.rollback()
+                if deadline and time.monotonic() >= deadline:
+                    break
+                self._stop.wait(self.interval)
+        finally:
+            db.disconnect()
+        return True
+
+    def start(self):
+        """Запуск сбора замеров в фоновом потоке"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='wait-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Остановка фонового сбора"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def collapsed(self):
+        """
+        Профиль в свернутом формате для flamegraph.pl
+
+        Returns:
+            list: Строки 'запрос;тип;событие количество'
+        """
+        with self._lock:
+            items = sorted(self.profile.items(), key=lambda item: -item[1])
+        return [f"{query.replace(';', ',')};{label.replace(':', ';')} {count}"
+                for (query, label), count in items]
+
+    def top_queries(self, top=10):
+        """
+        Запросы с наибольшим количеством замеров
+
+        Returns:
+            list: (запрос, всего замеров, [(ожидание, замеров), ...])
+        """
+        with self._lock:
+            totals = Counter()
+            waits = {}
+            for (query, label), count in self.profile.items():
+                totals[query] += count
+                waits.setdefault(query, Counter())[label] += count
+        return [(query, total, waits[query].most_common()) for query, total in totals.most_common(top)]
+
+    def print_report(self, top=10, out=sys.stdout):
+        """Сводка: профиль ожиданий по запросам и цепочки блокировок"""
+        print(f"📊 Замеров: {self.samples}, период {self.interval} с", file=out)
+        print("-" * 50, file=out)
+        queries = self.top_queries(top)
+        if not queries:
+            print("   Активных запросов не обнаружено", file=out)
+        for query, total, waits in queries:
+            print(f"{total:>6}  {query}", file=out)
+            for label, count in waits:
+                bar = '█' * max(1, round(20 * count / total))
+                print(f"        {bar:<20} {count / total:>4.0%} {label}", file=out)
+            if query in self.max_wait:
+                print(f"        максимальное ожидание: {self.max_wait[query]:.2f} с", file=out)
+
+        print("\n🔒 Блокировки (блокирующий → ожидающий):", file=out)
+        print("-" * 50, file=out)
+        with self._lock:
+            chains = self.blocking.most_common(top)
+        if not chains:
+            print("   Нет", file=out)
+        for (blocker, waiter, lock), count in chains:
+            print(f"{count:>6}  {blocker}", file=out)
+            print(f"        → {waiter}" + (f" [{lock}]" if lock else ""), file=out)
+
+def main():
+    parser = argparse.ArgumentParser(description="Профиль ожиданий и блокировок PostgreSQL")
+    parser.add_argument('--duration', type=float, default=30, help="длительность сбора в секундах")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f"период замеров в секундах (по умолчанию {DEFAULT_INTERVAL})")
+    parser.add_argument('--top', type=int, default=10, help="количество запросов в отчете")
+    parser.add_argument('--collapsed', help="файл для профиля в формате flamegraph.pl")
+    args = parser.parse_args()
+    Database.verbose = False
+
+    sampler = WaitSampler(args.interval)
+    print(f"🔄 Сбор замеров {args.duration:.0f} с (Ctrl+C - остановить)...")
+    try:
+        if not sampler.run(args.duration):
+            sys.exit(1)
+    except KeyboardInterrupt:
+        print()
+
+    sampler.print_report(args.top)
+    if args.collapsed:
+        with open(args.collapsed, 'w', encoding='utf-8') as f:
+            f.write("\n".join(sampler.collapsed()) + "\n")
+        print(f"\n✅ Свернутый профиль сохранен в {args.collapsed}")
+
+if __name__ == "__main__":
+    main()
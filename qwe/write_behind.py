@@ -0,0 +1,267 @@
+"""
+Отложенная запись (write-behind) для User.save
+
+Частые изменения одних и тех же пользователей (например, переключение
+статуса) при обычном save() стоят отдельного запроса и COMMIT каждое.
+В режиме отложенной записи save() только запоминает состояние объекта в
+памяти; несколько сохранений одного пользователя до сброса схлопываются
+в одно (записывается последнее). Буфер сбрасывается в базу
+многострочными UPDATE и INSERT в одной транзакции:
+- по размеру - когда в буфере max_size пользователей (сброс выполняет
+  вызвавший save() поток, это ограничивает рост буфера);
+- по времени - фоновым потоком каждые flush_interval секунд;
+- явно - вызовом flush();
+- при завершении процесса (atexit) и в close().
+
+Ошибки сброса передаются в обработчик on_error(users, error); пользователи,
+которых не удалось записать, из буфера удаляются - обработчик может
+повторить для них save().
+"""
+import atexit
+import copy
+import threading
+import time
+from collections import Counter
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from database import Database, QueryTimeoutError, record_timeout
+from sharding import get_shard_map
+
+DEFAULT_MAX_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+def print_error(users, error):
+    """Обработчик ошибок по умолчанию"""
+    print(f"❌ Отложенная запись: не сохранено пользователей: {len(users)}: {error}")
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенных сохранений пользователей
+
+    Использование из кода:
+        User.enable_write_behind(max_size=1000, flush_interval=0.5)
+        user.status_flag = ...
+        user.save()          # возвращает сразу, запись - при сбросе
+        User.flush()         # явный сброс (например, перед чтением)
+        User.disable_write_behind()
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 on_error=print_error, timeout=None):
+        """
+        Args:
+            max_size (int): Количество пользователей в буфере, при котором он сбрасывается
+            flush_interval (float): Период фонового сброса в секундах (None - без потока)
+            on_error (callable): Обработчик ошибок on_error(users, error)
+            timeout (float, optional): Бюджет задержки одного сброса в секундах
+        """
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.on_error = on_error
+        self.timeout = timeout
+        # ID пользователя (или id() нового объекта) -> (объект, (name, email, age))
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Сбросы выполняются по одному, новые save() в это время идут в новый буфер
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = Counter()
+
+    def start(self):
+        """Запуск фонового сброса и регистрация сброса при завершении процесса"""
+        if self.flush_interval and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='write-behind', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def _loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Ошибка фонового сброса: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def add(self, user):
+        """
+        Постановка сохранения пользователя в буфер
+
+        Returns:
+            bool: Всегда True; результат записи сообщается через on_error
+        """
+        key = user.id if user.id is not None else ('new', id(user))
+        with self._lock:
+            if key in self._pending:
+                self.stats['coalesced'] += 1
+            self._pending[key] = (user, (user.name, user.email, user.age))
+            self.stats['saves'] += 1
+            full = len(self._pending) >= self.max_size
+        if full:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        Запись всех накопленных сохранений
+
+        Returns:
+            int: Количество записанных пользователей
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            shard_map = get_shard_map()
+            if shard_map is None:
+                written, failed = self._write(list(pending.values()))
+            else:
+                written, failed = self._write_sharded(shard_map, list(pending.values()))
+
+            with self._lock:
+                # Новый объект, сохраненный повторно во время сброса, попал в
+                # новый буфер под временным ключом; после вставки у него есть ID,
+                # и повторное сохранение - это UPDATE, а не вторая вставка
+                for key, (user, _) in pending.items():
+                    if isinstance(key, tuple) and user.id is not None and key in self._pending:
+                        entry = self._pending.pop(key)
+                        # Сохранение, сделанное уже с ID, новее
+                        self._pending.setdefault(user.id, entry)
+
+            self.stats['flushes'] += 1
+            self.stats['written'] += written
+            for error, users in failed.items():
+                self.stats['failed'] += len(users)
+                self.on_error(users, error)
+            return written
+
+    def _write(self, entries, config=None):
+        """
+        Запись группы в одну базу одной транзакцией
+
+        Returns:
+            tuple: (количество записанных, {ошибка: [пользователи]})
+        """
+        db = Database('save_batch', self.timeout, config=config)
+        if not db.connect():
+            return 0, {"База данных недоступна": [user for user, _ in entries]}
+
+        failed = {}
+        try:
+            db.cursor.execute("SAVEPOINT write_behind")
+            started = time.perf_counter()
+            try:
+                missing = self._apply(db.cursor, entries)
+                db.cursor.execute("RELEASE SAVEPOINT write_behind")
+            except psycopg2.errors.QueryCanceled:
+                # Бюджет сброса исчерпан - построчный повтор не уложится тоже;
+                # более ранняя отмена (pg_cancel_backend) превышением не считается
+                if db.timeout and time.perf_counter() - started >= db.timeout:
+                    record_timeout('save_batch')
+                raise
+            except Exception:
+                # Одна ошибочная строка (например, занятый email) не должна
+                # отменять остальные: повторяем группу построчно
+                db.cursor.execute("ROLLBACK TO SAVEPOINT write_behind")
+                missing = []
+                for entry in entries:
+                    db.cursor.execute("SAVEPOINT write_behind")
+                    try:
+                        missing += self._apply(db.cursor, [entry])
+                        db.cursor.execute("RELEASE SAVEPOINT write_behind")
+                    except Exception as e:
+                        db.cursor.execute("ROLLBACK TO SAVEPOINT write_behind")
+                        failed.setdefault(str(e).strip(), []).append(entry[0])
+            db.connection.commit()
+        except Exception as e:
+            db.connection.rollback()
+            return 0, {str(e).strip(): [user for user, _ in entries]}
+        finally:
+            db.disconnect()
+
+        for user in missing:
+            failed.setdefault(f"Пользователь с ID {user.id} не найден", []).append(user)
+        return len(entries) - sum(len(users) for users in failed.values()), failed
+
+    @staticmethod
+    def _apply(cursor, entries):
+        """
+        Многострочные UPDATE и INSERT для группы
+
+        Returns:
+            list: Пользователи, которых нет в базе (UPDATE не нашел строку)
+        """
+        updates = [(user, values) for user, values in entries if user.id is not None]
+        inserts = [(user, values) for user, values in entries if user.id is None]
+
+        missing = []
+        if updates:
+            updated = execute_values(
+                cursor,
+                """
+                UPDATE users AS u SET name = v.name, email = v.email, age = v.age
+                FROM (VALUES %s) AS v (id, name, email, age)
+                WHERE u.id = v.id
+                RETURNING u.id
+                """,
+                [(user.id, *values) for user, values in updates],
+                template="(%s::integer, %s::text, %s::text, %s::integer)",
+                page_size=len(updates),
+                fetch=True
+            )
+            found = {row[0] for row in updated}
+            missing = [user for user, _ in updates if user.id not in found]
+
+        if inserts:
+            created = execute_values(
+                cursor,
+                "INSERT INTO users (name, email, age) VALUES %s RETURNING id, email",
+                [values for _, values in inserts],
+                page_size=len(inserts),
+                fetch=True
+            )
+            ids = {email: user_id for user_id, email in created}
+            for user, (_, email, _) in inserts:
+                user.id = ids.get(email)
+        return missing
+
+    def _write_sharded(self, shard_map, entries):
+        """
+        Запись при шардировании
+
+        Новый пользователь и смена email требуют обращения к справочнику
+        email -> ID, поэтому каждый пользователь сохраняется отдельно
+        (схлопывание повторных сохранений при этом сохраняется).
+        """
+        written, failed = 0, {}
+        for user, (name, email, age) in entries:
+            snapshot = copy.copy(user)
+            snapshot.name, snapshot.email, snapshot.age = name, email, age
+            try:
+                if snapshot._save_sharded(shard_map, self.timeout):
+                    user.id = snapshot.id
+                    written += 1
+                    continue
+                error = "Ошибка сохранения"
+            except QueryTimeoutError as e:
+                error = str(e)
+            failed.setdefault(error, []).append(user)
+        return written, failed
+
+    def close(self):
+        """Остановка фонового сброса и запись оставшихся сохранений"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        atexit.unregister(self.close)
+        self.flush()